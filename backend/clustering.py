@@ -0,0 +1,74 @@
+import numpy as np
+
+# Working memory for one similarity tile and its edges
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+
+def tile_size(memory_bytes):
+    """Side of the largest square tile that fits the memory budget.
+
+    Per cell: the float32 score, the boolean mask and, in the worst case
+    where every pair is above the threshold, two int64 edge endpoints.
+    """
+    return max(1, int(np.sqrt(memory_bytes / (4 + 1 + 16))))
+
+def find_roots(parent, nodes):
+    """Root of each node in the union-find forest, vectorized"""
+    roots = parent[nodes]
+    while True:
+        next_roots = parent[roots]
+        if np.array_equal(next_roots, roots):
+            return roots
+        roots = next_roots
+
+def union_edges(parent, u, v):
+    """Merge the components joined by the edges (u[i], v[i]).
+
+    Each round hooks the larger root of every edge whose ends are still
+    apart under the smaller one; np.minimum.at settles conflicting hooks, and
+    since parents always point to smaller indexes the forest stays acyclic.
+    """
+    while len(u):
+        u, v = find_roots(parent, u), find_roots(parent, v)
+        apart = u != v
+        u, v = u[apart], v[apart]
+        if len(u):
+            np.minimum.at(parent, np.maximum(u, v), np.minimum(u, v))
+
+def cluster_features(features, threshold, memory_bytes=DEFAULT_MEMORY_BYTES):
+    """Connected components of the graph linking vectors with cosine similarity >= threshold.
+
+    The n x n similarity matrix is never built: the upper triangle is scored
+    one tile at a time (side from tile_size), the pairs above the threshold
+    are merged into a union-find forest and the tile is dropped, so working
+    memory stays within memory_bytes whatever n is. Features must be
+    L2-normalized. Returns one label per vector, the smallest index in its
+    component.
+    """
+    features = np.ascontiguousarray(features, dtype=np.float32)
+    n = len(features)
+    parent = np.arange(n, dtype=np.int64)
+    step = tile_size(memory_bytes)
+
+    for i in range(0, n, step):
+        block = features[i:i + step]
+        for j in range(i, n, step):
+            mask = (block @ features[j:j + step].T) >= threshold
+            if i == j:
+                # Each pair once, no self-loops
+                mask = np.triu(mask, k=1)
+            rows, cols = np.nonzero(mask)
+            del mask
+            if len(rows):
+                union_edges(parent, rows + i, cols + j)
+
+    return find_roots(parent, np.arange(n))
+
+def group_labels(labels):
+    """Member indexes of each component, largest component first"""
+    labels = np.asarray(labels)
+    if len(labels) == 0:
+        return []
+    order = np.argsort(labels, kind='stable')
+    groups = np.split(order, np.flatnonzero(np.diff(labels[order])) + 1)
+    groups.sort(key=len, reverse=True)
+    return [group.tolist() for group in groups]
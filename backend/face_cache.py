@@ -0,0 +1,156 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from bson.binary import Binary
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost (dict, keys, boxes) on top of the payload
+ENTRY_OVERHEAD_BYTES = 512
+
+def analysis_key(key, extractor, settings):
+    """Cache key of an upload's analysis: its content hash, the feature
+    extractor (its extractor_identity, so a new embedding model gets new
+    keys) and the detection and decode settings (analysis_settings)
+    """
+    return f"{key}:{extractor}:{settings}"
+
+def analysis_size(analysis):
+    """Approximate memory held by a cached analysis"""
+    size = ENTRY_OVERHEAD_BYTES
+    if analysis['features'] is not None:
+        size += analysis['features'].nbytes
+    if analysis.get('face_features') is not None:
+        size += analysis['face_features'].nbytes
+    if analysis['thumbnail'] is not None:
+        size += len(analysis['thumbnail'])
+    return size
+
+class FaceCache:
+    """Content-addressed cache of image analyses (features, face boxes, thumbnail).
+
+    An in-process LRU tier bounded by total size sits in front of a MongoDB
+    collection, so a repeated upload skips decode and detection entirely.
+    MongoDB entries expire ttl_seconds after they were written.
+    """
+
+    def __init__(self, collection=None, max_bytes=256 * 1024 * 1024, ttl_seconds=30 * 24 * 60 * 60):
+        self.collection = collection
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._size_bytes = 0
+        self.memory_hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, analysis):
+        """Insert into the LRU tier, evicting the least recently used entries"""
+        if key in self._entries:
+            self._size_bytes -= analysis_size(self._entries.pop(key))
+        size = analysis_size(analysis)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = analysis
+        self._size_bytes += size
+        while self._size_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size_bytes -= analysis_size(evicted)
+
+    async def get_many(self, keys):
+        """Look up several keys, returning a dict of the ones found"""
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                found[key] = self._entries[key]
+                self.memory_hits += 1
+            else:
+                missing.append(key)
+
+        if missing and self.collection is not None:
+            try:
+                # The TTL monitor only runs once a minute, so check expiry here too
+                query = {"_id": {"$in": missing}, "expires_at": {"$gt": datetime.utcnow()}}
+                async for document in self.collection.find(query):
+                    analysis = document_to_analysis(document)
+                    self._remember(document["_id"], analysis)
+                    found[document["_id"]] = analysis
+                    self.mongo_hits += 1
+            except Exception as e:
+                logger.warning(f"Face cache lookup failed: {str(e)}")
+
+        self.misses += sum(1 for key in missing if key not in found)
+        return found
+
+    async def put(self, key, analysis):
+        """Store a successful analysis in both tiers"""
+        if analysis['error'] is not None:
+            return
+        # Stage timings describe the original computation, not a cache hit
+        analysis = dict(analysis, timings=None)
+        self._remember(key, analysis)
+        if self.collection is not None:
+            try:
+                document = analysis_to_document(key, analysis)
+                document["expires_at"] = document["created_at"] + timedelta(seconds=self.ttl_seconds)
+                await self.collection.replace_one({"_id": key}, document, upsert=True)
+            except Exception as e:
+                logger.warning(f"Face cache write failed: {str(e)}")
+
+    async def ensure_indexes(self):
+        """TTL index so expired analyses are removed from MongoDB"""
+        if self.collection is not None:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def stats(self):
+        """Hit/miss counters and current size of the in-process tier"""
+        lookups = self.memory_hits + self.mongo_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self._size_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "memory_hits": self.memory_hits,
+            "mongo_hits": self.mongo_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.mongo_hits) / lookups if lookups else 0.0,
+        }
+
+def analysis_to_document(key, analysis):
+    """Serialize an analysis for MongoDB (feature vectors as raw float32 bytes)"""
+    features = analysis['features']
+    face_features = analysis.get('face_features')
+    return {
+        "_id": key,
+        "has_face": analysis['has_face'],
+        "faces": analysis['faces'],
+        "features": None if features is None else Binary(np.asarray(features, dtype=np.float32).tobytes()),
+        "face_features": None if face_features is None else Binary(np.asarray(face_features, dtype=np.float32).tobytes()),
+        "thumbnail": None if analysis['thumbnail'] is None else Binary(analysis['thumbnail']),
+        "thumbnail_key": analysis['thumbnail_key'],
+        "rejected_at": analysis.get('rejected_at'),
+        "created_at": datetime.utcnow(),
+    }
+
+def document_to_analysis(document):
+    """Rebuild an analysis dict from its MongoDB document"""
+    features = document.get("features")
+    # One row per face (absent from documents written before multi-face matching)
+    face_features = document.get("face_features")
+    if face_features is not None:
+        face_features = np.frombuffer(face_features, dtype=np.float32).reshape(len(document["faces"]), -1)
+    return {
+        'has_face': document["has_face"],
+        'faces': document.get("faces", []),
+        'features': None if features is None else np.frombuffer(features, dtype=np.float32),
+        'face_features': face_features,
+        'thumbnail': None if document.get("thumbnail") is None else bytes(document["thumbnail"]),
+        'thumbnail_key': document.get("thumbnail_key"),
+        'rejected_at': document.get("rejected_at"),
+        'timings': None,
+        'error': None,
+        'error_detail': None,
+    }
@@ -0,0 +1,142 @@
+import os
+import threading
+import cv2
+import numpy as np
+from feature_extractors import model_digest
+
+class DNNFaceDetector:
+    """A cv2.dnn face detector; detect_faces delegates to it when FACE_DETECTOR is not 'haar'.
+
+    detect_batch returns one (has_face, boxes) pair per image, in the
+    detect_faces contract: x, y, w, h int32 rows in the image's coordinates.
+    """
+
+    name = None
+
+    def detect_batch(self, images, max_side=0):
+        raise NotImplementedError
+
+def to_bgr(image_array):
+    """OpenCV models expect BGR; uploads are decoded as RGB (or grayscale)"""
+    if image_array.ndim == 2:
+        return cv2.cvtColor(image_array, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
+
+def corner_boxes(corners, width, height):
+    """(has_face, boxes) from x1, y1, x2, y2 rows, clipped to the image"""
+    corners = np.round(np.asarray(corners, dtype=np.float64).reshape(-1, 4))
+    x1 = np.clip(corners[:, 0], 0, width)
+    y1 = np.clip(corners[:, 1], 0, height)
+    x2 = np.clip(corners[:, 2], 0, width)
+    y2 = np.clip(corners[:, 3], 0, height)
+    faces = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).astype(np.int32)
+    faces = faces[(faces[:, 2] > 0) & (faces[:, 3] > 0)]
+    if len(faces) == 0:
+        return False, []
+    return True, faces
+
+class SSDDetector(DNNFaceDetector):
+    """Single-shot detector with a DetectionOutput head (e.g. OpenCV's res10_300x300 ResNet-SSD).
+
+    Every image is resized to the fixed network input, so a whole batch
+    goes through one blob and one forward pass; each output row carries the
+    index of its image in the batch.
+    """
+
+    name = 'ssd'
+
+    def __init__(self, model, config=None, confidence=0.5, input_size=300, mean=(104.0, 177.0, 123.0)):
+        self.net = cv2.dnn.readNet(str(model), str(config or ''))
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.confidence = confidence
+        self.input_size = input_size
+        self.mean = mean
+
+    def detect_batch(self, images, max_side=0):
+        if not images:
+            return []
+        size = (self.input_size, self.input_size)
+        # Resize before the color conversion, so it only touches input_size pixels
+        inputs = [to_bgr(cv2.resize(image, size, interpolation=cv2.INTER_AREA)) for image in images]
+        self.net.setInput(cv2.dnn.blobFromImages(inputs, 1.0, size, self.mean, swapRB=False, crop=False))
+        detections = self.net.forward().reshape(-1, 7)
+        detections = detections[detections[:, 2] >= self.confidence]
+
+        results = []
+        for i, image in enumerate(images):
+            height, width = image.shape[:2]
+            rows = detections[detections[:, 0] == i]
+            results.append(corner_boxes(rows[:, 3:7] * (width, height, width, height), width, height))
+        return results
+
+class YuNetDetector(DNNFaceDetector):
+    """OpenCV's YuNet through cv2.FaceDetectorYN.
+
+    YuNet takes one image of any size per call, so a batch is a loop; the
+    image is first reduced to max_side like the cascade input.
+    """
+
+    name = 'yunet'
+
+    def __init__(self, model, confidence=0.9, nms_threshold=0.3, top_k=5000):
+        self.detector = cv2.FaceDetectorYN.create(str(model), '', (320, 320), confidence, nms_threshold, top_k)
+
+    def detect(self, image, max_side=0):
+        height, width = image.shape[:2]
+        scale = 1.0
+        if max_side and max(height, width) > max_side:
+            scale = max_side / max(height, width)
+            image = cv2.resize(
+                image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                interpolation=cv2.INTER_AREA
+            )
+        self.detector.setInputSize((image.shape[1], image.shape[0]))
+        _, faces = self.detector.detect(to_bgr(image))
+        if faces is None:
+            return False, []
+        corners = np.column_stack([faces[:, 0], faces[:, 1], faces[:, 0] + faces[:, 2], faces[:, 1] + faces[:, 3]])
+        return corner_boxes(corners / scale, width, height)
+
+    def detect_batch(self, images, max_side=0):
+        return [self.detect(image, max_side) for image in images]
+
+# Model files of the DNN detectors (the SSD config is the Caffe .prototxt,
+# if the model needs one) and the minimum confidence of a detection
+DNN_DETECTOR_MODEL = os.environ.get('DNN_DETECTOR_MODEL')
+DNN_DETECTOR_CONFIG = os.environ.get('DNN_DETECTOR_CONFIG')
+DNN_DETECTOR_CONFIDENCE = os.environ.get('DNN_DETECTOR_CONFIDENCE')
+
+def detector_options():
+    if DNN_DETECTOR_CONFIDENCE is None:
+        return {}
+    return {'confidence': float(DNN_DETECTOR_CONFIDENCE)}
+
+def detector_identity(name):
+    """What a DNN detector's boxes depend on: its name, model files and confidence"""
+    return [
+        name,
+        model_digest(DNN_DETECTOR_MODEL) if DNN_DETECTOR_MODEL else None,
+        model_digest(DNN_DETECTOR_CONFIG) if DNN_DETECTOR_CONFIG else None,
+        DNN_DETECTOR_CONFIDENCE,
+    ]
+
+# Available DNN backends, selected with FACE_DETECTOR ('haar' is the cascade in face_processing)
+FACE_DETECTORS = {
+    'ssd': lambda: SSDDetector(DNN_DETECTOR_MODEL, DNN_DETECTOR_CONFIG, **detector_options()),
+    'yunet': lambda: YuNetDetector(DNN_DETECTOR_MODEL, **detector_options()),
+}
+
+# Detector instances per thread: a cv2.dnn net must not run two forward passes at once
+_local = threading.local()
+
+def get_face_detector(name):
+    """The DNN detector instance for a name, built once per thread"""
+    detectors = _local.__dict__.setdefault('detectors', {})
+    if name not in detectors:
+        if name not in FACE_DETECTORS:
+            raise ValueError(f"Unknown face detector '{name}'")
+        if not DNN_DETECTOR_MODEL:
+            raise ValueError(f"Face detector '{name}' needs DNN_DETECTOR_MODEL")
+        detectors[name] = FACE_DETECTORS[name]()
+    return detectors[name]
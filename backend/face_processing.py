@@ -0,0 +1,617 @@
+import os
+import io
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import cv2
+import numpy as np
+from PIL import Image
+from fastapi import HTTPException
+from thumbnail_store import thumbnail_key, thumbnail_media_type
+from feature_extractors import get_feature_extractor
+from face_detectors import detector_identity, get_face_detector
+
+logger = logging.getLogger(__name__)
+
+# Number of workers used for the CPU-bound face pipeline, and whether they
+# are processes or threads of the server process ('process' or 'thread')
+FACE_WORKERS = int(os.environ.get('FACE_WORKERS', os.cpu_count() or 1))
+FACE_EXECUTOR = os.environ.get('FACE_EXECUTOR', 'process')
+
+# Longest image side the cascade runs on (0 = full resolution) and whether
+# the largest face is refined at full resolution afterwards. Downscaling is
+# opt-in: faces that shrink below the cascade's 24px window are lost
+DETECTION_MAX_SIDE = int(os.environ.get('DETECTION_MAX_SIDE', 0))
+DETECTION_REFINE = os.environ.get('DETECTION_REFINE', 'false').lower() == 'true'
+
+# Face detector: the Haar cascade, or a cv2.dnn backend ('ssd', 'yunet') that
+# needs DNN_DETECTOR_MODEL, and the OpenCV threads of each pool worker
+FACE_DETECTOR = os.environ.get('FACE_DETECTOR', 'haar')
+DETECTOR_THREADS = int(os.environ.get('DETECTOR_THREADS', 1))
+
+# Longest side uploads are decoded to (0 = full resolution); by default the
+# resolution the detector works at
+DECODE_MAX_SIDE = int(os.environ.get('DECODE_MAX_SIDE', DETECTION_MAX_SIDE))
+
+# Coarse pre-screen with the cascade (opt-in): uploads are first decoded with
+# their longest side at PRESCREEN_MAX_SIDE (0 = off) and only those with a
+# candidate face there go through the full decode and detection
+PRESCREEN_MAX_SIDE = int(os.environ.get('PRESCREEN_MAX_SIDE', 0))
+PRESCREEN_MIN_NEIGHBORS = int(os.environ.get('PRESCREEN_MIN_NEIGHBORS', 2))
+
+# Encoding of the display thumbnails ('jpeg' or 'webp') and its quality
+THUMBNAIL_FORMAT = os.environ.get('THUMBNAIL_FORMAT', 'jpeg').lower()
+THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY', 80))
+THUMBNAIL_FORMATS = {'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+# The box-filter reduction stops once the image is within this factor of the
+# thumbnail size; LANCZOS does the rest on the small image
+THUMBNAIL_REDUCING_GAP = 2
+
+# Modes Image.reduce averages correctly; palette, 1-bit and 16-bit images
+# are converted to the requested mode first
+REDUCIBLE_MODES = {'L', 'RGB', 'RGBA', 'I', 'F'}
+
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+HAAR_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+# Smallest faces the cascade finds: its 24px window on a downscaled copy,
+# and the minSize of a full-resolution pass
+CASCADE_WINDOW = 24
+FULL_RESOLUTION_MIN_FACE = 30
+
+# Detector instances of the current thread (see get_face_cascade)
+_local = threading.local()
+
+_process_pool = None
+
+def get_face_cascade():
+    """This thread's cascade classifier.
+
+    A CascadeClassifier is not safe to share between concurrent
+    detectMultiScale calls, so every pool thread (or process) loads its own.
+    """
+    cascade = getattr(_local, 'face_cascade', None)
+    if cascade is None:
+        cascade = _local.face_cascade = cv2.CascadeClassifier(HAAR_CASCADE_PATH)
+    return cascade
+
+def detect_faces(image_array, max_side=None, refine=None):
+    """Detect faces in an image using OpenCV
+
+    With max_side set, the cascade runs on a copy resized so its longest side
+    is at most max_side and the boxes are mapped back to original coordinates.
+    With refine, the largest face is then re-detected at full resolution
+    inside its (padded) region to recover a precise box.
+    With FACE_DETECTOR set to a DNN backend, that detector is used instead.
+    """
+    if FACE_DETECTOR != 'haar':
+        return detect_faces_batch([image_array], max_side)[0]
+    try:
+        if max_side is None:
+            max_side = DETECTION_MAX_SIDE
+        if refine is None:
+            refine = DETECTION_REFINE
+            
+        # Convert to grayscale
+        if image_array.ndim == 3:
+            gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+        else:
+            gray = image_array
+        
+        height, width = gray.shape[:2]
+        scale = 1.0
+        if max_side and max(height, width) > max_side:
+            scale = max_side / max(height, width)
+            gray_small = cv2.resize(
+                gray, (max(1, round(width * scale)), max(1, round(height * scale))),
+                interpolation=cv2.INTER_AREA
+            )
+        else:
+            gray_small = gray
+        
+        # Detect faces
+        faces = get_face_cascade().detectMultiScale(
+            gray_small,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=(FULL_RESOLUTION_MIN_FACE,) * 2 if scale == 1.0 else (CASCADE_WINDOW,) * 2
+        )
+        
+        if len(faces) == 0:
+            return False, []
+        
+        if scale != 1.0:
+            # Map boxes back to original coordinates
+            faces = np.round(np.asarray(faces) / scale).astype(np.int32)
+            faces[:, 2] = np.minimum(faces[:, 2], width - faces[:, 0])
+            faces[:, 3] = np.minimum(faces[:, 3], height - faces[:, 1])
+            
+            if refine:
+                faces = refine_largest_face(gray, faces)
+        
+        return True, faces
+    except Exception as e:
+        logger.warning(f"Face detection failed: {str(e)}")
+        return False, []
+
+def detect_faces_batch(images, max_side=None, refine=None):
+    """detect_faces for several images, one (has_face, faces) pair each.
+
+    DNN backends run the whole list at once (the SSD in a single forward
+    pass); the cascade goes image by image.
+    """
+    if FACE_DETECTOR == 'haar':
+        return [detect_faces(image, max_side, refine) for image in images]
+    return get_face_detector(FACE_DETECTOR).detect_batch(
+        images, DETECTION_MAX_SIDE if max_side is None else max_side
+    )
+
+def check_face_detector():
+    """Build this thread's detector; ValueError if FACE_DETECTOR is unusable"""
+    if FACE_DETECTOR == 'haar':
+        if get_face_cascade().empty():
+            raise ValueError(f"Could not load the Haar cascade from {HAAR_CASCADE_PATH}")
+    else:
+        get_face_detector(FACE_DETECTOR)
+
+def analysis_settings():
+    """Short hash of the settings besides the extractor that shape an analysis.
+
+    Covers the detector (and its model), the detection and decode
+    resolutions, the pre-screen and the thumbnail encoding; it is part of
+    the analysis cache key, so analyses made under other settings are
+    never reused.
+    """
+    settings = {
+        'detector': FACE_DETECTOR if FACE_DETECTOR == 'haar' else detector_identity(FACE_DETECTOR),
+        'detection_max_side': DETECTION_MAX_SIDE,
+        'detection_refine': DETECTION_REFINE,
+        'decode_max_side': DECODE_MAX_SIDE,
+        'prescreen': [PRESCREEN_MAX_SIDE, PRESCREEN_MIN_NEIGHBORS] if prescreen_enabled() else None,
+        'thumbnail': [THUMBNAIL_FORMAT, THUMBNAIL_QUALITY],
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+def refine_largest_face(gray, faces, padding=0.25):
+    """Re-detect the largest face at full resolution within its padded box"""
+    largest = int(np.argmax(faces[:, 2] * faces[:, 3]))
+    x, y, w, h = faces[largest]
+    pad_x, pad_y = int(w * padding), int(h * padding)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(gray.shape[1], x + w + pad_x), min(gray.shape[0], y + h + pad_y)
+    
+    refined = get_face_cascade().detectMultiScale(
+        gray[y0:y1, x0:x1],
+        scaleFactor=1.1,
+        minNeighbors=5,
+        minSize=(max(30, w // 2), max(30, h // 2))
+    )
+    if len(refined) == 0:
+        return faces
+    
+    # Keep the refined box closest in size to the coarse one
+    rx, ry, rw, rh = min(refined, key=lambda f: abs(int(f[2]) * int(f[3]) - int(w) * int(h)))
+    faces = faces.copy()
+    faces[largest] = (x0 + rx, y0 + ry, rw, rh)
+    return faces
+
+def extract_face_features(image_array, faces):
+    """Extract simple features from detected faces"""
+    try:
+        if len(faces) == 0:
+            return None
+
+        # Get the largest face
+        largest_face = max(faces, key=lambda f: f[2] * f[3])
+        x, y, w, h = largest_face
+
+        # Extract face region
+        face_region = image_array[y:y+h, x:x+w]
+
+        # Resize to standard size for comparison
+        face_resized = cv2.resize(face_region, (128, 128))
+
+        # Convert to grayscale and normalize
+        if len(face_resized.shape) == 3:
+            face_gray = cv2.cvtColor(face_resized, cv2.COLOR_RGB2GRAY)
+        else:
+            face_gray = face_resized
+
+        # Calculate simple histogram features
+        hist = cv2.calcHist([face_gray], [0], None, [256], [0, 256])
+        features = hist.flatten()
+
+        # Normalize features
+        features = features / (np.linalg.norm(features) + 1e-6)
+
+        return features
+
+    except Exception as e:
+        return None
+
+def extract_all_face_features(image_array, faces, extractor=None):
+    """Extract the features of every detected face in one pass.
+
+    One L2-normalized row per box in `faces` order, from the named extractor
+    (FEATURE_EXTRACTOR by default; 'histogram' gives the same features as
+    extract_face_features). Color extractors need the RGB image.
+    """
+    try:
+        if len(faces) == 0:
+            return None
+        
+        return get_feature_extractor(extractor).extract(image_array, faces)
+    
+    except Exception as e:
+        logger.warning(f"Feature extraction failed: {str(e)}")
+        return None
+
+def largest_face_index(faces):
+    """Index of the largest box (the face extract_face_features uses)"""
+    return max(range(len(faces)), key=lambda i: faces[i][2] * faces[i][3])
+
+def make_thumbnail(image_array, max_size=(150, 150), quality=None, format=None):
+    """Encode a small thumbnail of an image array (or PIL image).
+
+    The image is first shrunk with Image.reduce, a cheap integer box filter,
+    to within THUMBNAIL_REDUCING_GAP of the target size, so the LANCZOS pass
+    only ever runs on a small image. A PIL image passed in is left untouched.
+    """
+    quality = quality or THUMBNAIL_QUALITY
+    format = THUMBNAIL_FORMATS[(format or THUMBNAIL_FORMAT).lower()]
+    
+    # Convert numpy array to PIL Image
+    if isinstance(image_array, np.ndarray):
+        image = Image.fromarray(image_array)
+    else:
+        image = image_array
+    
+    # Fit inside max_size, keeping the aspect ratio
+    scale = min(max_size[0] / image.width, max_size[1] / image.height, 1.0)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    
+    factor = min(
+        image.width // (size[0] * THUMBNAIL_REDUCING_GAP),
+        image.height // (size[1] * THUMBNAIL_REDUCING_GAP)
+    )
+    if factor > 1:
+        image = image.reduce(factor)
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    
+    img_buffer = io.BytesIO()
+    image.save(img_buffer, format=format, quality=quality)
+    return img_buffer.getvalue()
+
+def thumbnail_data_uri(thumbnail):
+    """Inline an encoded thumbnail as a base64 data URI"""
+    return f"data:{thumbnail_media_type(thumbnail)};base64,{base64.b64encode(thumbnail).decode()}"
+
+def image_to_base64(image_array, max_size=(150, 150)):
+    """Convert image array to base64 string for frontend display"""
+    try:
+        return thumbnail_data_uri(make_thumbnail(image_array, max_size))
+        
+    except Exception as e:
+        return None
+
+def calculate_similarity(features1, features2):
+    """Calculate similarity between two feature vectors"""
+    try:
+        if features1 is None or features2 is None:
+            return 0.0
+            
+        return float(score_features(features1, stack_features([features2]))[0])
+        
+    except Exception as e:
+        return 0.0
+
+def stack_features(feature_list):
+    """Stack feature vectors into one contiguous float32 matrix"""
+    return np.ascontiguousarray(np.vstack(feature_list), dtype=np.float32)
+
+def score_features(base_features, feature_matrix):
+    """Score every row of a feature matrix against the base vector at once.
+
+    Features from extract_face_features are already L2-normalized, so the
+    cosine similarity is a plain matrix-vector product. Given a matrix of base
+    vectors (one per row) it is a single matrix product instead, returning one
+    row of scores per base.
+    """
+    base_vector = np.asarray(base_features, dtype=np.float32)
+    if base_vector.ndim == 2:
+        similarities = base_vector @ feature_matrix.T
+    else:
+        similarities = feature_matrix @ base_vector
+    
+    # Convert to percentage (0-100)
+    return np.clip(similarities * 100, 0, 100)
+
+def open_image(file_content, max_side=None, mode='RGB'):
+    """Decode an upload into a PIL image of the given mode ('RGB' or 'L').
+
+    With max_side set, JPEGs are decoded through PIL's draft mode, so the DCT
+    scaling in libjpeg produces an image of at least max_side on its longest
+    side instead of the full resolution; other formats are reduced by an
+    integer factor right after decoding. EXIF orientation is read from the
+    original and applied on the already reduced image. Returns the image and
+    the original (width, height) in display orientation.
+    """
+    image = Image.open(io.BytesIO(file_content))
+    original_width, original_height = image.size
+    # Read before reducing: the image reduce() returns carries no EXIF
+    orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    
+    if max_side and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        target = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+        if image.format == 'JPEG':
+            image.draft(mode, target)
+        else:
+            factor = max(image.width // target[0], image.height // target[1])
+            if factor > 1:
+                if image.mode not in REDUCIBLE_MODES:
+                    image = image.convert(mode)
+                image = image.reduce(factor)
+    
+    # Convert to the requested mode if necessary
+    if image.mode != mode:
+        image = image.convert(mode)
+    
+    if orientation in EXIF_TRANSPOSE:
+        image = image.transpose(EXIF_TRANSPOSE[orientation])
+        if orientation >= 5:
+            original_width, original_height = original_height, original_width
+    
+    return image, (original_width, original_height)
+
+def decode_image(file_content, max_side=None, mode='RGB'):
+    """Decode an upload into a numpy array (see open_image)"""
+    image, original_size = open_image(file_content, max_side=max_side, mode=mode)
+    return np.array(image), original_size
+
+def process_uploaded_image(file_content, max_side=None, mode='RGB'):
+    """Process uploaded image and return numpy array"""
+    try:
+        image_array, _ = decode_image(file_content, max_side=max_side, mode=mode)
+        return image_array
+        
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image format: {str(e)}")
+
+def empty_analysis():
+    return {
+        'has_face': False,
+        'faces': [],
+        'features': None,
+        'face_features': None,
+        'thumbnail': None,
+        'thumbnail_key': None,
+        'rejected_at': None,
+        'timings': {},
+        'error': None,
+        'error_detail': None,
+    }
+
+def failed_analysis(result, e):
+    result['error'] = str(e)
+    result['error_detail'] = getattr(e, 'detail', str(e))
+    return result
+
+def decode_upload(file_content, max_side):
+    try:
+        image, original_size = open_image(file_content, max_side=max_side)
+        image.load()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image format: {str(e)}")
+    return image, original_size
+
+def add_thumbnail(image, result):
+    """Encode the display thumbnail (stored by the server under its hash)"""
+    start = time.perf_counter()
+    try:
+        result['thumbnail'] = make_thumbnail(image)
+        result['thumbnail_key'] = thumbnail_key(result['thumbnail'])
+    except Exception:
+        pass
+    result['timings']['thumbnail'] = time.perf_counter() - start
+
+def prescreen_enabled():
+    """The pre-screen is a cascade pass, so it only stands in front of the cascade"""
+    return FACE_DETECTOR == 'haar' and 0 < PRESCREEN_MAX_SIDE < (DECODE_MAX_SIDE or float('inf'))
+
+def prescreen_conclusive(width, height):
+    """Whether the pre-screen can see every face full detection finds in an image this size.
+
+    The cascade window mapped back to the original must be no larger than
+    the full path's smallest face; otherwise a face between the two would
+    be rejected by the pre-screen but found by the full detection.
+    """
+    longest = max(width, height)
+    prescreen_floor = CASCADE_WINDOW * max(1.0, longest / PRESCREEN_MAX_SIDE)
+    if DETECTION_MAX_SIDE and longest > DETECTION_MAX_SIDE:
+        detection_floor = CASCADE_WINDOW * longest / DETECTION_MAX_SIDE
+    else:
+        detection_floor = FULL_RESOLUTION_MIN_FACE
+    return prescreen_floor <= detection_floor
+
+def prescreen_rejects(file_content, result):
+    """Look for face candidates on a small decode; True when there is none.
+
+    The scan is permissive (few neighbours, coarse scale steps), so anything
+    face-like escalates to the full path. Images too large for the pre-screen
+    to see the smallest faces the full path finds (see prescreen_conclusive)
+    escalate without being scanned. A rejected upload gets its thumbnail
+    from the small decode and never pays for the full one.
+    """
+    try:
+        # Only the header is read here
+        with Image.open(io.BytesIO(file_content)) as header:
+            size = header.size
+    except Exception:
+        # Left to the full decode, which reports the error
+        return False
+    if not prescreen_conclusive(*size):
+        return False
+
+    start = time.perf_counter()
+    image, _ = decode_upload(file_content, PRESCREEN_MAX_SIDE)
+    gray = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY)
+    height, width = gray.shape
+    if max(height, width) > PRESCREEN_MAX_SIDE:
+        # JPEG draft decoding stops at the nearest DCT scale above the target
+        scale = PRESCREEN_MAX_SIDE / max(height, width)
+        gray = cv2.resize(
+            gray, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA
+        )
+    candidates = get_face_cascade().detectMultiScale(
+        gray, scaleFactor=1.2, minNeighbors=PRESCREEN_MIN_NEIGHBORS, minSize=(CASCADE_WINDOW,) * 2
+    )
+    result['timings']['prescreen'] = time.perf_counter() - start
+    if len(candidates) > 0:
+        return False
+
+    result['rejected_at'] = 'prescreen'
+    add_thumbnail(image, result)
+    return True
+
+def decode_for_analysis(file_content, result):
+    """Decode and thumbnail one upload; returns (RGB array, original size)"""
+    timings = result['timings']
+    start = time.perf_counter()
+    image, original_size = decode_upload(file_content, DECODE_MAX_SIDE)
+    timings['decode'] = time.perf_counter() - start
+
+    # The thumbnail comes from the decoded image, before it is copied into a numpy array
+    add_thumbnail(image, result)
+
+    start = time.perf_counter()
+    image_array = np.asarray(image)
+    timings['decode'] += time.perf_counter() - start
+    return image_array, original_size
+
+def analyze_images(file_contents, extractor=None):
+    """Run decode, thumbnail, detection and feature extraction for several uploads.
+
+    Runs inside a pool worker, so everything returned must be picklable and
+    errors are reported in each result instead of raised. 'face_features' has
+    one row per box in 'faces', from the named feature extractor. The monotonic time
+    spent in each stage is returned in seconds under 'timings'; the images are
+    detected as one batch, so each is charged an equal share of that time.
+    'rejected_at' names the stage that found no face ('prescreen' or 'detect').
+    """
+    results = [empty_analysis() for _ in file_contents]
+    decoded = []
+    for file_content, result in zip(file_contents, results):
+        try:
+            if prescreen_enabled() and prescreen_rejects(file_content, result):
+                continue
+            decoded.append((result, *decode_for_analysis(file_content, result)))
+        except Exception as e:
+            failed_analysis(result, e)
+    if not decoded:
+        return results
+
+    # The cascade only needs the grayscale image, DNN detectors take color
+    start = time.perf_counter()
+    inputs = [
+        image_array if FACE_DETECTOR != 'haar' else cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+        for _, image_array, _ in decoded
+    ]
+    try:
+        detections = detect_faces_batch(inputs)
+    except Exception as e:
+        # A detector failure is an error for every image of the batch, not "no face"
+        for result, _, _ in decoded:
+            failed_analysis(result, e)
+        return results
+    detect_time = (time.perf_counter() - start) / len(decoded)
+
+    for (result, image_array, original_size), source, (has_face, faces) in zip(decoded, inputs, detections):
+        timings = result['timings']
+        timings['detect'] = detect_time
+        try:
+            # Extract features from all faces; 'features' is the largest
+            # face, the one matched by default
+            result['has_face'] = has_face
+            if not has_face:
+                result['rejected_at'] = 'detect'
+            else:
+                start = time.perf_counter()
+                feature_extractor = get_feature_extractor(extractor)
+                if feature_extractor.color:
+                    source = image_array
+                elif source.ndim == 3:
+                    source = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+                face_features = extract_all_face_features(source, faces, feature_extractor.name)
+                if face_features is not None:
+                    result['face_features'] = face_features
+                    result['features'] = face_features[largest_face_index(faces)]
+                timings['features'] = time.perf_counter() - start
+
+            # Report boxes in original image coordinates
+            box_scale = original_size[0] / image_array.shape[1]
+            result['faces'] = [[int(round(v * box_scale)) for v in face] for face in faces]
+
+        except Exception as e:
+            failed_analysis(result, e)
+
+    return results
+
+def analyze_image(file_content, extractor=None):
+    """analyze_images for a single upload"""
+    return analyze_images([file_content], extractor)[0]
+
+def opencv_threads():
+    """OpenCV threads per worker: DETECTOR_THREADS, capped so the workers together do not oversubscribe the CPUs"""
+    return max(1, min(DETECTOR_THREADS, (os.cpu_count() or 1) // max(1, FACE_WORKERS)))
+
+def init_worker():
+    """Warm up a pool worker so the first real image does not pay for it"""
+    # Parallelism comes from the pool, so OpenCV is single-threaded per worker
+    # unless DETECTOR_THREADS gives a DNN detector more threads (for thread
+    # workers the setting is process-wide, and the same for every thread)
+    cv2.setNumThreads(opencv_threads())
+    check_face_detector()
+    detect_faces(np.zeros((64, 64, 3), dtype=np.uint8))
+    # Build the default extractor now (an ONNX model is loaded once per worker)
+    get_feature_extractor()
+
+def get_process_pool():
+    """Return the shared worker pool, creating it on first use.
+
+    Processes by default; with FACE_EXECUTOR=thread, threads of the server
+    process, which skip pickling uploads and results (decoding, OpenCV and
+    numpy release the GIL). Either way each worker builds its own detector
+    and extractor instances.
+    """
+    global _process_pool
+    if _process_pool is None:
+        executor = ThreadPoolExecutor if FACE_EXECUTOR == 'thread' else ProcessPoolExecutor
+        _process_pool = executor(
+            max_workers=max(1, FACE_WORKERS),
+            initializer=init_worker
+        )
+    return _process_pool
+
+def shutdown_process_pool():
+    """Stop the shared process pool if it was started"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+        _process_pool = None
@@ -0,0 +1,196 @@
+import functools
+import hashlib
+import os
+import threading
+import cv2
+import numpy as np
+
+class FeatureExtractor:
+    """Turns the face boxes of an image into one L2-normalized vector per face.
+
+    Subclasses set `name` and `dim` and implement `extract`; with `color` set
+    they get the RGB image instead of the grayscale one.
+    """
+
+    name = None
+    dim = None
+    color = False
+
+    def extract(self, image_array, faces):
+        """float32 matrix with one L2-normalized row per box in `faces`"""
+        raise NotImplementedError
+
+def face_crops(image_array, faces, size):
+    """Each face box resized to size x size, in `faces` order"""
+    return [cv2.resize(image_array[y:y+h, x:x+w], (size, size)) for x, y, w, h in faces]
+
+def normalize_rows(features):
+    features /= np.linalg.norm(features, axis=1, keepdims=True) + 1e-6
+    return features
+
+class HistogramExtractor(FeatureExtractor):
+    """256-bin grayscale histogram of a 128x128 crop (the original features)"""
+
+    name = 'histogram'
+    dim = 256
+
+    def __init__(self, size=128):
+        self.size = size
+
+    def extract(self, image_array, faces):
+        features = np.empty((len(faces), self.dim), dtype=np.float32)
+        for i, crop in enumerate(face_crops(image_array, faces, self.size)):
+            features[i] = cv2.calcHist([crop], [0], None, [256], [0, 256]).ravel()
+        return normalize_rows(features)
+
+def uniform_lbp_table():
+    """Map the 256 LBP codes to the 58 uniform patterns, plus one bin for the rest"""
+    table = np.full(256, 58, dtype=np.intp)
+    label = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        if sum(bits[i] != bits[(i + 1) % 8] for i in range(8)) <= 2:
+            table[code] = label
+            label += 1
+    return table
+
+# Neighbours of the 3x3 LBP operator, clockwise from the top left
+LBP_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+
+class LBPExtractor(FeatureExtractor):
+    """Uniform LBP histograms over a grid of cells of a 64x64 crop.
+
+    Concatenating per-cell histograms keeps where each texture occurs (eyes,
+    mouth), which the global intensity histogram loses. Rows are
+    square-rooted before normalizing, so the cosine compares them like the
+    Hellinger kernel and a few dominant bins do not swamp the rest.
+    """
+
+    name = 'lbp'
+    bins = 59
+
+    def __init__(self, size=64, grid=4):
+        self.size = size
+        self.grid = grid
+        self.dim = grid * grid * self.bins
+        self.table = uniform_lbp_table()
+        # Cell of every pixel of the (size x size) code image, pre-multiplied by the bin count
+        cells = np.arange(size) * grid // size
+        self.cell_offsets = (cells[:, None] * grid + cells[None, :]) * self.bins
+
+    def extract(self, image_array, faces):
+        crops = np.stack(face_crops(image_array, faces, self.size + 2)).astype(np.int16)
+        center = crops[:, 1:-1, 1:-1]
+        codes = np.zeros(center.shape, dtype=np.intp)
+        for bit, (dy, dx) in enumerate(LBP_OFFSETS):
+            neighbour = crops[:, 1 + dy:self.size + 1 + dy, 1 + dx:self.size + 1 + dx]
+            codes |= (neighbour >= center).astype(np.intp) << bit
+
+        # One bincount for every face, cell and pattern at once
+        bins = self.table[codes] + self.cell_offsets + (np.arange(len(faces)) * self.dim)[:, None, None]
+        counts = np.bincount(bins.ravel(), minlength=len(faces) * self.dim)
+        return normalize_rows(np.sqrt(counts.reshape(len(faces), self.dim).astype(np.float32)))
+
+class HOGExtractor(FeatureExtractor):
+    """OpenCV HOG descriptor of a 64x64 crop (8x8 cells, 2x2-cell blocks, 9 bins)"""
+
+    name = 'hog'
+
+    def __init__(self, size=64):
+        self.size = size
+        self.descriptor = cv2.HOGDescriptor((size, size), (16, 16), (8, 8), (8, 8), 9)
+        self.dim = int(self.descriptor.getDescriptorSize())
+
+    def extract(self, image_array, faces):
+        features = np.empty((len(faces), self.dim), dtype=np.float32)
+        for i, crop in enumerate(face_crops(image_array, faces, self.size)):
+            features[i] = self.descriptor.compute(crop).ravel()
+        return normalize_rows(features)
+
+class OnnxEmbeddingExtractor(FeatureExtractor):
+    """Face embedding from an ONNX model run on CPU through cv2.dnn.
+
+    Expects an ArcFace-style network: RGB input of input_size x input_size
+    scaled to [-1, 1], one embedding row per face. All the faces of an
+    image go through a single forward pass; the dimension is read from the
+    model's output.
+    """
+
+    name = 'onnx'
+    color = True
+
+    def __init__(self, model_path, input_size=112):
+        self.net = cv2.dnn.readNetFromONNX(str(model_path))
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.dim = int(self.forward([np.zeros((input_size, input_size, 3), dtype=np.uint8)]).shape[1])
+
+    def forward(self, crops):
+        blob = cv2.dnn.blobFromImages(
+            crops, scalefactor=1 / 127.5, size=(self.input_size, self.input_size),
+            mean=(127.5, 127.5, 127.5), swapRB=False
+        )
+        self.net.setInput(blob)
+        return self.net.forward().reshape(len(crops), -1)
+
+    def extract(self, image_array, faces):
+        if image_array.ndim == 2:
+            image_array = cv2.cvtColor(image_array, cv2.COLOR_GRAY2RGB)
+        crops = face_crops(image_array, faces, self.input_size)
+        return normalize_rows(np.ascontiguousarray(self.forward(crops), dtype=np.float32))
+
+# Path of the ONNX embedding model enabling the 'onnx' extractor
+FACE_EMBEDDING_MODEL = os.environ.get('FACE_EMBEDDING_MODEL')
+FACE_EMBEDDING_INPUT_SIZE = int(os.environ.get('FACE_EMBEDDING_INPUT_SIZE', 112))
+
+# Available extractors, selected with FEATURE_EXTRACTOR or per request
+FEATURE_EXTRACTORS = {
+    'histogram': HistogramExtractor,
+    'lbp': LBPExtractor,
+    'hog': HOGExtractor,
+    'onnx': lambda: OnnxEmbeddingExtractor(FACE_EMBEDDING_MODEL, FACE_EMBEDDING_INPUT_SIZE),
+}
+
+FEATURE_EXTRACTOR = os.environ.get('FEATURE_EXTRACTOR', 'histogram')
+
+# Extractor instances per thread: cv2.dnn nets and HOG descriptors are not
+# safe to share between concurrent calls
+_local = threading.local()
+
+def available_extractors():
+    """Names of the extractors that can run here ('onnx' needs FACE_EMBEDDING_MODEL)"""
+    return [
+        name for name in FEATURE_EXTRACTORS
+        if name != 'onnx' or (FACE_EMBEDDING_MODEL and os.path.exists(FACE_EMBEDDING_MODEL))
+    ]
+
+@functools.lru_cache(maxsize=None)
+def model_digest(path):
+    """Short SHA-256 of a model file, computed once per process"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as model_file:
+        while chunk := model_file.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def extractor_identity(name=None):
+    """Name under which an extractor's vectors are cached and stored.
+
+    'onnx' vectors depend on the model file and input size, so both go into
+    its identity: swapping FACE_EMBEDDING_MODEL never reuses old vectors.
+    """
+    name = name or FEATURE_EXTRACTOR
+    if name == 'onnx':
+        return f"onnx-{model_digest(FACE_EMBEDDING_MODEL)}-{FACE_EMBEDDING_INPUT_SIZE}"
+    return name
+
+def get_feature_extractor(name=None):
+    """The extractor instance for a name, built once per thread"""
+    name = name or FEATURE_EXTRACTOR
+    extractors = _local.__dict__.setdefault('extractors', {})
+    if name not in extractors:
+        if name not in available_extractors():
+            raise ValueError(f"Unknown or unavailable feature extractor '{name}'")
+        extractors[name] = FEATURE_EXTRACTORS[name]()
+    return extractors[name]
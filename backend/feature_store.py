@@ -0,0 +1,285 @@
+import json
+import os
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+FORMAT_VERSION = 1
+
+# On-disk row formats: float32 is mapped as-is, float16 halves the file and
+# uint8 (one scale per row) quarters it, at the cost of a conversion on load
+STORE_DTYPES = {'float32': np.float32, 'float16': np.float16, 'uint8': np.uint8}
+
+# Ids are stored as fixed-width ASCII records (uuid4 strings are 36 chars)
+ID_BYTES = 40
+
+def quantize_uint8(vectors):
+    """Per-row uint8 codes and float32 scales; row ~= codes * scale"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    if vectors.size and vectors.min() < 0:
+        raise ValueError("uint8 feature store needs non-negative vectors")
+    scales = (vectors.max(axis=1) / 255).astype(np.float32)
+    safe_scales = np.where(scales > 0, scales, 1)
+    codes = np.clip(np.rint(vectors / safe_scales[:, None]), 0, 255).astype(np.uint8)
+    return codes, scales
+
+def encode_ids(ids):
+    encoded = [str(item_id).encode('ascii') for item_id in ids]
+    if any(len(item_id) > ID_BYTES for item_id in encoded):
+        raise ValueError(f"Feature store ids are limited to {ID_BYTES} ASCII characters")
+    return np.array(encoded, dtype=f'S{ID_BYTES}')
+
+def decode_ids(records):
+    return [record.decode('ascii') for record in records.tolist()]
+
+class FeatureStore:
+    """Gallery feature vectors as flat binary files, memory-mapped on load.
+
+    A directory holds meta.json (dimension and row dtype), vectors.bin (one
+    contiguous row per vector), scales.bin (uint8 only, one float32 per row),
+    ids.bin (fixed-width id records, same order) and deleted.bin (ids removed
+    since the last rewrite). Appends only extend the files, so enrolling
+    never rewrites the store; the row count is recovered from the file sizes
+    and a torn append is cut back to the last complete row.
+
+    float32 stores load as a copy-on-write memory map: no copy is made, and
+    worker processes mapping the same file share its pages through the page
+    cache until one of them modifies its index.
+
+    Each rewrite gets a new generation in meta.json. The store remembers the
+    generation, rows and tombstones it last handed out (load or changes), so
+    changes() returns only what other processes appended or deleted since.
+    """
+
+    def __init__(self, root, dtype='float32'):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unknown feature store dtype '{dtype}'")
+        self.root = Path(root)
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._position = None
+
+    def _path(self, name):
+        return self.root / name
+
+    def _read_meta(self):
+        try:
+            return json.loads(self._path('meta.json').read_text())
+        except FileNotFoundError:
+            return None
+
+    def _usable_meta(self):
+        """Store metadata, or None when missing or written in another format"""
+        meta = self._read_meta()
+        if meta is None or meta.get('version') != FORMAT_VERSION:
+            return None
+        if meta.get('dtype') != self.dtype or meta.get('id_bytes') != ID_BYTES:
+            return None
+        return meta
+
+    def _row_bytes(self, dim):
+        return dim * np.dtype(STORE_DTYPES[self.dtype]).itemsize
+
+    def _file_rows(self, name, row_bytes):
+        try:
+            return os.path.getsize(self._path(name)) // row_bytes
+        except FileNotFoundError:
+            return 0
+
+    def _count(self, dim):
+        """Rows complete in every file"""
+        counts = [
+            self._file_rows('vectors.bin', self._row_bytes(dim)),
+            self._file_rows('ids.bin', ID_BYTES),
+        ]
+        if self.dtype == 'uint8':
+            counts.append(self._file_rows('scales.bin', 4))
+        return min(counts)
+
+    @property
+    def tombstones(self):
+        """Ids deleted since the store was last rewritten"""
+        return self._file_rows('deleted.bin', ID_BYTES)
+
+    def load(self):
+        """Return (ids, float32 matrix) of the live vectors, or None if there is no usable store"""
+        with self._locked():
+            meta = self._usable_meta()
+            if meta is None:
+                return None
+            dim = meta['dim']
+            count = 0 if dim is None else self._count(dim)
+            tombstones = self.tombstones
+            self._position = (meta.get('generation'), count, tombstones)
+            if count == 0:
+                return [], np.empty((0, dim or 0), dtype=np.float32)
+
+            id_records, matrix = self._read_rows(dim, 0, count, mapped=True)
+            if tombstones:
+                deleted = self._read_ids('deleted.bin', 0, tombstones)
+                live = ~np.isin(id_records, deleted)
+                id_records, matrix = id_records[live], matrix[live]
+        return decode_ids(id_records), matrix
+
+    def changes(self):
+        """(ids, float32 matrix, deleted ids) written since the last load or changes call.
+
+        Covers appends and deletes made by any process, including this one.
+        Returns None when the store was rewritten since: the caller should
+        load it again. Nothing is reported while this instance has neither
+        loaded nor rewritten the store, or when it is unusable.
+        """
+        with self._locked():
+            meta = self._usable_meta()
+            if meta is None or self._position is None:
+                return [], np.empty((0, 0), dtype=np.float32), []
+            generation, seen_rows, seen_tombstones = self._position
+            if generation != meta.get('generation'):
+                return None
+            dim = meta['dim']
+            count = 0 if dim is None else self._count(dim)
+            tombstones = self.tombstones
+            if count > seen_rows:
+                id_records, matrix = self._read_rows(dim, seen_rows, count - seen_rows)
+            else:
+                id_records, matrix = np.empty(0, dtype=f'S{ID_BYTES}'), np.empty((0, dim or 0), dtype=np.float32)
+            deleted = self._read_ids('deleted.bin', seen_tombstones, tombstones - seen_tombstones)
+            self._position = (generation, count, tombstones)
+        return decode_ids(id_records), matrix, decode_ids(deleted)
+
+    def _read_ids(self, name, start, count):
+        if count <= 0:
+            return np.empty(0, dtype=f'S{ID_BYTES}')
+        return np.fromfile(self._path(name), dtype=f'S{ID_BYTES}', count=count, offset=start * ID_BYTES)
+
+    def _read_rows(self, dim, start, count, mapped=False):
+        """Id records and float32 vectors of `count` rows from row `start` on"""
+        row_dtype = STORE_DTYPES[self.dtype]
+        offset = start * self._row_bytes(dim)
+        if mapped:
+            # A rewrite replaces the files, so this mapping keeps the version read here
+            vectors = np.memmap(
+                self._path('vectors.bin'), dtype=row_dtype, mode='c', shape=(count, dim), offset=offset
+            )
+        else:
+            vectors = np.fromfile(
+                self._path('vectors.bin'), dtype=row_dtype, count=count * dim, offset=offset
+            ).reshape(count, dim)
+        if self.dtype == 'uint8':
+            scales = np.fromfile(self._path('scales.bin'), dtype=np.float32, count=count, offset=start * 4)
+            matrix = vectors * scales[:, None]
+        elif self.dtype == 'float16':
+            matrix = vectors.astype(np.float32)
+        else:
+            matrix = vectors
+        return self._read_ids('ids.bin', start, count), matrix
+
+    def _encode_rows(self, vectors):
+        """(row bytes, scale bytes or None) for vectors in the store dtype"""
+        if self.dtype == 'uint8':
+            codes, scales = quantize_uint8(vectors)
+            return codes.tobytes(), scales.tobytes()
+        return np.asarray(vectors, dtype=STORE_DTYPES[self.dtype]).tobytes(), None
+
+    def rewrite(self, ids, vectors):
+        """Replace the whole store (drops tombstones); readers keep their old mapping.
+
+        An empty store leaves the dimension open until the first append.
+        """
+        with self._locked():
+            generation = self._write_all(ids, vectors)
+            self._position = (generation, len(ids), 0)
+
+    def _write_all(self, ids, vectors):
+        dim = None
+        if len(ids):
+            vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+            dim = vectors.shape[1]
+            rows, scales = self._encode_rows(vectors)
+        else:
+            rows, scales = b'', (b'' if self.dtype == 'uint8' else None)
+        files = {'vectors.bin': rows, 'ids.bin': encode_ids(ids).tobytes(), 'deleted.bin': b''}
+        if scales is not None:
+            files['scales.bin'] = scales
+        generation = uuid.uuid4().hex
+        meta = {
+            'version': FORMAT_VERSION, 'dtype': self.dtype, 'dim': dim, 'id_bytes': ID_BYTES,
+            'generation': generation,
+        }
+        files['meta.json'] = json.dumps(meta).encode()
+        for name, data in files.items():
+            self._replace(name, data)
+        return generation
+
+    def _replace(self, name, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, self._path(name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def append(self, ids, vectors):
+        """Add vectors at the end of the store without rewriting it"""
+        if not ids:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        with self._locked():
+            meta = self._usable_meta()
+            if meta is None:
+                raise ValueError("Feature store is missing or in another format; rewrite it first")
+            if meta['dim'] is None:
+                # The caller has these rows; changes() reports them like any append
+                generation = self._write_all(ids, vectors)
+                if self._position is not None and self._position[0] == meta.get('generation'):
+                    self._position = (generation, 0, 0)
+                return
+            if vectors.shape[1] != meta['dim']:
+                raise ValueError(f"Expected vectors of dimension {meta['dim']}, got {vectors.shape[1]}")
+
+            rows, scales = self._encode_rows(vectors)
+            count = self._count(meta['dim'])
+            self._append_file('vectors.bin', count * self._row_bytes(meta['dim']), rows)
+            if scales is not None:
+                self._append_file('scales.bin', count * 4, scales)
+            # The id goes last: a row only counts once its id is written
+            self._append_file('ids.bin', count * ID_BYTES, encode_ids(ids).tobytes())
+
+    def delete(self, ids):
+        """Mark ids as deleted; they are skipped on load and dropped by the next rewrite"""
+        if not ids:
+            return
+        with self._locked():
+            if self._usable_meta() is None:
+                return
+            tombstones = self.tombstones
+            self._append_file('deleted.bin', tombstones * ID_BYTES, encode_ids(ids).tobytes())
+
+    def _append_file(self, name, size, data):
+        """Cut the file back to `size` bytes (a torn earlier append) and append data"""
+        with open(self._path(name), 'ab') as file:
+            file.truncate(size)
+            file.write(data)
+
+    @contextmanager
+    def _locked(self):
+        """In-process lock plus an advisory file lock shared by worker processes"""
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(self._path('.lock'), 'wb') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
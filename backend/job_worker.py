@@ -0,0 +1,30 @@
+"""Standalone worker for /api/jobs comparisons.
+
+Runs the same job loop the API server embeds, in its own process with its
+own face process pool, so job throughput scales separately from request
+handling. Start as many as needed and set JOB_WORKERS_EMBEDDED=false on the
+API servers to leave all job processing to them:
+
+    python job_worker.py
+"""
+import asyncio
+import logging
+
+from server import client, ensure_job_indexes, run_job_workers, shutdown_process_pool, JOB_CONCURRENCY
+
+logger = logging.getLogger("job_worker")
+
+async def main():
+    await ensure_job_indexes()
+    logger.info(f"Job worker started ({JOB_CONCURRENCY} concurrent jobs)")
+    try:
+        await run_job_workers()
+    finally:
+        shutdown_process_pool()
+        client.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
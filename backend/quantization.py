@@ -0,0 +1,39 @@
+import numpy as np
+
+# Codes are symmetric int8 in [-127, 127], so any sign of feature works
+INT8_LEVELS = 127
+
+def quantize_int8(vectors):
+    """Per-row int8 codes and float32 scales; row ~= codes * scale"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = (np.abs(vectors).max(axis=1) / INT8_LEVELS).astype(np.float32)
+    safe_scales = np.where(scales > 0, scales, 1)
+    codes = np.rint(vectors / safe_scales[:, None]).astype(np.int8)
+    return codes, scales
+
+def dequantize_int8(codes, scales):
+    """Float32 approximation of quantized rows"""
+    return codes.astype(np.float32) * scales[:, None]
+
+def int8_scores(codes, scales, query):
+    """Approximate dot products of quantized rows with a float query.
+
+    The query is quantized the same way and the products are accumulated
+    in int32 (256 * 127 * 127 fits easily); only the result is rescaled.
+    """
+    query_codes, (query_scale,) = quantize_int8(query)
+    dots = np.einsum('ij,j->i', codes, query_codes[0], dtype=np.int32)
+    return dots.astype(np.float32) * (scales * query_scale)
+
+def rerank(query, candidates, vectors, k):
+    """Exact top-k of quantized search candidates.
+
+    candidates are (id, approximate score) pairs and vectors maps ids to
+    their float vectors; candidates without a vector are dropped.
+    """
+    ids = [item_id for item_id, _ in candidates if item_id in vectors]
+    if not ids:
+        return []
+    scores = np.vstack([vectors[item_id] for item_id in ids]).astype(np.float32) @ np.asarray(query, dtype=np.float32)
+    order = np.argsort(-scores, kind='stable')[:k]
+    return [(ids[i], float(scores[i])) for i in order]
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+def request_fingerprint(keys, **options):
+    """SHA-256 over the ordered upload content hashes and the options that shape the response"""
+    payload = json.dumps([list(keys), sorted(options.items())], separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class ResultCache:
+    """Responses of recent requests, by request fingerprint.
+
+    An in-process LRU tier bounded by the size of the serialized responses
+    sits in front of a MongoDB collection; entries expire after ttl_seconds
+    in both. A request whose fingerprint is already being computed waits
+    for that computation instead of starting its own.
+    """
+
+    def __init__(self, collection=None, ttl_seconds=600, max_bytes=64 * 1024 * 1024):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size_bytes = 0
+        self._pending = {}
+        self.memory_hits = 0
+        self.mongo_hits = 0
+        self.merged = 0
+        self.misses = 0
+
+    def _remember(self, fingerprint, response, size, expires_at):
+        """Insert into the LRU tier, evicting the least recently used entries"""
+        if fingerprint in self._entries:
+            self._size_bytes -= self._entries.pop(fingerprint)[1]
+        if size > self.max_bytes:
+            return
+        self._entries[fingerprint] = (response, size, expires_at)
+        self._size_bytes += size
+        while self._size_bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._size_bytes -= evicted_size
+
+    async def get(self, fingerprint):
+        """The stored response for a fingerprint, or None"""
+        entry = self._entries.get(fingerprint)
+        if entry is not None:
+            response, size, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(fingerprint)
+                self.memory_hits += 1
+                return response
+            del self._entries[fingerprint]
+            self._size_bytes -= size
+
+        if self.collection is not None:
+            try:
+                # The TTL monitor only runs once a minute, so check expiry here too
+                document = await self.collection.find_one(
+                    {"_id": fingerprint, "expires_at": {"$gt": datetime.utcnow()}}
+                )
+            except Exception as e:
+                logger.warning(f"Result cache lookup failed: {str(e)}")
+                document = None
+            if document is not None:
+                response = json.loads(document["response"])
+                remaining = (document["expires_at"] - datetime.utcnow()).total_seconds()
+                self._remember(fingerprint, response, len(document["response"]), time.monotonic() + remaining)
+                self.mongo_hits += 1
+                return response
+        return None
+
+    async def put(self, fingerprint, response):
+        """Store a JSON-serializable response in both tiers"""
+        text = json.dumps(response, separators=(',', ':'))
+        self._remember(fingerprint, response, len(text), time.monotonic() + self.ttl_seconds)
+        if self.collection is not None:
+            try:
+                await self.collection.replace_one(
+                    {"_id": fingerprint},
+                    {
+                        "_id": fingerprint,
+                        "response": text,
+                        "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds),
+                    },
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"Result cache write failed: {str(e)}")
+
+    async def get_or_compute(self, fingerprint, compute):
+        """The stored response, the one of an identical request in flight, or compute()'s.
+
+        The computation runs in its own task, so a waiting duplicate still
+        gets the response if the request that started it goes away. Failures
+        are not stored; every waiter gets the same exception.
+        """
+        task = self._pending.get(fingerprint)
+        if task is None:
+            response = await self.get(fingerprint)
+            if response is not None:
+                return response
+            # Checked again: an identical request may have started while MongoDB was read
+            task = self._pending.get(fingerprint)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._compute(fingerprint, compute))
+            self._pending[fingerprint] = task
+        else:
+            self.merged += 1
+        return await asyncio.shield(task)
+
+    async def _compute(self, fingerprint, compute):
+        try:
+            response = await compute()
+            await self.put(fingerprint, response)
+            return response
+        finally:
+            self._pending.pop(fingerprint, None)
+
+    async def ensure_indexes(self):
+        """TTL index so expired responses are removed from MongoDB"""
+        if self.collection is not None:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def stats(self):
+        """Hit/miss counters and current size of the in-process tier"""
+        lookups = self.memory_hits + self.mongo_hits + self.merged + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self._size_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "memory_hits": self.memory_hits,
+            "mongo_hits": self.mongo_hits,
+            "merged": self.merged,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.mongo_hits + self.merged) / lookups if lookups else 0.0,
+        }
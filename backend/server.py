@@ -1,5 +1,5 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -7,33 +7,172 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
+import io
 import uuid
-from datetime import datetime
-import cv2
+import socket
+import json
+import hashlib
+import asyncio
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import numpy as np
-from PIL import Image
-import io
-import base64
-from sklearn.metrics.pairwise import cosine_similarity
+from bson.binary import Binary
+from pymongo import ReplaceOne, ReturnDocument
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+from face_processing import (
+    FACE_WORKERS,
+    analysis_settings,
+    analyze_image,
+    analyze_images,
+    check_face_detector,
+    get_process_pool,
+    largest_face_index,
+    score_features,
+    stack_features,
+    shutdown_process_pool,
+    thumbnail_data_uri,
+)
+from face_cache import FaceCache, analysis_key
+from feature_extractors import FEATURE_EXTRACTOR, available_extractors, extractor_identity, get_feature_extractor
+from vector_index import VectorIndex
+from metrics import MetricsRegistry
+from clustering import cluster_features, group_labels
+from feature_store import FeatureStore
+from quantization import rerank
+from result_cache import ResultCache, request_fingerprint
+from thumbnail_store import create_thumbnail_store, is_thumbnail_key, thumbnail_media_type
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Content-addressed cache of image analyses (in-process LRU backed by MongoDB,
+# where entries expire FACE_CACHE_TTL_SECONDS after they were written)
+face_cache = FaceCache(
+    collection=db.face_cache if os.environ.get('FACE_CACHE_PERSIST', 'true').lower() == 'true' else None,
+    max_bytes=int(os.environ.get('FACE_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+    ttl_seconds=int(os.environ.get('FACE_CACHE_TTL_SECONDS', 30 * 24 * 60 * 60))
+)
+
+# Responses of recent identical /compare-faces requests (same uploads in the
+# same order and same options), kept for RESULT_CACHE_TTL_SECONDS (0 = off)
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get('RESULT_CACHE_TTL_SECONDS', 600))
+result_cache = ResultCache(
+    collection=db.result_cache if os.environ.get('RESULT_CACHE_PERSIST', 'true').lower() == 'true' else None,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+    max_bytes=int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+)
+
+# Content-addressed thumbnail storage served by /api/thumbnails/{hash}
+thumbnail_store = create_thumbnail_store()
+
+# Clustering: default link threshold (similarity percentage) and working
+# memory for the blocked pairwise scoring
+CLUSTER_THRESHOLD = float(os.environ.get('CLUSTER_THRESHOLD', 95.0))
+CLUSTER_MEMORY_BYTES = int(os.environ.get('CLUSTER_MEMORY_MB', 256)) * 1024 * 1024
+
+# Images accepted by one /cluster request (Starlette's form parser stops at 1000 files by default)
+MAX_CLUSTER_IMAGES = int(os.environ.get('MAX_CLUSTER_IMAGES', 20000))
+
+# Reference photos accepted by /compare-faces/multi
+MAX_BASE_IMAGES = 20
+
+# Upload ingestion: images decoded/analysed at once per request and read chunk size
+MAX_INFLIGHT_IMAGES = max(1, int(os.environ.get('MAX_INFLIGHT_IMAGES', 2 * max(1, FACE_WORKERS))))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Uncached uploads of a request analysed together in one pool task, so a DNN
+# detector (FACE_DETECTOR) runs them as one batch; 1 analyses images one by one
+DETECTION_BATCH_SIZE = max(1, int(os.environ.get('DETECTION_BATCH_SIZE', 1)))
+
+# Enrolled gallery faces, searched through an in-memory vector index
+GALLERY_SEARCH_MODE = os.environ.get('GALLERY_SEARCH_MODE', 'exact')
+gallery_index = VectorIndex(
+    nprobe=int(os.environ.get('GALLERY_IVF_NPROBE', 8)),
+    quantized=os.environ.get('GALLERY_QUANTIZED', 'false').lower() == 'true'
+)
+# Candidates per requested match re-ranked with the float vectors when quantized
+GALLERY_RERANK_FACTOR = max(1, int(os.environ.get('GALLERY_RERANK_FACTOR', 4)))
+
+# Fail at startup, not on the first image, if FEATURE_EXTRACTOR or
+# FACE_DETECTOR (e.g. a DNN backend without DNN_DETECTOR_MODEL) is unusable
+get_feature_extractor()
+check_face_detector()
+
+# Binary copy of the gallery vectors, memory-mapped at startup instead of
+# reading every document from MongoDB (which stays the source of truth); the
+# gallery holds the faces enrolled with the default feature extractor (and
+# model, see extractor_identity)
+gallery_store = FeatureStore(
+    Path(os.environ.get('GALLERY_STORE_DIR', ROOT_DIR / 'gallery_store')) / extractor_identity(),
+    dtype=os.environ.get('GALLERY_STORE_DTYPE', 'float32')
+)
+# Searches first catch up with what other workers wrote to the store
+gallery_refresh_lock = asyncio.Lock()
+
+# Asynchronous comparison jobs: how long jobs (and their uploads) are kept,
+# whether this process runs job workers and how they poll and lease jobs
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 24 * 60 * 60))
+JOB_WORKERS_EMBEDDED = os.environ.get('JOB_WORKERS_EMBEDDED', 'true').lower() == 'true'
+JOB_CONCURRENCY = max(1, int(os.environ.get('JOB_CONCURRENCY', 1)))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+JOB_HEARTBEAT_INTERVAL = max(1.0, JOB_LEASE_SECONDS / 5)
+JOB_PROGRESS_INTERVAL = 1.0
+
+# Job images are stored one per MongoDB document, which BSON caps at 16 MB
+JOB_MAX_IMAGE_BYTES = 15 * 1024 * 1024
+
+# Comparison sessions: the base image is sent once and comparison images in
+# chunks of up to MAX_CHUNK_IMAGES, each analysed as it arrives, up to
+# MAX_SESSION_IMAGES per session; sessions expire SESSION_TTL_SECONDS after creation
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', 24 * 60 * 60))
+MAX_SESSION_IMAGES = int(os.environ.get('MAX_SESSION_IMAGES', 10000))
+MAX_CHUNK_IMAGES = 250
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Comparison images are matched by their largest face, or with 'all' by the
+# best of every face detected in them
+FACE_MATCH_MODE = os.environ.get('FACE_MATCH_MODE', 'largest')
+FACE_MATCH_MODES = ('largest', 'all')
+
+# Prometheus-style metrics served by /api/metrics
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    'face_stage_seconds', 'Time spent in each pipeline stage (worker and server side)', ['stage']
+)
+request_seconds = metrics.histogram(
+    'face_request_seconds', 'Time to process a request, until the last byte for streams', ['endpoint']
+)
+requests_in_flight = metrics.gauge('face_requests_in_flight', 'Requests being processed', ['endpoint'])
+images_in_flight = metrics.gauge('face_images_in_flight', 'Images being read or analysed in the process pool')
+images_total = metrics.counter(
+    'face_images_total', 'Images analysed, by outcome (face_found, no_face, error)', ['outcome']
+)
+images_rejected_total = metrics.counter(
+    'face_images_rejected_total',
+    'Analysed (not cached) images without a face, by the stage that rejected them (prescreen, detect)',
+    ['stage']
+)
+request_errors_total = metrics.counter(
+    'face_request_errors_total', 'Requests that failed, by endpoint and status code', ['endpoint', 'status']
+)
+
+# Stages timed inside the pool workers (see analyze_image)
+IMAGE_STAGES = ('prescreen', 'decode', 'thumbnail', 'detect', 'features')
+
 # Create the main app without a prefix
 app = FastAPI()
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Load OpenCV face detector
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-
 # Define Models
 class StatusCheck(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -47,129 +186,932 @@ class FaceComparisonResult(BaseModel):
     image_index: int
     similarity_percentage: float
     has_face: bool
-    image_data: Optional[str] = None  # Base64 encoded image
+    image_data: Optional[str] = None  # Base64 encoded image (inline_thumbnails only)
+    image_url: Optional[str] = None  # /api/thumbnails/{hash}
+    face_box: Optional[List[int]] = None  # x, y, w, h of the matched face
+    face_count: int = 0  # Faces detected in the image
     error_message: Optional[str] = None
 
 class ComparisonResponse(BaseModel):
     base_image_has_face: bool
-    base_image_data: Optional[str] = None  # Base64 encoded base image
+    base_image_data: Optional[str] = None  # Base64 encoded base image (inline_thumbnails only)
+    base_image_url: Optional[str] = None  # /api/thumbnails/{hash}
     results: List[FaceComparisonResult]
     total_images: int
+    matched_images: Optional[int] = None  # Images at or above min_similarity, before top_k
     processing_time: float
+    stage_timings: Optional[Dict[str, float]] = None  # Seconds per stage (include_timings only)
 
-def detect_faces(image_array):
-    """Detect faces in an image using OpenCV"""
-    try:
-        # Convert to grayscale
-        gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
-        
-        # Detect faces
-        faces = face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
+class ComparisonStreamBase(BaseModel):
+    type: str = "base"
+    base_image_has_face: bool
+    base_image_data: Optional[str] = None  # Base64 encoded base image (inline_thumbnails only)
+    base_image_url: Optional[str] = None  # /api/thumbnails/{hash}
+    total_images: int
+
+class ComparisonStreamSummary(BaseModel):
+    type: str = "summary"
+    ordering: List[int]  # image_index values sorted by similarity (highest first)
+    total_images: int
+    processing_time: float
+    stage_timings: Optional[Dict[str, float]] = None  # Seconds per stage (include_timings only)
+
+class BaseImageResult(BaseModel):
+    image_index: int
+    has_face: bool
+    image_data: Optional[str] = None  # Base64 encoded image (inline_thumbnails only)
+    image_url: Optional[str] = None  # /api/thumbnails/{hash}
+    error_message: Optional[str] = None  # Set when the image cannot be used as a reference
+
+class MultiComparisonResult(FaceComparisonResult):
+    # similarity_percentage is the maximum over the usable base images
+    mean_similarity: float = 0.0  # Mean over the usable base images
+    best_base_index: Optional[int] = None  # Base image giving the maximum
+
+class MultiComparisonResponse(BaseModel):
+    base_images: List[BaseImageResult]
+    results: List[MultiComparisonResult]
+    similarity_matrix: List[Optional[List[float]]]  # [base index][image_index], None for unusable bases
+    total_images: int
+    matched_images: Optional[int] = None  # Images at or above min_similarity, before top_k
+    processing_time: float
+    stage_timings: Optional[Dict[str, float]] = None  # Seconds per stage (include_timings only)
+
+class ImageCluster(BaseModel):
+    size: int
+    image_indexes: List[int]  # Upload order, lowest first
+
+class ClusterResponse(BaseModel):
+    clusters: List[ImageCluster]  # Largest first
+    unclustered: List[int]  # Images with a face but no match above the threshold
+    no_face: List[int]  # Images without a usable face (or that failed to process)
+    total_images: int
+    threshold: float
+    processing_time: float
+
+class GalleryCluster(BaseModel):
+    size: int
+    face_ids: List[str]
+
+class GalleryClusterResponse(BaseModel):
+    clusters: List[GalleryCluster]  # Largest first
+    unclustered: int  # Enrolled faces with no match above the threshold
+    gallery_size: int
+    threshold: float
+    processing_time: float
+
+class ExtractorInfo(BaseModel):
+    name: str
+    dim: int
+    default: bool
+
+class JobCreated(BaseModel):
+    job_id: str
+    status: str
+    total_images: int
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str  # queued, running, completed or failed
+    total_images: int
+    processed: int
+    base_image_has_face: Optional[bool] = None
+    base_image_data: Optional[str] = None  # Base64 encoded base image (inline_thumbnails only)
+    base_image_url: Optional[str] = None  # /api/thumbnails/{hash}
+    results: List[FaceComparisonResult]  # Completion order while running, by similarity once completed
+    processing_time: Optional[float] = None
+    error_message: Optional[str] = None
+    created_at: datetime
+    expires_at: datetime
+
+class SessionCreated(BaseModel):
+    session_id: str
+    base_image_has_face: bool
+    base_image_data: Optional[str] = None  # Base64 encoded base image (inline_thumbnails only)
+    base_image_url: Optional[str] = None  # /api/thumbnails/{hash}
+    max_images: int
+    expires_at: datetime
+
+class SessionChunk(BaseModel):
+    session_id: str
+    start_index: int  # image_index of the first image of the chunk
+    received: int
+    next_index: int  # image_index the next chunk starts at
+    processing_time: float
+
+class SessionStatus(BaseModel):
+    session_id: str
+    total_images: int  # Comparison images analysed so far
+    next_index: int
+    match_faces: str
+    extractor: str
+    created_at: datetime
+    expires_at: datetime
+
+class GalleryFace(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    label: Optional[str] = None
+    filename: Optional[str] = None
+    content_hash: str
+    face_box: List[int]  # x, y, w, h of the face used for the features
+    image_url: Optional[str] = None  # /api/thumbnails/{hash}
+    extractor: str = "histogram"  # Feature extractor (and model, see extractor_identity) of the stored vector
+    enrolled_at: datetime = Field(default_factory=datetime.utcnow)
+
+class EnrollResult(BaseModel):
+    filename: Optional[str] = None
+    enrolled: bool
+    face: Optional[GalleryFace] = None
+    error_message: Optional[str] = None
+
+class EnrollResponse(BaseModel):
+    results: List[EnrollResult]
+    enrolled: int
+    gallery_size: int
+
+class SearchMatch(BaseModel):
+    face: GalleryFace
+    similarity_percentage: float
+
+class SearchResponse(BaseModel):
+    probe_has_face: bool
+    probe_image_data: Optional[str] = None  # Base64 encoded probe image (inline_thumbnails only)
+    probe_image_url: Optional[str] = None  # /api/thumbnails/{hash}
+    matches: List[SearchMatch]
+    gallery_size: int
+    mode: str
+    processing_time: float
+    stage_timings: Optional[Dict[str, float]] = None  # Seconds per stage (include_timings only)
+
+def get_base_features(analysis):
+    """Validate the base image analysis and return its feature vector"""
+    if analysis['error'] is not None:
+        raise HTTPException(status_code=400, detail=analysis['error_detail'])
+    
+    if not analysis['has_face']:
+        raise HTTPException(
+            status_code=400, 
+            detail="Nenhum rosto detectado na imagem base. Por favor, envie uma imagem com pelo menos um rosto visível."
         )
-        
-        return len(faces) > 0, faces
-    except Exception as e:
-        return False, []
+    
+    if analysis['features'] is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Não foi possível extrair características da face na imagem base."
+        )
+    
+    return analysis['features']
 
-def extract_face_features(image_array, faces):
-    """Extract simple features from detected faces"""
-    try:
-        if len(faces) == 0:
-            return None
-            
-        # Get the largest face
-        largest_face = max(faces, key=lambda f: f[2] * f[3])
-        x, y, w, h = largest_face
-        
-        # Extract face region
-        face_region = image_array[y:y+h, x:x+w]
-        
-        # Resize to standard size for comparison
-        face_resized = cv2.resize(face_region, (128, 128))
+def thumbnail_url(analysis):
+    """URL of an analysis thumbnail in the thumbnail store"""
+    if analysis['thumbnail_key'] is None:
+        return None
+    return f"/api/thumbnails/{analysis['thumbnail_key']}"
+
+def thumbnail_fields(analysis, inline_thumbnails=False):
+    """image_data (only when inlining) and image_url for an analysis"""
+    image_data = None
+    if inline_thumbnails and analysis['thumbnail'] is not None:
+        image_data = thumbnail_data_uri(analysis['thumbnail'])
+    return image_data, thumbnail_url(analysis)
+
+def build_comparison_result(image_index, analysis, similarity=0.0, inline_thumbnails=False,
+                            face_index=None):
+    """Turn a worker analysis of a comparison image into a FaceComparisonResult"""
+    if analysis['error'] is not None:
+        return FaceComparisonResult(
+            image_index=image_index,
+            similarity_percentage=0.0,
+            has_face=False,
+            image_data=None,
+            error_message=f"Erro ao processar imagem: {analysis['error']}"
+        )
+    
+    image_data, image_url = thumbnail_fields(analysis, inline_thumbnails)
+    
+    if not analysis['has_face']:
+        return FaceComparisonResult(
+            image_index=image_index,
+            similarity_percentage=0.0,
+            has_face=False,
+            image_data=image_data,
+            image_url=image_url,
+            error_message="Nenhum rosto detectado nesta imagem"
+        )
+    
+    if analysis['features'] is None:
+        return FaceComparisonResult(
+            image_index=image_index,
+            similarity_percentage=0.0,
+            has_face=True,
+            image_data=image_data,
+            image_url=image_url,
+            face_count=len(analysis['faces']),
+            error_message="Não foi possível extrair características da face"
+        )
+    
+    return FaceComparisonResult(
+        image_index=image_index,
+        similarity_percentage=similarity,
+        has_face=True,
+        image_data=image_data,
+        image_url=image_url,
+        face_box=analysis['faces'][face_index] if face_index is not None else None,
+        face_count=len(analysis['faces'])
+    )
+
+def check_extractor(extractor):
+    if extractor not in available_extractors():
+        raise HTTPException(
+            status_code=400, detail=f"extractor deve ser um de: {', '.join(available_extractors())}"
+        )
+
+def check_match_mode(match_mode):
+    if match_mode not in FACE_MATCH_MODES:
+        raise HTTPException(status_code=400, detail="match_faces deve ser 'largest' ou 'all'")
+
+def check_selection(top_k, min_similarity):
+    if top_k is not None and top_k < 1:
+        raise HTTPException(status_code=400, detail="top_k deve ser pelo menos 1")
+    if not 0 <= min_similarity <= 100:
+        raise HTTPException(status_code=400, detail="min_similarity deve estar entre 0 e 100")
+
+def select_results(similarities, top_k=None, min_similarity=0.0):
+    """Indexes of the images to return, best first (ties keep upload order).
+
+    Images below min_similarity are dropped and, with top_k, only the best
+    top_k are kept: a partial selection (np.partition) finds the cut-off
+    score, so only the kept images are sorted and built into results.
+    Returns the indexes and the number of images at or above min_similarity.
+    """
+    scores = np.asarray(similarities, dtype=np.float64)
+    candidates = np.flatnonzero(scores >= min_similarity)
+    matched = len(candidates)
+    if top_k is not None and top_k < matched:
+        candidate_scores = scores[candidates]
+        cutoff = np.partition(candidate_scores, matched - top_k)[matched - top_k]
+        above = candidates[candidate_scores > cutoff]
+        ties = candidates[candidate_scores == cutoff][:top_k - len(above)]
+        candidates = np.concatenate([above, ties])
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order].tolist(), matched
+
+def match_matrix(base_matrix, analyses, match_mode='largest', timings=None):
+    """Score comparison analyses against one or more base faces in one batch.
+
+    With match_mode 'largest' each image contributes its largest face; with
+    'all' every detected face goes into the same matrix product and the best
+    one per image is kept. Returns an (n_bases, n_images) similarity array and
+    the matching array of indexes in analysis['faces'] of the matched faces
+    (-1 for images without features).
+    """
+    base_matrix = np.atleast_2d(np.asarray(base_matrix, dtype=np.float32))
+    with timed_stage('scoring', timings):
+        similarities = np.zeros((len(base_matrix), len(analyses)), dtype=np.float32)
+        face_indexes = np.full((len(base_matrix), len(analyses)), -1, dtype=np.int64)
+        rows, owners, row_faces = [], [], []
+        for i, analysis in enumerate(analyses):
+            if analysis['features'] is None:
+                continue
+            face_features = analysis.get('face_features')
+            if match_mode == 'all' and face_features is not None:
+                rows.append(face_features)
+                owners.extend([i] * len(face_features))
+                row_faces.extend(range(len(face_features)))
+            else:
+                rows.append(analysis['features'])
+                owners.append(i)
+                row_faces.append(largest_face_index(analysis['faces']))
         
-        # Convert to grayscale and normalize
-        if len(face_resized.shape) == 3:
-            face_gray = cv2.cvtColor(face_resized, cv2.COLOR_RGB2GRAY)
-        else:
-            face_gray = face_resized
+        if rows:
+            scores = score_features(base_matrix, stack_features(rows))
             
-        # Calculate simple histogram features
-        hist = cv2.calcHist([face_gray], [0], None, [256], [0, 256])
-        features = hist.flatten()
-        
-        # Normalize features
-        features = features / (np.linalg.norm(features) + 1e-6)
-        
-        return features
+            # Rows are grouped by image: reduce each image's run of columns,
+            # keeping the first row that reaches the maximum
+            owner_array = np.asarray(owners)
+            starts = np.flatnonzero(np.r_[True, owner_array[1:] != owner_array[:-1]])
+            counts = np.diff(np.r_[starts, len(owners)])
+            best = np.maximum.reduceat(scores, starts, axis=1)
+            positions = np.where(
+                scores == np.repeat(best, counts, axis=1), np.arange(len(owners)), len(owners)
+            )
+            best_rows = np.minimum.reduceat(positions, starts, axis=1)
+            
+            images = owner_array[starts]
+            similarities[:, images] = best
+            face_indexes[:, images] = np.asarray(row_faces)[best_rows]
+    return similarities, face_indexes
+
+def match_analyses(base_features, analyses, match_mode='largest', timings=None):
+    """match_matrix for one base face, as lists (face index None without features)"""
+    similarities, face_indexes = match_matrix(base_features, analyses, match_mode, timings)
+    return similarities[0].tolist(), [None if f < 0 else f for f in face_indexes[0].tolist()]
+
+@contextmanager
+def timed_stage(stage, timings=None):
+    """Time a server-side stage into the stage histogram (and a per-request dict)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+def stage_breakdown(analyses, server_timings):
+    """Per-request seconds per stage.
+
+    Worker stages are summed over the distinct images analysed for this
+    request (cache hits add nothing), so with several workers they can add up
+    to more than the wall-clock processing_time.
+    """
+    totals = dict.fromkeys(IMAGE_STAGES, 0.0)
+    for analysis in {id(analysis): analysis for analysis in analyses}.values():
+        for stage, seconds in (analysis.get('timings') or {}).items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+    totals.update(server_timings)
+    return {stage: round(seconds, 6) for stage, seconds in totals.items()}
+
+def record_analysis(analysis):
+    """Count an image outcome and, for a fresh analysis, its rejection stage and worker stage timings.
+
+    Cached analyses (from either tier) have no timings: no stage ran for them.
+    """
+    if analysis['error'] is not None:
+        outcome = 'error'
+    elif analysis['has_face']:
+        outcome = 'face_found'
+    else:
+        outcome = 'no_face'
+    images_total.inc(outcome=outcome)
+    if not analysis.get('timings'):
+        return
+    if analysis.get('rejected_at') is not None:
+        images_rejected_total.inc(stage=analysis['rejected_at'])
+    for stage, seconds in analysis['timings'].items():
+        stage_seconds.observe(seconds, stage=stage)
+
+def request_started(endpoint):
+    """Mark a request as in flight; returns its monotonic start time"""
+    requests_in_flight.inc(endpoint=endpoint)
+    return time.perf_counter()
+
+def request_finished(endpoint, start_time, status_code=200):
+    """Record the duration (and failure) of a request started with request_started"""
+    requests_in_flight.dec(endpoint=endpoint)
+    request_seconds.observe(time.perf_counter() - start_time, endpoint=endpoint)
+    if status_code >= 400:
+        request_errors_total.inc(endpoint=endpoint, status=str(status_code))
+
+@contextmanager
+def track_request(endpoint):
+    """Track a request in the metrics; yields its monotonic start time"""
+    start_time = request_started(endpoint)
+    status_code = 200
+    try:
+        yield start_time
+    except HTTPException as e:
+        status_code = e.status_code
+        raise
+    except Exception:
+        status_code = 500
+        raise
+    finally:
+        request_finished(endpoint, start_time, status_code)
+
+async def hash_comparison_uploads(base_image, comparison_images):
+    """Content hashes of the base image and the comparison images, in upload order"""
+    # Validate file count
+    if len(comparison_images) > 250:
+        raise HTTPException(status_code=400, detail="Maximum 250 images allowed")
+    return [await hash_upload(upload) for upload in [base_image] + list(comparison_images)]
+
+async def start_comparison(base_image, comparison_images, extractor=None, keys=None):
+    """Start the analysis of every uploaded image (cache or process pool).
+
+    keys are the hash_comparison_uploads hashes, if already computed.
+    Returns the base analysis, its features and one future per comparison
+    image (in upload order). Raises HTTPException if the base image is unusable.
+    """
+    if keys is None:
+        keys = await hash_comparison_uploads(base_image, comparison_images)
+    futures = await start_analyses(keys, [base_image] + list(comparison_images), extractor)
+    base_future, comp_futures = futures[0], futures[1:]
+    
+    try:
+        base_analysis = await base_future
+        base_features = get_base_features(base_analysis)
+    except Exception:
+        for future in comp_futures:
+            future.cancel()
+        raise
+    
+    return base_analysis, base_features, comp_futures
+
+async def hash_upload(upload):
+    """SHA-256 of an upload, read in chunks so the file is never fully in memory.
+
+    Each chunk is hashed in a thread (hashlib releases the GIL on large
+    buffers), keeping the event loop free while big uploads are hashed.
+    """
+    digest = hashlib.sha256()
+    await upload.seek(0)
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        await asyncio.to_thread(digest.update, chunk)
+    return digest.hexdigest()
+
+async def analyze_uploads(uploads, extractor=None):
+    """Start the analysis of several uploads as a bounded pipeline.
+
+    Uploads are hashed chunk by chunk, cached analyses are reused and each
+    remaining distinct image is read, analysed in the process pool and
+    released while holding one of MAX_INFLIGHT_IMAGES slots. Only the compact
+    analysis (features, boxes, thumbnail) outlives the slot, so peak memory
+    per request does not grow with the number of uploads.
+
+    Returns the content hashes and one future per upload (in upload order).
+    """
+    keys = [await hash_upload(upload) for upload in uploads]
+    return keys, await start_analyses(keys, uploads, extractor)
+
+async def start_analyses(keys, uploads, extractor=None):
+    """Start the analysis of uploads whose content hashes are already known.
+
+    With DETECTION_BATCH_SIZE above 1, the distinct uncached uploads are
+    analysed in batches of that size, each holding one of
+    MAX_INFLIGHT_IMAGES // DETECTION_BATCH_SIZE slots.
+    """
+    extractor = extractor or FEATURE_EXTRACTOR
+    identity, settings = extractor_identity(extractor), analysis_settings()
+    cache_keys = [analysis_key(key, identity, settings) for key in keys]
+    cached = await face_cache.get_many(cache_keys)
+    slots = asyncio.Semaphore(MAX_INFLIGHT_IMAGES)
+    futures_by_key = {}
+    batched = []
+    for key, upload in zip(cache_keys, uploads):
+        if key not in futures_by_key:
+            if DETECTION_BATCH_SIZE > 1 and key not in cached:
+                futures_by_key[key] = None
+                batched.append((key, upload))
+            else:
+                futures_by_key[key] = asyncio.ensure_future(
+                    analyze_upload(key, upload, slots, cached.get(key), extractor)
+                )
+    
+    batch_slots = asyncio.Semaphore(max(1, MAX_INFLIGHT_IMAGES // DETECTION_BATCH_SIZE))
+    for start in range(0, len(batched), DETECTION_BATCH_SIZE):
+        items = batched[start:start + DETECTION_BATCH_SIZE]
+        batch = asyncio.ensure_future(analyze_upload_batch(items, batch_slots, extractor))
+        for i, (key, _) in enumerate(items):
+            futures_by_key[key] = asyncio.ensure_future(batch_item(batch, i))
+    
+    return [futures_by_key[key] for key in cache_keys]
+
+async def analyze_upload(key, upload, slots, cached_analysis=None, extractor=None):
+    """Return the cached analysis for an upload (under its analysis_key), or compute and cache it"""
+    if cached_analysis is not None:
+        analysis = cached_analysis
+    else:
+        loop = asyncio.get_running_loop()
+        async with slots:
+            with images_in_flight.track_inprogress():
+                await upload.seek(0)
+                content = await upload.read()
+                analysis = await loop.run_in_executor(get_process_pool(), analyze_image, content, extractor)
+                del content
         
+        await face_cache.put(key, analysis)
+    
+    record_analysis(analysis)
+    await store_thumbnail(analysis)
+    return analysis
+
+async def analyze_upload_batch(items, slots, extractor=None):
+    """Analyse several uncached (key, upload) pairs in one pool task and cache each analysis"""
+    loop = asyncio.get_running_loop()
+    async with slots:
+        images_in_flight.inc(len(items))
+        try:
+            contents = []
+            for _, upload in items:
+                await upload.seek(0)
+                contents.append(await upload.read())
+            analyses = await loop.run_in_executor(get_process_pool(), analyze_images, contents, extractor)
+            del contents
+        finally:
+            images_in_flight.dec(len(items))
+    
+    for (key, _), analysis in zip(items, analyses):
+        await face_cache.put(key, analysis)
+        record_analysis(analysis)
+        await store_thumbnail(analysis)
+    return analyses
+
+async def batch_item(batch, index):
+    return (await batch)[index]
+
+async def store_thumbnail(analysis):
+    """Make sure the analysis thumbnail is in the thumbnail store"""
+    if analysis['thumbnail'] is None:
+        return
+    try:
+        await asyncio.to_thread(thumbnail_store.put, analysis['thumbnail_key'], analysis['thumbnail'])
     except Exception as e:
-        return None
+        logger.warning(f"Could not store thumbnail: {str(e)}")
 
-def image_to_base64(image_array, max_size=(150, 150)):
-    """Convert image array to base64 string for frontend display"""
+def largest_face_box(analysis):
+    """Box of the face 'features' belongs to (the largest one)"""
+    return analysis['faces'][largest_face_index(analysis['faces'])]
+
+def gallery_query():
+    """Enrolled faces whose vectors come from the default feature extractor and model"""
+    if FEATURE_EXTRACTOR == "histogram":
+        # Faces enrolled before extractors were selectable have no 'extractor'
+        return {"extractor": {"$in": [None, "histogram"]}}
+    return {"extractor": extractor_identity()}
+
+async def read_gallery_vectors():
+    """Ids and feature matrix of every enrolled face, read from MongoDB"""
+    ids, vectors = [], []
+    async for document in db.gallery_faces.find(gallery_query(), {"_id": 0, "id": 1, "features": 1}):
+        ids.append(document["id"])
+        vectors.append(np.frombuffer(document["features"], dtype=np.float32))
+    return ids, (np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32))
+
+async def load_gallery_index():
+    """Fill the vector index from the feature store, or from MongoDB when the store is stale.
+
+    The store is trusted when it holds as many faces as the gallery_faces
+    collection; otherwise it is rebuilt from MongoDB.
+    """
+    expected = await db.gallery_faces.count_documents(gallery_query())
     try:
-        # Convert numpy array to PIL Image
-        if isinstance(image_array, np.ndarray):
-            image = Image.fromarray(image_array)
-        else:
-            image = image_array
-            
-        # Resize for thumbnail
-        image.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # Convert to base64
-        img_buffer = io.BytesIO()
-        image.save(img_buffer, format='JPEG', quality=80)
-        img_buffer.seek(0)
-        
-        img_str = base64.b64encode(img_buffer.getvalue()).decode()
-        return f"data:image/jpeg;base64,{img_str}"
-        
+        stored = await asyncio.to_thread(gallery_store.load)
     except Exception as e:
-        return None
+        logger.warning(f"Could not read gallery feature store: {str(e)}")
+        stored = None
+    
+    if stored is not None and len(stored[0]) == expected:
+        ids, matrix = stored
+        source = "feature store"
+        rebuild = gallery_store.tombstones > 0
+    else:
+        ids, matrix = await read_gallery_vectors()
+        source = "MongoDB"
+        rebuild = True
+    
+    await asyncio.to_thread(gallery_index.load, ids, matrix)
+    if rebuild:
+        try:
+            await asyncio.to_thread(gallery_store.rewrite, ids, matrix)
+        except Exception as e:
+            logger.warning(f"Could not write gallery feature store: {str(e)}")
+    logger.info(f"Loaded {len(ids)} gallery faces into the vector index from {source}")
+
+async def refresh_gallery_index():
+    """Apply the faces other worker processes enrolled or deleted since the index was loaded.
+
+    Rows appended to the feature store past the ones already read are added
+    to the index and new tombstones removed; if another process rewrote the
+    store, the index is reloaded from it.
+    """
+    async with gallery_refresh_lock:
+        try:
+            changes = await asyncio.to_thread(gallery_store.changes)
+            if changes is None:
+                stored = await asyncio.to_thread(gallery_store.load)
+                if stored is not None:
+                    await asyncio.to_thread(gallery_index.load, *stored)
+                return
+            ids, matrix, deleted = changes
+            # This process's own enrollments are already in the index
+            new_rows = [row for row, face_id in enumerate(ids) if face_id not in gallery_index]
+            if new_rows:
+                await asyncio.to_thread(gallery_index.add, [ids[row] for row in new_rows], matrix[new_rows])
+            for face_id in deleted:
+                gallery_index.remove(face_id)
+        except Exception as e:
+            logger.warning(f"Could not refresh gallery index from feature store: {str(e)}")
+
+def detach_upload(upload):
+    """Take over an upload's spooled file so it outlives the request handler.
+
+    FastAPI closes form files as soon as the endpoint returns, but a streaming
+    response keeps reading uploads afterwards; the caller must close the
+    detached copy with close_uploads.
+    """
+    detached = UploadFile(
+        file=upload.file, size=upload.size, filename=upload.filename, headers=upload.headers
+    )
+    upload.file = io.BytesIO()
+    return detached
+
+async def close_uploads(uploads):
+    """Close detached uploads"""
+    for upload in uploads:
+        await upload.close()
 
-def calculate_similarity(features1, features2):
-    """Calculate similarity between two feature vectors"""
+def comparison_fingerprint(keys, extractor, match_faces, inline_thumbnails, include_timings,
+                           top_k=None, min_similarity=0.0):
+    """Result cache fingerprint of a comparison (shared by /compare-faces and its stream)"""
+    return request_fingerprint(
+        keys, extractor=extractor_identity(extractor), analysis=analysis_settings(),
+        match_faces=match_faces, inline_thumbnails=inline_thumbnails,
+        include_timings=include_timings, top_k=top_k, min_similarity=min_similarity
+    )
+
+def ndjson_record(model):
+    """Serialize a model as one NDJSON line"""
+    return json.dumps(model.dict()) + "\n"
+
+async def stream_comparison(records, base_analysis, base_features, comp_futures,
+                            inline_thumbnails=False, include_timings=False, match_mode='largest'):
+    """Put the base record and one result record per finished image on `records`.
+
+    Returns the whole comparison in the /compare-faces layout (results best
+    first, ties in upload order), which is what the result cache stores and
+    replay_comparison turns back into records.
+    """
+    async def indexed(image_index, future):
+        return image_index, await future
+    
     try:
-        if features1 is None or features2 is None:
-            return 0.0
-            
-        # Reshape for cosine similarity
-        f1 = features1.reshape(1, -1)
-        f2 = features2.reshape(1, -1)
-        
-        # Calculate cosine similarity
-        similarity = cosine_similarity(f1, f2)[0][0]
+        base_image_data, base_image_url = thumbnail_fields(base_analysis, inline_thumbnails)
+        records.put_nowait(ndjson_record(ComparisonStreamBase(
+            base_image_has_face=True,
+            base_image_data=base_image_data,
+            base_image_url=base_image_url,
+            total_images=len(comp_futures)
+        )))
         
-        # Convert to percentage (0-100)
-        similarity_percentage = max(0, min(100, similarity * 100))
+        analyses = [base_analysis]
+        server_timings = {}
+        similarities = [0.0] * len(comp_futures)
+        results = {}
+        pending = [indexed(i, future) for i, future in enumerate(comp_futures)]
+        for next_done in asyncio.as_completed(pending):
+            i, analysis = await next_done
+            analyses.append(analysis)
+            (similarities[i],), (face_index,) = match_analyses(
+                base_features, [analysis], match_mode, server_timings
+            )
+            results[i] = build_comparison_result(i, analysis, similarities[i], inline_thumbnails, face_index)
+            records.put_nowait(json.dumps({"type": "result", **results[i].dict()}) + "\n")
         
-        return float(similarity_percentage)
+        ordering, matched = select_results(similarities)
+        return ComparisonResponse(
+            base_image_has_face=True,
+            base_image_data=base_image_data,
+            base_image_url=base_image_url,
+            results=[results[i] for i in ordering],
+            total_images=len(comp_futures),
+            matched_images=matched,
+            processing_time=0.0,
+            stage_timings=stage_breakdown(analyses, server_timings) if include_timings else None
+        ).dict()
+    finally:
+        # Stop pending work if the comparison was cancelled
+        for future in comp_futures:
+            future.cancel()
+
+def replay_comparison(response):
+    """Base and result records of a comparison computed for another request"""
+    yield ndjson_record(ComparisonStreamBase(
+        base_image_has_face=response["base_image_has_face"],
+        base_image_data=response["base_image_data"],
+        base_image_url=response["base_image_url"],
+        total_images=response["total_images"]
+    ))
+    for result in response["results"]:
+        yield json.dumps({"type": "result", **result}) + "\n"
+
+async def send_comparison(start_time, first_record, records, computation, cached):
+    """Yield the records of a streamed comparison, then its summary.
+
+    first_record is the base record when this request runs the comparison
+    (the rest follow as images finish), or None when the response comes
+    from the result cache or from an identical request, and is replayed.
+    """
+    status_code = 200
+    try:
+        if first_record is not None:
+            yield first_record
+            # computation puts None on `records` once it is done
+            while (record := await records.get()) is not None:
+                yield record
+        response = await computation
+        if first_record is None:
+            for record in replay_comparison(response):
+                yield record
         
+        yield ndjson_record(ComparisonStreamSummary(
+            ordering=[result["image_index"] for result in response["results"]],
+            total_images=response["total_images"],
+            processing_time=time.perf_counter() - start_time,
+            stage_timings=response["stage_timings"]
+        ))
     except Exception as e:
-        return 0.0
+        status_code = 500
+        yield json.dumps({"type": "error", "detail": f"Erro interno do servidor: {str(e)}"}) + "\n"
+    finally:
+        # A cached comparison is finished (and stored) for identical requests
+        # even if this client went away; otherwise stop its pending work
+        if not cached:
+            computation.cancel()
+        request_finished("compare-faces/stream", start_time, status_code)
 
-def process_uploaded_image(file_content):
-    """Process uploaded image and return numpy array"""
+class StoredUpload:
+    """Upload-like view of a job image kept in the job_uploads collection.
+
+    Only what analyze_upload needs: the bytes are fetched from MongoDB when
+    the image gets a slot in the bounded pipeline.
+    """
+
+    def __init__(self, job_id, key):
+        self.job_id = job_id
+        self.key = key
+
+    async def seek(self, offset):
+        pass
+
+    async def read(self):
+        document = await db.job_uploads.find_one({"job_id": self.job_id, "key": self.key})
+        if document is None:
+            raise RuntimeError("Imagem do job não encontrada")
+        return bytes(document["data"])
+
+async def ensure_job_indexes():
+    """TTL indexes so finished jobs and leftover uploads expire on their own"""
+    await db.jobs.create_index("expires_at", expireAfterSeconds=0)
+    await db.jobs.create_index([("status", 1), ("created_at", 1)])
+    await db.job_uploads.create_index("expires_at", expireAfterSeconds=0)
+    await db.job_uploads.create_index([("job_id", 1), ("key", 1)])
+
+async def claim_job():
+    """Atomically take the oldest queued job (or one whose worker stopped renewing its lease)"""
+    now = datetime.utcnow()
+    return await db.jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued"},
+            {"status": "running", "heartbeat_at": {"$lt": now - timedelta(seconds=JOB_LEASE_SECONDS)}},
+        ]},
+        # A reclaimed job starts over, so drop the partial results of the previous run
+        {"$set": {
+            "status": "running", "worker": WORKER_ID, "started_at": now, "heartbeat_at": now,
+            "processed": 0, "results": [],
+        }},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+class JobLeaseLost(Exception):
+    """The job was reclaimed by another worker after this one's lease expired"""
+
+def job_lease(job):
+    """Filter matching a job only while this claim of it still holds the lease.
+
+    The claim time tells apart two claims made by the same process, whose
+    job loops share WORKER_ID.
+    """
+    return {"_id": job["_id"], "worker": WORKER_ID, "started_at": job["started_at"]}
+
+async def update_job(job, update):
+    """Update a job under its lease; raises JobLeaseLost once another worker has it"""
+    result = await db.jobs.update_one(job_lease(job), update)
+    if result.matched_count == 0:
+        raise JobLeaseLost(f"Job {job['_id']} was reclaimed by another worker")
+
+async def renew_job_lease(job):
+    """Renew the lease every JOB_HEARTBEAT_INTERVAL seconds, independently of progress"""
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+        try:
+            await update_job(job, {"$set": {"heartbeat_at": datetime.utcnow()}})
+        except JobLeaseLost:
+            raise
+        except Exception as e:
+            logger.warning(f"Could not renew the lease of job {job['_id']}: {str(e)}")
+
+async def run_job(job):
+    """Run a claimed job while renewing its lease; stop it if the lease is lost"""
+    processing = asyncio.ensure_future(process_job(job))
+    lease = asyncio.ensure_future(renew_job_lease(job))
     try:
-        # Open image with PIL
-        image = Image.open(io.BytesIO(file_content))
+        await asyncio.wait([processing, lease], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        lease.cancel()
+        # Still running here only if the lease was lost or this worker is shutting down
+        processing.cancel()
+        await asyncio.gather(processing, lease, return_exceptions=True)
+    
+    if processing.cancelled() or isinstance(processing.exception(), JobLeaseLost):
+        # The new owner redoes the job and needs its uploads
+        logger.warning(f"Job {job['_id']} was reclaimed by another worker; stopped")
+        return
+    processing.result()
+
+async def process_job(job):
+    """Process a claimed job, saving partial results as images finish"""
+    job_id = job["_id"]
+    options = job.get("options", {})
+    inline_thumbnails = options.get("inline_thumbnails", False)
+    match_mode = options.get("match_faces", FACE_MATCH_MODE)
+    extractor = options.get("extractor", FEATURE_EXTRACTOR)
+    start_time = time.perf_counter()
+    
+    keys = [job["base_key"]] + job["comparison_keys"]
+    futures = await start_analyses(keys, [StoredUpload(job_id, key) for key in keys], extractor)
+    base_future, comp_futures = futures[0], futures[1:]
+    
+    async def indexed(image_index, future):
+        return image_index, await future
+    
+    try:
+        base_analysis = await base_future
+        base_features = get_base_features(base_analysis)
+        base_image_data, base_image_url = thumbnail_fields(base_analysis, inline_thumbnails)
+        await update_job(job, {"$set": {
+            "base_image_has_face": True,
+            "base_image_data": base_image_data,
+            "base_image_url": base_image_url,
+        }})
         
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        results, pending_results = [], []
+        last_flush = time.perf_counter()
+        for next_done in asyncio.as_completed([indexed(i, future) for i, future in enumerate(comp_futures)]):
+            i, analysis = await next_done
+            (similarity,), (face_index,) = match_analyses(base_features, [analysis], match_mode)
+            result = build_comparison_result(i, analysis, similarity, inline_thumbnails, face_index)
+            results.append(result)
+            pending_results.append(result.dict())
             
-        # Convert to numpy array
-        image_array = np.array(image)
-        
-        return image_array
+            # Save progress in batches rather than once per image
+            if time.perf_counter() - last_flush >= JOB_PROGRESS_INTERVAL:
+                await update_job(job, {
+                    "$push": {"results": {"$each": pending_results}},
+                    "$set": {"processed": len(results)},
+                })
+                pending_results = []
+                last_flush = time.perf_counter()
         
+        # Same ordering as /compare-faces (ties keep upload order)
+        results.sort(key=lambda r: (-r.similarity_percentage, r.image_index))
+        await update_job(job, {"$set": {
+            "status": "completed",
+            "processed": len(results),
+            "results": [result.dict() for result in results],
+            "processing_time": time.perf_counter() - start_time,
+            "finished_at": datetime.utcnow(),
+        }})
+    except asyncio.CancelledError:
+        # Worker shutting down: hand the job back, its uploads are still stored
+        for future in comp_futures:
+            future.cancel()
+        # Matches nothing if the job was stopped because another worker took it over
+        await db.jobs.update_one(job_lease(job), {"$set": {"status": "queued"}})
+        raise
+    except JobLeaseLost:
+        for future in comp_futures:
+            future.cancel()
+        raise
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid image format: {str(e)}")
+        for future in comp_futures:
+            future.cancel()
+        if isinstance(e, HTTPException):
+            error_message = e.detail
+        else:
+            error_message = f"Erro interno do servidor: {str(e)}"
+        await update_job(job, {"$set": {
+            "status": "failed",
+            "base_image_has_face": False if isinstance(e, HTTPException) else None,
+            "error_message": error_message,
+            "processing_time": time.perf_counter() - start_time,
+            "finished_at": datetime.utcnow(),
+        }})
+    
+    await db.job_uploads.delete_many({"job_id": job_id})
+
+async def job_worker_loop():
+    """Claim and run queued jobs until cancelled"""
+    while True:
+        try:
+            job = await claim_job()
+        except Exception as e:
+            logger.warning(f"Could not claim a job: {str(e)}")
+            job = None
+        if job is None:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            continue
+        logger.info(f"Running job {job['_id']} ({len(job['comparison_keys'])} images)")
+        try:
+            await run_job(job)
+        except Exception as e:
+            logger.error(f"Job {job['_id']} could not be processed: {str(e)}")
+
+async def run_job_workers(concurrency=JOB_CONCURRENCY):
+    """Run `concurrency` job loops (used by job_worker.py and the embedded workers)"""
+    await asyncio.gather(*(job_worker_loop() for _ in range(concurrency)))
 
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
@@ -191,116 +1133,853 @@ async def get_status_checks():
 @api_router.post("/compare-faces", response_model=ComparisonResponse)
 async def compare_faces(
     base_image: UploadFile = File(...),
-    comparison_images: List[UploadFile] = File(...)
+    comparison_images: List[UploadFile] = File(...),
+    inline_thumbnails: bool = Form(False),
+    include_timings: bool = Form(False),
+    match_faces: str = Form(FACE_MATCH_MODE),
+    extractor: str = Form(FEATURE_EXTRACTOR),
+    top_k: Optional[int] = Form(None),
+    min_similarity: float = Form(0.0)
+):
+    """Compare faces between base image and multiple comparison images
+
+    With top_k and/or min_similarity only the best images are returned; this
+    trims the response (and the base64 encoding with inline_thumbnails), while
+    the workers still make a thumbnail for every image. A request identical
+    to a recent one (same files in the same order, same options) gets the
+    stored response, and concurrent identical requests share a single
+    computation.
+    """
+    with track_request("compare-faces") as start_time:
+        try:
+            check_match_mode(match_faces)
+            check_extractor(extractor)
+            check_selection(top_k, min_similarity)
+            keys = await hash_comparison_uploads(base_image, comparison_images)
+            
+            async def compare():
+                base_analysis, base_features, comp_futures = await start_comparison(
+                    base_image, comparison_images, extractor, keys
+                )
+                base_image_data, base_image_url = thumbnail_fields(base_analysis, inline_thumbnails)
+                
+                # Gather keeps the results in upload order
+                comp_analyses = await asyncio.gather(*comp_futures)
+                server_timings = {}
+                similarities, face_indexes = match_analyses(
+                    base_features, comp_analyses, match_faces, server_timings
+                )
+                
+                # Results by similarity (highest first), built only for the selected images
+                selected, matched = select_results(similarities, top_k, min_similarity)
+                results = [
+                    build_comparison_result(
+                        i, comp_analyses[i], similarities[i], inline_thumbnails, face_indexes[i]
+                    )
+                    for i in selected
+                ]
+                
+                return ComparisonResponse(
+                    base_image_has_face=True,
+                    base_image_data=base_image_data,
+                    base_image_url=base_image_url,
+                    results=results,
+                    total_images=len(comparison_images),
+                    matched_images=matched,
+                    processing_time=0.0,
+                    stage_timings=(
+                        stage_breakdown([base_analysis] + comp_analyses, server_timings)
+                        if include_timings else None
+                    )
+                ).dict()
+            
+            if RESULT_CACHE_TTL_SECONDS > 0:
+                fingerprint = comparison_fingerprint(
+                    keys, extractor, match_faces, inline_thumbnails, include_timings, top_k, min_similarity
+                )
+                response = await result_cache.get_or_compute(fingerprint, compare)
+            else:
+                response = await compare()
+            
+            # Processing time is this request's, also when the response was stored
+            return ComparisonResponse(**{**response, "processing_time": time.perf_counter() - start_time})
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+
+@api_router.post("/compare-faces/stream")
+async def compare_faces_stream(
+    base_image: UploadFile = File(...),
+    comparison_images: List[UploadFile] = File(...),
+    inline_thumbnails: bool = Form(False),
+    include_timings: bool = Form(False),
+    match_faces: str = Form(FACE_MATCH_MODE),
+    extractor: str = Form(FEATURE_EXTRACTOR)
 ):
-    """Compare faces between base image and multiple comparison images"""
-    start_time = datetime.now()
+    """Compare faces and stream NDJSON records as each comparison image finishes.
+
+    Shares the result cache with /compare-faces (without top_k and
+    min_similarity): a stored response, or the one an identical request is
+    computing, is waited for and replayed as records instead of being
+    computed again.
+    """
+    # Finished (in the metrics) by send_comparison once the last record is sent
+    start_time = request_started("compare-faces/stream")
+    
+    # Uploads are read lazily by the bounded pipeline, so keep them open
+    uploads = [detach_upload(upload) for upload in [base_image] + list(comparison_images)]
+    records = asyncio.Queue()
+    cached = RESULT_CACHE_TTL_SECONDS > 0
     
     try:
-        # Validate file count
-        if len(comparison_images) > 250:
-            raise HTTPException(status_code=400, detail="Maximum 250 images allowed")
-        
-        # Process base image
-        base_content = await base_image.read()
-        base_array = process_uploaded_image(base_content)
-        
-        # Detect faces in base image
-        base_has_face, base_faces = detect_faces(base_array)
+        check_match_mode(match_faces)
+        check_extractor(extractor)
+        keys = await hash_comparison_uploads(uploads[0], uploads[1:])
         
-        if not base_has_face:
-            raise HTTPException(
-                status_code=400, 
-                detail="Nenhum rosto detectado na imagem base. Por favor, envie uma imagem com pelo menos um rosto visível."
+        async def compare():
+            base_analysis, base_features, comp_futures = await start_comparison(
+                uploads[0], uploads[1:], extractor, keys
+            )
+            return await stream_comparison(
+                records, base_analysis, base_features, comp_futures,
+                inline_thumbnails, include_timings, match_faces
             )
         
-        # Extract features from base image
-        base_features = extract_face_features(base_array, base_faces)
+        if cached:
+            fingerprint = comparison_fingerprint(keys, extractor, match_faces, inline_thumbnails, include_timings)
+            computation = asyncio.ensure_future(result_cache.get_or_compute(fingerprint, compare))
+        else:
+            computation = asyncio.ensure_future(compare())
         
-        if base_features is None:
-            raise HTTPException(
-                status_code=400,
-                detail="Não foi possível extrair características da face na imagem base."
-            )
+        def computation_done(_):
+            records.put_nowait(None)
+            asyncio.ensure_future(close_uploads(uploads))
+        computation.add_done_callback(computation_done)
         
-        # Convert base image to base64 for display
-        base_image_data = image_to_base64(base_array)
+        # The base record, or None once the computation is done: an unusable
+        # base image still fails the request with its HTTP status
+        first_record = await records.get()
+        if first_record is None:
+            computation.result()
+    except HTTPException as e:
+        await close_uploads(uploads)
+        request_finished("compare-faces/stream", start_time, e.status_code)
+        raise
+    except Exception as e:
+        await close_uploads(uploads)
+        request_finished("compare-faces/stream", start_time, 500)
+        raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+    
+    return StreamingResponse(
+        send_comparison(start_time, first_record, records, computation, cached),
+        media_type="application/x-ndjson"
+    )
+
+@api_router.post("/compare-faces/multi", response_model=MultiComparisonResponse)
+async def compare_faces_multi(
+    base_images: List[UploadFile] = File(...),
+    comparison_images: List[UploadFile] = File(...),
+    inline_thumbnails: bool = Form(False),
+    include_timings: bool = Form(False),
+    match_faces: str = Form(FACE_MATCH_MODE),
+    extractor: str = Form(FEATURE_EXTRACTOR),
+    top_k: Optional[int] = Form(None),
+    min_similarity: float = Form(0.0)
+):
+    """Compare several reference images of one person against a comparison set.
+
+    Every distinct image is analysed once, the N x M similarity matrix comes
+    from one matrix product and each comparison image gets the maximum and
+    mean over the references that have a usable face. top_k and
+    min_similarity select the results by their best similarity; the matrix
+    still covers every image.
+    """
+    with track_request("compare-faces/multi") as start_time:
+        check_match_mode(match_faces)
+        check_extractor(extractor)
+        check_selection(top_k, min_similarity)
+        if len(base_images) > MAX_BASE_IMAGES:
+            raise HTTPException(status_code=400, detail=f"Maximum {MAX_BASE_IMAGES} base images allowed")
+        if len(comparison_images) > 250:
+            raise HTTPException(status_code=400, detail="Maximum 250 images allowed")
         
-        # Process comparison images
-        results = []
+        try:
+            _, futures = await analyze_uploads(list(base_images) + list(comparison_images), extractor)
+            base_futures, comp_futures = futures[:len(base_images)], futures[len(base_images):]
+            
+            base_analyses = await asyncio.gather(*base_futures)
+            base_results, usable, base_vectors = [], [], []
+            for b, analysis in enumerate(base_analyses):
+                image_data, image_url = thumbnail_fields(analysis, inline_thumbnails)
+                try:
+                    base_vectors.append(get_base_features(analysis))
+                    usable.append(b)
+                    error_message = None
+                except HTTPException as e:
+                    error_message = e.detail
+                base_results.append(BaseImageResult(
+                    image_index=b,
+                    has_face=analysis['has_face'],
+                    image_data=image_data,
+                    image_url=image_url,
+                    error_message=error_message
+                ))
+            
+            if not usable:
+                for future in comp_futures:
+                    future.cancel()
+                raise HTTPException(
+                    status_code=400,
+                    detail="Nenhum rosto utilizável nas imagens base. Por favor, envie imagens com pelo menos um rosto visível."
+                )
+            
+            comp_analyses = await asyncio.gather(*comp_futures)
+            server_timings = {}
+            similarities, face_indexes = match_matrix(
+                stack_features(base_vectors), comp_analyses, match_faces, server_timings
+            )
+            
+            # Aggregate over the references (rows of the matrix)
+            best_rows = np.argmax(similarities, axis=0)
+            max_similarities = similarities.max(axis=0)
+            mean_similarities = similarities.mean(axis=0)
+            
+            # Results by their best similarity (highest first), built only for the selected images
+            selected, matched = select_results(max_similarities, top_k, min_similarity)
+            results = []
+            for i in selected:
+                analysis = comp_analyses[i]
+                face_index = int(face_indexes[best_rows[i], i])
+                result = build_comparison_result(
+                    i, analysis, float(max_similarities[i]), inline_thumbnails,
+                    face_index if face_index >= 0 else None
+                )
+                has_features = analysis['error'] is None and analysis['features'] is not None
+                results.append(MultiComparisonResult(
+                    **result.dict(),
+                    mean_similarity=float(mean_similarities[i]) if has_features else 0.0,
+                    best_base_index=usable[best_rows[i]] if has_features else None
+                ))
+            
+            matrix = [None] * len(base_images)
+            for row, b in enumerate(usable):
+                matrix[b] = similarities[row].tolist()
+            
+            return MultiComparisonResponse(
+                base_images=base_results,
+                results=results,
+                similarity_matrix=matrix,
+                total_images=len(comparison_images),
+                matched_images=matched,
+                processing_time=time.perf_counter() - start_time,
+                stage_timings=(
+                    stage_breakdown(base_analyses + comp_analyses, server_timings)
+                    if include_timings else None
+                )
+            )
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+
+def check_cluster_params(threshold, min_cluster_size):
+    if not 0 <= threshold <= 100:
+        raise HTTPException(status_code=400, detail="threshold deve estar entre 0 e 100")
+    if min_cluster_size < 2:
+        raise HTTPException(status_code=400, detail="min_cluster_size deve ser pelo menos 2")
+
+@api_router.post("/cluster", response_model=ClusterResponse)
+async def cluster_images(request: Request):
+    """Group uploaded images by identity (or find duplicates).
+
+    Features are extracted once per distinct image; images whose faces are
+    at least `threshold` similar are linked and each connected group of at
+    least min_cluster_size images is a cluster. The form (images, threshold,
+    min_cluster_size, extractor) is parsed here instead of by FastAPI, so it
+    can hold up to MAX_CLUSTER_IMAGES files.
+    """
+    with track_request("cluster") as start_time:
+        try:
+            form = await request.form(max_files=MAX_CLUSTER_IMAGES, max_fields=100)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Formulário inválido: {str(e)}")
         
-        for i, comp_image in enumerate(comparison_images):
+        try:
+            images = [value for value in form.getlist("images") if not isinstance(value, str)]
+            if not images:
+                raise HTTPException(status_code=400, detail="Envie pelo menos uma imagem em images")
             try:
-                # Process comparison image
-                comp_content = await comp_image.read()
-                comp_array = process_uploaded_image(comp_content)
-                
-                # Convert comparison image to base64 for display
-                comp_image_data = image_to_base64(comp_array)
-                
-                # Detect faces
-                comp_has_face, comp_faces = detect_faces(comp_array)
+                threshold = float(form.get("threshold", CLUSTER_THRESHOLD))
+                min_cluster_size = int(form.get("min_cluster_size", 2))
+            except ValueError:
+                raise HTTPException(status_code=400, detail="threshold e min_cluster_size devem ser numéricos")
+            extractor = form.get("extractor", FEATURE_EXTRACTOR)
+            check_cluster_params(threshold, min_cluster_size)
+            check_extractor(extractor)
+            
+            try:
+                _, futures = await analyze_uploads(images, extractor)
                 
-                if not comp_has_face:
-                    results.append(FaceComparisonResult(
-                        image_index=i,
-                        similarity_percentage=0.0,
-                        has_face=False,
-                        image_data=comp_image_data,
-                        error_message="Nenhum rosto detectado nesta imagem"
-                    ))
-                    continue
+                async def indexed(image_index, future):
+                    return image_index, await future
                 
-                # Extract features
-                comp_features = extract_face_features(comp_array, comp_faces)
+                # Keep only the feature vectors as images finish
+                features = {}
+                for next_done in asyncio.as_completed([indexed(i, future) for i, future in enumerate(futures)]):
+                    i, analysis = await next_done
+                    if analysis['error'] is None and analysis['features'] is not None:
+                        features[i] = analysis['features']
+                del futures
                 
-                if comp_features is None:
-                    results.append(FaceComparisonResult(
-                        image_index=i,
-                        similarity_percentage=0.0,
-                        has_face=True,
-                        image_data=comp_image_data,
-                        error_message="Não foi possível extrair características da face"
-                    ))
-                    continue
+                indexes = sorted(features)
+                no_face = [i for i in range(len(images)) if i not in features]
                 
-                # Calculate similarity
-                similarity = calculate_similarity(base_features, comp_features)
+                clusters, unclustered = [], []
+                if indexes:
+                    matrix = stack_features([features[i] for i in indexes])
+                    with timed_stage('clustering'):
+                        labels = await asyncio.to_thread(
+                            cluster_features, matrix, threshold / 100, CLUSTER_MEMORY_BYTES
+                        )
+                    for group in group_labels(labels):
+                        members = [indexes[row] for row in group]
+                        if len(members) >= min_cluster_size:
+                            clusters.append(ImageCluster(size=len(members), image_indexes=members))
+                        else:
+                            unclustered.extend(members)
                 
-                results.append(FaceComparisonResult(
-                    image_index=i,
-                    similarity_percentage=similarity,
-                    has_face=True,
-                    image_data=comp_image_data
-                ))
+                return ClusterResponse(
+                    clusters=clusters,
+                    unclustered=sorted(unclustered),
+                    no_face=no_face,
+                    total_images=len(images),
+                    threshold=threshold,
+                    processing_time=time.perf_counter() - start_time
+                )
                 
+            except HTTPException:
+                raise
             except Exception as e:
-                results.append(FaceComparisonResult(
-                    image_index=i,
-                    similarity_percentage=0.0,
-                    has_face=False,
-                    image_data=None,
-                    error_message=f"Erro ao processar imagem: {str(e)}"
+                raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+        finally:
+            await form.close()
+
+@api_router.post("/jobs", response_model=JobCreated, status_code=202)
+async def create_job(
+    base_image: UploadFile = File(...),
+    comparison_images: List[UploadFile] = File(...),
+    inline_thumbnails: bool = Form(False),
+    match_faces: str = Form(FACE_MATCH_MODE),
+    extractor: str = Form(FEATURE_EXTRACTOR)
+):
+    """Queue a comparison and return its job id right away; poll GET /jobs/{id}"""
+    with track_request("jobs"):
+        check_match_mode(match_faces)
+        check_extractor(extractor)
+        if len(comparison_images) > 250:
+            raise HTTPException(status_code=400, detail="Maximum 250 images allowed")
+        for upload in [base_image] + list(comparison_images):
+            if (upload.size or 0) > JOB_MAX_IMAGE_BYTES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Imagem '{upload.filename}' excede o limite de {JOB_MAX_IMAGE_BYTES // (1024 * 1024)} MB por imagem em jobs"
+                )
+        
+        try:
+            job_id = str(uuid.uuid4())
+            created_at = datetime.utcnow()
+            expires_at = created_at + timedelta(seconds=JOB_TTL_SECONDS)
+            
+            # Keep each distinct image once, until a worker has analysed it
+            keys = []
+            stored = set()
+            for upload in [base_image] + list(comparison_images):
+                key = await hash_upload(upload)
+                keys.append(key)
+                if key in stored:
+                    continue
+                await upload.seek(0)
+                await db.job_uploads.insert_one({
+                    "job_id": job_id,
+                    "key": key,
+                    "data": Binary(await upload.read()),
+                    "expires_at": expires_at,
+                })
+                stored.add(key)
+            
+            await db.jobs.insert_one({
+                "_id": job_id,
+                "status": "queued",
+                "base_key": keys[0],
+                "comparison_keys": keys[1:],
+                "options": {"inline_thumbnails": inline_thumbnails, "match_faces": match_faces, "extractor": extractor},
+                "total_images": len(comparison_images),
+                "processed": 0,
+                "results": [],
+                "created_at": created_at,
+                "expires_at": expires_at,
+            })
+            return JobCreated(job_id=job_id, status="queued", total_images=len(comparison_images))
+            
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+
+@api_router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Progress and (partial) results of a comparison job"""
+    job = await db.jobs.find_one({"_id": job_id}, {"base_key": 0, "comparison_keys": 0})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return JobStatus(job_id=job.pop("_id"), **job)
+
+async def ensure_session_indexes():
+    """Unique image slots per session, and TTL indexes so sessions expire on their own"""
+    await db.comparison_sessions.create_index("expires_at", expireAfterSeconds=0)
+    await db.session_results.create_index("expires_at", expireAfterSeconds=0)
+    await db.session_results.create_index([("session_id", 1), ("image_index", 1)], unique=True)
+
+async def find_session(session_id):
+    session = await db.comparison_sessions.find_one({"_id": session_id})
+    if session is None or session["expires_at"] <= datetime.utcnow():
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    return session
+
+@api_router.post("/sessions", response_model=SessionCreated, status_code=201)
+async def create_session(
+    base_image: UploadFile = File(...),
+    inline_thumbnails: bool = Form(False),
+    match_faces: str = Form(FACE_MATCH_MODE),
+    extractor: str = Form(FEATURE_EXTRACTOR)
+):
+    """Open a comparison session with its base image; send the comparison images to /sessions/{id}/images"""
+    with track_request("sessions"):
+        check_match_mode(match_faces)
+        check_extractor(extractor)
+        try:
+            _, (base_future,) = await analyze_uploads([base_image], extractor)
+            base_analysis = await base_future
+            base_features = get_base_features(base_analysis)
+            base_image_data, base_image_url = thumbnail_fields(base_analysis, inline_thumbnails)
+            
+            session_id = str(uuid.uuid4())
+            created_at = datetime.utcnow()
+            expires_at = created_at + timedelta(seconds=SESSION_TTL_SECONDS)
+            await db.comparison_sessions.insert_one({
+                "_id": session_id,
+                "base_features": Binary(np.asarray(base_features, dtype=np.float32).tobytes()),
+                "base_thumbnail_key": base_analysis['thumbnail_key'],
+                "options": {
+                    "match_faces": match_faces, "extractor": extractor,
+                    "extractor_identity": extractor_identity(extractor),
+                },
+                "next_index": 0,
+                "created_at": created_at,
+                "expires_at": expires_at,
+            })
+            return SessionCreated(
+                session_id=session_id,
+                base_image_has_face=True,
+                base_image_data=base_image_data,
+                base_image_url=base_image_url,
+                max_images=MAX_SESSION_IMAGES,
+                expires_at=expires_at
+            )
+        
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+
+async def reserve_session_indexes(session_id, count, start_index=None):
+    """First image_index of a chunk of count images, within MAX_SESSION_IMAGES.
+
+    Without start_index the chunk is appended after the last reserved slot.
+    With it, the chunk (re)fills those slots, so a chunk whose response was
+    lost can be sent again without duplicating images.
+    """
+    if start_index is None:
+        session = await db.comparison_sessions.find_one_and_update(
+            {"_id": session_id, "next_index": {"$lte": MAX_SESSION_IMAGES - count}},
+            {"$inc": {"next_index": count}}
+        )
+        if session is None:
+            raise HTTPException(status_code=400, detail=f"Maximum {MAX_SESSION_IMAGES} images per session")
+        return session["next_index"]
+    
+    if start_index < 0 or start_index + count > MAX_SESSION_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_SESSION_IMAGES} images per session")
+    await db.comparison_sessions.update_one({"_id": session_id}, {"$max": {"next_index": start_index + count}})
+    return start_index
+
+@api_router.post("/sessions/{session_id}/images", response_model=SessionChunk)
+async def add_session_images(
+    session_id: str,
+    comparison_images: List[UploadFile] = File(...),
+    start_index: Optional[int] = Form(None)
+):
+    """Analyse a chunk of comparison images and store their scores in the session.
+
+    Only the chunk is held by the request; the per-image results go to
+    MongoDB, so a session can grow to thousands of images.
+    """
+    with track_request("sessions/images") as start_time:
+        session = await find_session(session_id)
+        if len(comparison_images) > MAX_CHUNK_IMAGES:
+            raise HTTPException(status_code=400, detail=f"Maximum {MAX_CHUNK_IMAGES} images per chunk")
+        options = session["options"]
+        
+        try:
+            # The base features are only comparable with vectors from the same model
+            identity = extractor_identity(options["extractor"])
+            if options.get("extractor_identity", identity) != identity:
+                raise HTTPException(
+                    status_code=400,
+                    detail="A sessão foi criada com outro modelo de características; crie uma nova sessão"
+                )
+            first_index = await reserve_session_indexes(session_id, len(comparison_images), start_index)
+            _, futures = await analyze_uploads(comparison_images, options["extractor"])
+            analyses = await asyncio.gather(*futures)
+            similarities, face_indexes = match_analyses(
+                np.frombuffer(session["base_features"], dtype=np.float32), analyses, options["match_faces"]
+            )
+            
+            writes = []
+            for offset, analysis in enumerate(analyses):
+                image_index = first_index + offset
+                result = build_comparison_result(image_index, analysis, similarities[offset], False, face_indexes[offset])
+                writes.append(ReplaceOne(
+                    {"session_id": session_id, "image_index": image_index},
+                    {
+                        "session_id": session_id,
+                        "image_index": image_index,
+                        "similarity": result.similarity_percentage,
+                        "thumbnail_key": analysis['thumbnail_key'],
+                        "result": result.dict(),
+                        "expires_at": session["expires_at"],
+                    },
+                    upsert=True
                 ))
+            if writes:
+                await db.session_results.bulk_write(writes, ordered=False)
+            
+            session = await db.comparison_sessions.find_one({"_id": session_id}, {"next_index": 1})
+            return SessionChunk(
+                session_id=session_id,
+                start_index=first_index,
+                received=len(analyses),
+                next_index=session["next_index"],
+                processing_time=time.perf_counter() - start_time
+            )
         
-        # Sort results by similarity (highest first)
-        results.sort(key=lambda x: x.similarity_percentage, reverse=True)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+
+@api_router.get("/sessions/{session_id}", response_model=SessionStatus)
+async def get_session(session_id: str):
+    """Images analysed so far in a session and where the next chunk starts"""
+    session = await find_session(session_id)
+    return SessionStatus(
+        session_id=session_id,
+        total_images=await db.session_results.count_documents({"session_id": session_id}),
+        next_index=session["next_index"],
+        match_faces=session["options"]["match_faces"],
+        extractor=session["options"]["extractor"],
+        created_at=session["created_at"],
+        expires_at=session["expires_at"]
+    )
+
+async def inline_thumbnail(key):
+    """Data URI of a stored thumbnail, or None"""
+    if key is None:
+        return None
+    data = await asyncio.to_thread(thumbnail_store.get, key)
+    return None if data is None else thumbnail_data_uri(data)
+
+@api_router.get("/sessions/{session_id}/results", response_model=ComparisonResponse)
+async def get_session_results(
+    session_id: str,
+    top_k: Optional[int] = None,
+    min_similarity: float = 0.0,
+    inline_thumbnails: bool = False
+):
+    """Rank every image received so far in a session (can be called again as more chunks arrive)"""
+    with track_request("sessions/results") as start_time:
+        check_selection(top_k, min_similarity)
+        session = await find_session(session_id)
         
-        # Calculate processing time
-        processing_time = (datetime.now() - start_time).total_seconds()
+        try:
+            # Only the scores are read for ranking; full results only for the selected images
+            image_indexes, similarities = [], []
+            async for document in db.session_results.find(
+                {"session_id": session_id}, {"_id": 0, "image_index": 1, "similarity": 1}
+            ):
+                image_indexes.append(document["image_index"])
+                similarities.append(document["similarity"])
+            
+            # Upload order first, so ties keep it as in /compare-faces
+            order = np.argsort(image_indexes, kind='stable')
+            image_indexes = [image_indexes[i] for i in order]
+            selected, matched = select_results([similarities[i] for i in order], top_k, min_similarity)
+            selected_indexes = [image_indexes[i] for i in selected]
+            
+            documents = {}
+            async for document in db.session_results.find(
+                {"session_id": session_id, "image_index": {"$in": selected_indexes}}
+            ):
+                documents[document["image_index"]] = document
+            
+            results = []
+            for image_index in selected_indexes:
+                document = documents[image_index]
+                result = FaceComparisonResult(**document["result"])
+                if inline_thumbnails:
+                    result.image_data = await inline_thumbnail(document["thumbnail_key"])
+                results.append(result)
+            
+            base_thumbnail_key = session["base_thumbnail_key"]
+            return ComparisonResponse(
+                base_image_has_face=True,
+                base_image_data=await inline_thumbnail(base_thumbnail_key) if inline_thumbnails else None,
+                base_image_url=f"/api/thumbnails/{base_thumbnail_key}" if base_thumbnail_key else None,
+                results=results,
+                total_images=len(image_indexes),
+                matched_images=matched,
+                processing_time=time.perf_counter() - start_time
+            )
         
-        return ComparisonResponse(
-            base_image_has_face=True,
-            base_image_data=base_image_data,
-            results=results,
-            total_images=len(comparison_images),
-            processing_time=processing_time
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+
+@api_router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Close a session and drop its stored results"""
+    result = await db.comparison_sessions.delete_one({"_id": session_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    await db.session_results.delete_many({"session_id": session_id})
+    return {"deleted": session_id}
+
+@api_router.get("/thumbnails/{key}")
+async def get_thumbnail(key: str, request: Request):
+    """Serve a stored thumbnail; content-addressed, so it never changes"""
+    if not is_thumbnail_key(key):
+        raise HTTPException(status_code=404, detail="Thumbnail não encontrada")
+    
+    headers = {
+        "ETag": f'"{key}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") in (f'"{key}"', f'W/"{key}"', "*"):
+        return Response(status_code=304, headers=headers)
+    
+    data = await asyncio.to_thread(thumbnail_store.get, key)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Thumbnail não encontrada")
+    return Response(content=data, media_type=thumbnail_media_type(data), headers=headers)
+
+@api_router.get("/extractors", response_model=List[ExtractorInfo])
+async def list_extractors():
+    """Feature extractors usable in the 'extractor' field, with their vector dimension"""
+    extractors = [get_feature_extractor(name) for name in available_extractors()]
+    return [
+        ExtractorInfo(name=extractor.name, dim=extractor.dim, default=extractor.name == FEATURE_EXTRACTOR)
+        for extractor in extractors
+    ]
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Stage histograms, image counters and in-flight gauges in the Prometheus text format"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters of the face analysis cache"""
+    return face_cache.stats()
+
+@api_router.get("/cache/results/stats")
+async def get_result_cache_stats():
+    """Hit/miss counters of the /compare-faces response cache (merged = shared an in-flight computation)"""
+    return result_cache.stats()
+
+@api_router.post("/gallery/enroll", response_model=EnrollResponse)
+async def enroll_gallery_faces(
+    images: List[UploadFile] = File(...),
+    label: Optional[str] = Form(None)
+):
+    """Enroll images into the gallery (one face per image, the largest)"""
+    with track_request("gallery/enroll"):
+        try:
+            keys, futures = await analyze_uploads(images)
+            analyses = await asyncio.gather(*futures)
+            
+            results = []
+            ids, vectors = [], []
+            for image, key, analysis in zip(images, keys, analyses):
+                if analysis['error'] is not None:
+                    error_message = f"Erro ao processar imagem: {analysis['error']}"
+                elif not analysis['has_face']:
+                    error_message = "Nenhum rosto detectado nesta imagem"
+                elif analysis['features'] is None:
+                    error_message = "Não foi possível extrair características da face"
+                else:
+                    error_message = None
+                
+                if error_message is not None:
+                    results.append(EnrollResult(filename=image.filename, enrolled=False, error_message=error_message))
+                    continue
+                
+                face = GalleryFace(
+                    label=label,
+                    filename=image.filename,
+                    content_hash=key,
+                    face_box=largest_face_box(analysis),
+                    image_url=thumbnail_url(analysis),
+                    extractor=extractor_identity()
+                )
+                features = np.asarray(analysis['features'], dtype=np.float32)
+                document = face.dict()
+                document["features"] = Binary(features.tobytes())
+                await db.gallery_faces.insert_one(document)
+                
+                ids.append(face.id)
+                vectors.append(features)
+                results.append(EnrollResult(filename=image.filename, enrolled=True, face=face))
+            
+            if ids:
+                vectors = np.vstack(vectors)
+                await asyncio.to_thread(gallery_index.add, ids, vectors)
+                try:
+                    await asyncio.to_thread(gallery_store.append, ids, vectors)
+                except Exception as e:
+                    # Rebuilt from MongoDB at the next startup (the counts won't match)
+                    logger.warning(f"Could not append to gallery feature store: {str(e)}")
+            
+            return EnrollResponse(results=results, enrolled=len(ids), gallery_size=len(gallery_index))
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+
+@api_router.get("/gallery", response_model=List[GalleryFace])
+async def list_gallery_faces(skip: int = 0, limit: int = 100):
+    """List enrolled faces (without their feature vectors)"""
+    faces = await db.gallery_faces.find({}, {"_id": 0, "features": 0}).skip(skip).limit(min(limit, 1000)).to_list(1000)
+    return [GalleryFace(**face) for face in faces]
+
+@api_router.delete("/gallery/{face_id}")
+async def delete_gallery_face(face_id: str):
+    """Remove an enrolled face from MongoDB and from the vector index"""
+    result = await db.gallery_faces.delete_one({"id": face_id})
+    removed = await asyncio.to_thread(gallery_index.remove, face_id)
+    try:
+        await asyncio.to_thread(gallery_store.delete, [face_id])
+    except Exception as e:
+        logger.warning(f"Could not delete from gallery feature store: {str(e)}")
+    if result.deleted_count == 0 and not removed:
+        raise HTTPException(status_code=404, detail="Rosto não encontrado na galeria")
+    return {"deleted": face_id, "gallery_size": len(gallery_index)}
+
+@api_router.get("/gallery/clusters", response_model=GalleryClusterResponse)
+async def cluster_gallery(threshold: float = CLUSTER_THRESHOLD, min_cluster_size: int = 2):
+    """Group the enrolled faces by identity, from the vectors already in the index"""
+    with track_request("gallery/clusters") as start_time:
+        check_cluster_params(threshold, min_cluster_size)
+        
+        await refresh_gallery_index()
+        ids, matrix = await asyncio.to_thread(gallery_index.snapshot)
+        clusters, unclustered = [], 0
+        if ids:
+            with timed_stage('clustering'):
+                labels = await asyncio.to_thread(
+                    cluster_features, matrix, threshold / 100, CLUSTER_MEMORY_BYTES
+                )
+            for group in group_labels(labels):
+                if len(group) >= min_cluster_size:
+                    clusters.append(GalleryCluster(size=len(group), face_ids=[ids[row] for row in group]))
+                else:
+                    unclustered += len(group)
+        
+        return GalleryClusterResponse(
+            clusters=clusters,
+            unclustered=unclustered,
+            gallery_size=len(ids),
+            threshold=threshold,
+            processing_time=time.perf_counter() - start_time
         )
+
+@api_router.post("/search", response_model=SearchResponse)
+async def search_gallery(
+    probe_image: UploadFile = File(...),
+    top_k: int = Form(10),
+    mode: str = Form(GALLERY_SEARCH_MODE),
+    inline_thumbnails: bool = Form(False),
+    include_timings: bool = Form(False)
+):
+    """Return the enrolled faces most similar to the probe image"""
+    with track_request("search") as start_time:
+        if mode not in ("exact", "approximate"):
+            raise HTTPException(status_code=400, detail="mode deve ser 'exact' ou 'approximate'")
+        if top_k < 1:
+            raise HTTPException(status_code=400, detail="top_k deve ser maior que zero")
         
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+        try:
+            _, (probe_future,) = await analyze_uploads([probe_image])
+            probe_analysis = await probe_future
+            probe_features = get_base_features(probe_analysis)
+            
+            # Quantized scores are approximate: fetch more candidates and
+            # re-rank them with the float vectors stored in MongoDB
+            quantized = gallery_index.quantized
+            server_timings = {}
+            await refresh_gallery_index()
+            with timed_stage('search', server_timings):
+                hits = await asyncio.to_thread(
+                    gallery_index.search, probe_features,
+                    top_k * GALLERY_RERANK_FACTOR if quantized else top_k, mode == "approximate"
+                )
+            
+            faces, vectors = {}, {}
+            if hits:
+                hit_ids = [face_id for face_id, _ in hits]
+                projection = {"_id": 0} if quantized else {"_id": 0, "features": 0}
+                async for face in db.gallery_faces.find({"id": {"$in": hit_ids}}, projection):
+                    features = face.pop("features", None)
+                    if features is not None:
+                        vectors[face["id"]] = np.frombuffer(features, dtype=np.float32)
+                    faces[face["id"]] = GalleryFace(**face)
+            if quantized:
+                with timed_stage('rerank', server_timings):
+                    hits = rerank(probe_features, hits, vectors, top_k)
+            
+            matches = [
+                SearchMatch(face=faces[face_id], similarity_percentage=float(np.clip(score * 100, 0, 100)))
+                for face_id, score in hits
+                if face_id in faces
+            ]
+            
+            return SearchResponse(
+                probe_has_face=True,
+                probe_image_data=thumbnail_fields(probe_analysis, inline_thumbnails)[0],
+                probe_image_url=thumbnail_url(probe_analysis),
+                matches=matches,
+                gallery_size=len(gallery_index),
+                mode=mode,
+                processing_time=time.perf_counter() - start_time,
+                stage_timings=stage_breakdown([probe_analysis], server_timings) if include_timings else None
+            )
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -320,6 +1999,57 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_face_workers():
+    get_process_pool()
+
+@app.on_event("startup")
+async def startup_gallery_index():
+    try:
+        await load_gallery_index()
+    except Exception as e:
+        logger.warning(f"Could not load gallery index: {str(e)}")
+
+@app.on_event("startup")
+async def startup_face_cache():
+    try:
+        await face_cache.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Could not create face cache indexes: {str(e)}")
+
+@app.on_event("startup")
+async def startup_result_cache():
+    try:
+        await result_cache.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Could not create result cache indexes: {str(e)}")
+
+@app.on_event("startup")
+async def startup_sessions():
+    try:
+        await ensure_session_indexes()
+    except Exception as e:
+        logger.warning(f"Could not create session indexes: {str(e)}")
+
+@app.on_event("startup")
+async def startup_job_workers():
+    try:
+        await ensure_job_indexes()
+    except Exception as e:
+        logger.warning(f"Could not create job indexes: {str(e)}")
+    if JOB_WORKERS_EMBEDDED:
+        app.state.job_workers = asyncio.ensure_future(run_job_workers())
+
+@app.on_event("shutdown")
+async def shutdown_job_workers():
+    job_workers = getattr(app.state, "job_workers", None)
+    if job_workers is not None:
+        job_workers.cancel()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+
+@app.on_event("shutdown")
+async def shutdown_face_workers():
+    shutdown_process_pool()
\ No newline at end of file
@@ -0,0 +1,77 @@
+import os
+import re
+import hashlib
+import tempfile
+from pathlib import Path
+
+THUMBNAIL_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+def thumbnail_key(data):
+    """Content address of an encoded thumbnail (SHA-256 of its bytes)"""
+    return hashlib.sha256(data).hexdigest()
+
+def is_thumbnail_key(key):
+    return bool(THUMBNAIL_KEY_PATTERN.match(key))
+
+def thumbnail_media_type(data):
+    """Media type of an encoded thumbnail, sniffed from its header"""
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+class ThumbnailStore:
+    """Write-once storage for encoded thumbnails, addressed by thumbnail_key"""
+
+    def put(self, key, data):
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+class LocalThumbnailStore(ThumbnailStore):
+    """Thumbnails as files under a local directory, sharded by key prefix"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path_for(self, key):
+        return self.root / key[:2] / key
+
+    def put(self, key, data):
+        """Store a thumbnail; a no-op if the key already exists"""
+        path = self.path_for(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file and rename, so readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def get(self, key):
+        """Return the thumbnail bytes, or None if unknown"""
+        try:
+            return self.path_for(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+# Available backends, selected with THUMBNAIL_STORE
+THUMBNAIL_STORES = {
+    'local': lambda: LocalThumbnailStore(
+        os.environ.get('THUMBNAIL_DIR', Path(__file__).parent / 'thumbnails')
+    ),
+}
+
+def create_thumbnail_store(name=None):
+    """Build the configured thumbnail store backend"""
+    name = name or os.environ.get('THUMBNAIL_STORE', 'local')
+    if name not in THUMBNAIL_STORES:
+        raise ValueError(f"Unknown thumbnail store '{name}'")
+    return THUMBNAIL_STORES[name]()
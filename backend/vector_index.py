@@ -0,0 +1,241 @@
+import threading
+import numpy as np
+from quantization import dequantize_int8, int8_scores, quantize_int8
+
+class VectorIndex:
+    """In-memory index of L2-normalized feature vectors for top-k search.
+
+    Vectors live in one contiguous float32 matrix that grows by doubling, so
+    exact search is a single matrix-vector product. Deletes swap the last row
+    into the freed slot. Once the index is large enough an IVF layer (spherical
+    k-means centroids plus one inverted list per centroid) is trained, letting
+    approximate search score only the rows of the closest lists.
+
+    With quantized=True the rows are kept as int8 codes with one scale per
+    row (a quarter of the memory) and scored with integer products; the
+    scores are approximate, so callers ask for more candidates than they
+    need and re-rank them with the float vectors (see quantization.rerank).
+    """
+
+    def __init__(self, dim=None, nprobe=8, min_train_size=1024, max_train_sample=100_000, quantized=False):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.quantized = quantized
+        self.min_train_size = min_train_size
+        self.max_train_sample = max_train_sample
+        self._matrix = None
+        self._scales = None
+        self._count = 0
+        self._ids = []
+        self._rows = {}
+        self._centroids = None
+        self._assignments = None
+        self._lists = []
+        self._trained_size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    @property
+    def is_trained(self):
+        return self._centroids is not None
+
+    def snapshot(self):
+        """Copy of the stored ids and their vectors (one row per id)"""
+        with self._lock:
+            if self._count == 0:
+                return [], np.empty((0, self.dim or 0), dtype=np.float32)
+            return list(self._ids), self._vectors(slice(0, self._count)).copy()
+
+    def _vectors(self, rows):
+        """Float32 vectors of the given rows (decoded when quantized)"""
+        if self.quantized:
+            return dequantize_int8(self._matrix[rows], self._scales[rows])
+        return self._matrix[rows]
+
+    def _scores(self, query, rows=None):
+        """Similarity of the query with the given rows (all rows if None)"""
+        rows = slice(0, self._count) if rows is None else rows
+        if self.quantized:
+            return int8_scores(self._matrix[rows], self._scales[rows], query)
+        return self._matrix[rows] @ query
+
+    def _store(self, start, vectors):
+        """Write vectors into the rows from `start` on"""
+        end = start + len(vectors)
+        if self.quantized:
+            self._matrix[start:end], self._scales[start:end] = quantize_int8(vectors)
+        else:
+            self._matrix[start:end] = vectors
+
+    def _ensure_capacity(self, extra):
+        """Grow the backing matrix (by doubling) to fit `extra` more rows"""
+        needed = self._count + extra
+        capacity = 0 if self._matrix is None else len(self._matrix)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 64)
+        matrix = np.empty((new_capacity, self.dim), dtype=np.int8 if self.quantized else np.float32)
+        scales = np.empty(new_capacity, dtype=np.float32) if self.quantized else None
+        assignments = np.full(new_capacity, -1, dtype=np.int32)
+        if self._count:
+            matrix[:self._count] = self._matrix[:self._count]
+            assignments[:self._count] = self._assignments[:self._count]
+            if self.quantized:
+                scales[:self._count] = self._scales[:self._count]
+        self._matrix = matrix
+        self._scales = scales
+        self._assignments = assignments
+
+    def load(self, ids, matrix):
+        """Replace the contents with `matrix`, used as the backing storage.
+
+        A float32 C-contiguous matrix is adopted without a copy, so a
+        copy-on-write memory map stays shared with other processes until
+        this index writes to it; the first add after loading moves the rows
+        into a private, larger matrix. A quantized index encodes it instead.
+        """
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if matrix.ndim != 2 or len(matrix) != len(ids):
+            raise ValueError(f"Expected one row per id, got {matrix.shape} for {len(ids)} ids")
+        with self._lock:
+            self.dim = matrix.shape[1] if len(ids) else self.dim
+            if not len(ids):
+                self._matrix = self._scales = None
+            elif self.quantized:
+                self._matrix, self._scales = quantize_int8(matrix)
+            else:
+                self._matrix = matrix
+            self._count = len(ids)
+            self._ids = list(ids)
+            self._rows = {item_id: row for row, item_id in enumerate(self._ids)}
+            self._assignments = np.full(len(ids), -1, dtype=np.int32)
+            self._centroids = None
+            self._lists = []
+            self._trained_size = 0
+            if self._count >= self.min_train_size:
+                self.train()
+
+    def add(self, ids, vectors):
+        """Add (or replace) vectors under the given ids"""
+        vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+
+            for item_id in ids:
+                if item_id in self._rows:
+                    self._remove_row(self._rows[item_id])
+
+            self._ensure_capacity(len(ids))
+            start = self._count
+            self._store(start, vectors)
+            for offset, item_id in enumerate(ids):
+                self._rows[item_id] = start + offset
+                self._ids.append(item_id)
+            self._count += len(ids)
+
+            if self.is_trained:
+                self._assign(np.arange(start, self._count))
+            if self._count >= self.min_train_size and self._count >= 2 * self._trained_size:
+                self.train()
+
+    def remove(self, item_id):
+        """Remove a vector; returns False if the id is unknown"""
+        with self._lock:
+            row = self._rows.get(item_id)
+            if row is None:
+                return False
+            self._remove_row(row)
+            return True
+
+    def _remove_row(self, row):
+        """Drop a row by moving the last row into its slot"""
+        last = self._count - 1
+        removed_id = self._ids[row]
+        if self.is_trained:
+            self._lists[self._assignments[row]].discard(row)
+        if row != last:
+            moved_id = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            if self.quantized:
+                self._scales[row] = self._scales[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+            if self.is_trained:
+                list_id = self._assignments[last]
+                self._lists[list_id].discard(last)
+                self._lists[list_id].add(row)
+                self._assignments[row] = list_id
+        self._ids.pop()
+        del self._rows[removed_id]
+        self._count -= 1
+
+    def train(self, iterations=10, seed=0):
+        """(Re)build the IVF layer with spherical k-means over the stored vectors"""
+        with self._lock:
+            if self._count == 0:
+                return
+            rng = np.random.default_rng(seed)
+            if self._count > self.max_train_sample:
+                sample = self._vectors(rng.choice(self._count, self.max_train_sample, replace=False))
+            else:
+                sample = self._vectors(slice(0, self._count))
+            nlist = max(1, min(int(4 * np.sqrt(self._count)), len(sample)))
+
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                # Keep the previous centroid for lists that ended up empty
+                centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+            self._centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+            self._lists = [set() for _ in range(nlist)]
+            self._assign(np.arange(self._count))
+            self._trained_size = self._count
+
+    def _assign(self, rows, chunk_size=65536):
+        """Put rows into the inverted list of their nearest centroid"""
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            labels = np.argmax(self._vectors(chunk) @ self._centroids.T, axis=1)
+            self._assignments[chunk] = labels
+            for row, label in zip(chunk.tolist(), labels.tolist()):
+                self._lists[label].add(row)
+
+    def search(self, query, k=10, approximate=False, nprobe=None):
+        """Return up to k (id, cosine similarity) pairs, best first"""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if self._count == 0:
+                return []
+
+            if approximate and self.is_trained:
+                probe = min(nprobe or self.nprobe, len(self._centroids))
+                closest = np.argpartition(-(self._centroids @ query), probe - 1)[:probe]
+                rows = np.fromiter(
+                    (row for list_id in closest.tolist() for row in self._lists[list_id]),
+                    dtype=np.int64
+                )
+                if len(rows) == 0:
+                    return []
+                scores = self._scores(query, rows)
+            else:
+                rows = None
+                scores = self._scores(query)
+
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            if rows is not None:
+                return [(self._ids[rows[i]], float(scores[i])) for i in top]
+            return [(self._ids[i], float(scores[i])) for i in top]
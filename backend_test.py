@@ -146,7 +146,7 @@ class FaceComparisonAPITester:
                 ('comparison_images', ('comp2.jpg', comp_image2, 'image/jpeg'))
             ]
             
-            response = requests.post(f"{self.api_url}/compare-faces", files=files)
+            response = requests.post(f"{self.api_url}/compare-faces", files=files, data={"inline_thumbnails": "true"})
             
             # Note: Synthetic images may not have detectable faces, so we accept both success and "no face" error
             if response.status_code == 200:
@@ -231,7 +231,7 @@ class FaceComparisonAPITester:
                 ('comparison_images', ('comp1.jpg', comp_image, 'image/jpeg'))
             ]
             
-            response = requests.post(f"{self.api_url}/compare-faces", files=files)
+            response = requests.post(f"{self.api_url}/compare-faces", files=files, data={"inline_thumbnails": "true"})
             
             # Should return 400 for no face in base image, but let's check if it would return image data
             if response.status_code == 400:
@@ -260,7 +260,7 @@ class FaceComparisonAPITester:
                 ('comparison_images', ('comp1.jpg', comp_image, 'image/jpeg'))
             ]
             
-            response = requests.post(f"{self.api_url}/compare-faces", files=files)
+            response = requests.post(f"{self.api_url}/compare-faces", files=files, data={"inline_thumbnails": "true"})
             
             # Should return 422 (validation error) for missing base_image
             if response.status_code == 422:
@@ -286,7 +286,7 @@ class FaceComparisonAPITester:
                 comp_image = self.create_test_image()
                 files.append(('comparison_images', (f'comp{i}.jpg', comp_image, 'image/jpeg')))
             
-            response = requests.post(f"{self.api_url}/compare-faces", files=files)
+            response = requests.post(f"{self.api_url}/compare-faces", files=files, data={"inline_thumbnails": "true"})
             
             # Should return 400 for too many images
             if response.status_code == 400:
@@ -317,7 +317,7 @@ class FaceComparisonAPITester:
                 ('comparison_images', ('comp1.jpg', comp_image, 'image/jpeg'))
             ]
             
-            response = requests.post(f"{self.api_url}/compare-faces", files=files)
+            response = requests.post(f"{self.api_url}/compare-faces", files=files, data={"inline_thumbnails": "true"})
             
             # Should return 400 for no face in base image
             if response.status_code == 400:
@@ -353,7 +353,7 @@ class FaceComparisonAPITester:
                 ('comparison_images', ('comp1.jpg', comp_image, 'image/jpeg'))
             ]
             
-            response = requests.post(f"{self.api_url}/compare-faces", files=files)
+            response = requests.post(f"{self.api_url}/compare-faces", files=files, data={"inline_thumbnails": "true"})
             
             # Should return 400 for invalid image format
             if response.status_code == 400:
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""All-pairs clustering: time and peak memory of the blocked scoring.
+
+Builds synthetic feature sets shaped like the pipeline's (256-bin L2
+normalized histograms): a number of identities, each a random center with
+noisy members, plus unrelated singletons. Each set is clustered with
+several working-memory budgets, reporting the wall time, the tracemalloc
+peak (numpy allocations included) and whether the identities came out
+as the expected clusters.
+
+Usage: python benchmarks/cluster_benchmark.py [--sizes 10000 20000] [--memory-mb 16 64 256] [--json out.json]
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from clustering import cluster_features, group_labels  # noqa: E402
+
+DIM = 256
+
+def synthetic_features(n, cluster_size=10, singleton_share=0.2, noise=0.05, seed=0):
+    """(features, identity per row); singletons get identity -1"""
+    rng = np.random.default_rng(seed)
+    n_clustered = int(n * (1 - singleton_share)) // cluster_size * cluster_size
+    n_identities = n_clustered // cluster_size
+    centers = rng.random((n_identities, DIM), dtype=np.float32)
+    identities = np.concatenate([
+        np.repeat(np.arange(n_identities), cluster_size),
+        np.full(n - n_clustered, -1),
+    ])
+    features = np.empty((n, DIM), dtype=np.float32)
+    features[:n_clustered] = centers[identities[:n_clustered]]
+    features[:n_clustered] += noise * rng.random((n_clustered, DIM), dtype=np.float32)
+    # Sparse singletons stay far from the dense identity centers
+    singletons = rng.random((n - n_clustered, DIM), dtype=np.float32)
+    singletons[singletons < 0.9] = 0
+    features[n_clustered:] = singletons
+    features /= np.linalg.norm(features, axis=1, keepdims=True)
+    order = rng.permutation(n)
+    return features[order], identities[order]
+
+def expected_groups(identities):
+    groups = {}
+    for row, identity in enumerate(identities):
+        if identity >= 0:
+            groups.setdefault(int(identity), []).append(row)
+    return {tuple(group) for group in groups.values()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 20000, 50000])
+    parser.add_argument('--memory-mb', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--threshold', type=float, default=0.95)
+    parser.add_argument('--json', type=Path, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    report = []
+    print(f"{'images':>8}{'memory MB':>11}{'seconds':>10}{'peak MB':>10}{'clusters':>10}{'exact':>7}")
+    for n in args.sizes:
+        features, identities = synthetic_features(n)
+        expected = expected_groups(identities)
+        for memory_mb in args.memory_mb:
+            tracemalloc.start()
+            start = time.perf_counter()
+            labels = cluster_features(features, args.threshold, memory_mb * 1024 * 1024)
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            clusters = {tuple(group) for group in group_labels(labels) if len(group) > 1}
+            row = {
+                'images': n,
+                'memory_mb': memory_mb,
+                'seconds': seconds,
+                'peak_mb': peak / 1024 / 1024,
+                'clusters': len(clusters),
+                'exact': clusters == expected,
+            }
+            report.append(row)
+            print(f"{n:>8}{memory_mb:>11}{seconds:>10.2f}{row['peak_mb']:>10.1f}"
+                  f"{row['clusters']:>10}{str(row['exact']):>7}")
+
+    print(f"\nthreshold={args.threshold}; a full n x n float32 matrix would need "
+          f"{max(args.sizes) ** 2 * 4 / 1024 / 1024:.0f} MB at n={max(args.sizes)}")
+    if args.json:
+        args.json.write_text(json.dumps({'threshold': args.threshold, 'results': report}, indent=2))
+
+if __name__ == '__main__':
+    main()
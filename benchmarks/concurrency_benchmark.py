@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Throughput of /api/compare-faces under concurrent requests.
+
+Sends requests from 1, 4 and 16 concurrent clients through httpx's ASGI
+transport (one event loop, like a real server process) and reports images
+analysed per second and request latency, for the process pool and for
+FACE_EXECUTOR=thread. Every upload is distinct, so nothing is served from
+the analysis cache, and the response cache is off, so a resent warmup or
+repeated request is computed again. MongoDB is not needed: the persistent
+analysis cache is disabled and the startup hooks are not run.
+
+Usage: python benchmarks/concurrency_benchmark.py [--clients 1,4,16] [--executors process,thread]
+           [--requests 4] [--images 4] [--side 1000] [--json out.json]
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+# Keep the benchmark self-contained: no persistent cache, throwaway thumbnails,
+# and no response cache (repeated requests are measured, not served from it)
+os.environ['FACE_CACHE_PERSIST'] = 'false'
+os.environ['RESULT_CACHE_PERSIST'] = 'false'
+os.environ['RESULT_CACHE_TTL_SECONDS'] = '0'
+os.environ.setdefault('THUMBNAIL_DIR', tempfile.mkdtemp(prefix='face-bench-thumbs-'))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'face_benchmark')
+
+import httpx  # noqa: E402
+
+import face_processing  # noqa: E402
+import server  # noqa: E402
+from face_cache import FaceCache  # noqa: E402
+
+def uploads(count, side, seed=0):
+    """Distinct JPEGs: a test photo pasted at a random spot of a random gradient"""
+    rng = np.random.default_rng(seed)
+    photos = [Image.open(ROOT / name).convert('RGB') for name in ('test_face1.jpg', 'test_face2.jpg')]
+    width, height = side, side * 3 // 4
+    face_side = int(height * 0.6)
+    photos = [photo.resize((face_side, face_side), Image.Resampling.LANCZOS) for photo in photos]
+    images = []
+    for i in range(count):
+        ramp = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None, None]
+        top, bottom = rng.integers(40, 220, size=3), rng.integers(40, 220, size=3)
+        canvas = Image.fromarray(np.broadcast_to((top * (1 - ramp) + bottom * ramp).astype(np.uint8),
+                                                 (height, width, 3)).copy())
+        canvas.paste(photos[i % 2], (int(rng.integers(0, width - face_side)), int(rng.integers(0, height - face_side))))
+        buffer = io.BytesIO()
+        canvas.save(buffer, format='JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+async def run_clients(client, requests):
+    """Post every request, a client per list in requests; returns latencies in seconds"""
+    async def run_client(batches):
+        latencies = []
+        for batch in batches:
+            files = [('base_image', ('base.jpg', batch[0], 'image/jpeg'))] + [
+                ('comparison_images', (f'{i}.jpg', data, 'image/jpeg')) for i, data in enumerate(batch[1:])
+            ]
+            start = time.perf_counter()
+            response = await client.post('/api/compare-faces', files=files)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    results = await asyncio.gather(*(run_client(batches) for batches in requests))
+    return [latency for latencies in results for latency in latencies]
+
+async def bench(args):
+    transport = httpx.ASGITransport(app=server.app)
+    report = []
+    print(f"{'executor':<10}{'clients':>8}{'images/s':>10}{'mean ms':>10}{'p95 ms':>9}")
+    seed = 0
+    async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=None) as client:
+        for executor in args.executors:
+            face_processing.shutdown_process_pool()
+            face_processing.FACE_EXECUTOR = executor
+            # Start the pool (and warm up its workers) before timing
+            warmup = uploads(2, 200, seed=len(args.clients) + 1)
+            await run_clients(client, [[warmup]])
+            for clients in args.clients:
+                seed += 1
+                per_request = args.images + 1
+                images = uploads(clients * args.requests * per_request, args.side, seed=seed)
+                batches = [images[i:i + per_request] for i in range(0, len(images), per_request)]
+                requests = [batches[c::clients] for c in range(clients)]
+                server.face_cache = FaceCache(max_bytes=server.face_cache.max_bytes)
+
+                start = time.perf_counter()
+                latencies = await run_clients(client, requests)
+                elapsed = time.perf_counter() - start
+                row = {
+                    'executor': executor,
+                    'clients': clients,
+                    'requests': len(latencies),
+                    'images': len(images),
+                    'images_per_second': len(images) / elapsed,
+                    'mean_ms': float(np.mean(latencies)) * 1000,
+                    'p95_ms': float(np.percentile(latencies, 95)) * 1000,
+                }
+                report.append(row)
+                print(f"{executor:<10}{clients:>8}{row['images_per_second']:>10.1f}{row['mean_ms']:>10.1f}"
+                      f"{row['p95_ms']:>9.1f}")
+    face_processing.shutdown_process_pool()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', default='1,4,16', help='Comma-separated numbers of concurrent clients')
+    parser.add_argument('--executors', default='process,thread', help='FACE_EXECUTOR values to compare')
+    parser.add_argument('--requests', type=int, default=4, help='Requests sent by each client')
+    parser.add_argument('--images', type=int, default=4, help='Comparison images per request')
+    parser.add_argument('--side', type=int, default=1000, help='Width of the uploads in pixels')
+    parser.add_argument('--json', type=Path, help='Write the results to this JSON file')
+    args = parser.parse_args()
+    args.clients = [int(value) for value in args.clients.split(',')]
+    args.executors = args.executors.split(',')
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    print(f"{face_processing.FACE_WORKERS} workers, {os.cpu_count()} CPUs, "
+          f"{face_processing.opencv_threads()} OpenCV thread(s) per worker\n")
+    report = asyncio.run(bench(args))
+    if args.json:
+        args.json.write_text(json.dumps({
+            'workers': face_processing.FACE_WORKERS, 'cpus': os.cpu_count(), 'results': report
+        }, indent=2))
+
+if __name__ == '__main__':
+    main()
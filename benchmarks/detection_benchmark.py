@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Detection latency and recall: full-resolution cascade vs downscaled passes.
+
+Runs detect_faces in-process on the bundled test_face1.jpg/test_face2.jpg and
+on a synthetic set where those photos are pasted at different scales into
+large (up to 4000px) canvases, down to faces of ~40px. Recall is measured
+against the faces found by the full-resolution pass (IoU >= 0.5), over all
+images and over the small-face ones (photo under 10% of the short side).
+
+With --detector, a cv2.dnn backend (DNN_DETECTOR_MODEL and, for the SSD,
+DNN_DETECTOR_CONFIG must point at its files) is also run through
+detect_faces_batch at each --batch-sizes entry, reporting time per image and
+recall against the same cascade reference. DETECTOR_THREADS sets the OpenCV
+threads, as in the pool workers.
+
+Usage: python benchmarks/detection_benchmark.py [--repeat 1] [--detector ssd --batch-sizes 1,4,16] [--json out.json]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+import face_processing  # noqa: E402
+from face_detectors import FACE_DETECTORS, get_face_detector  # noqa: E402
+from face_processing import DETECTION_MAX_SIDE, DETECTOR_THREADS, detect_faces, detect_faces_batch  # noqa: E402
+
+CONFIGS = [
+    ('full resolution', dict(max_side=0, refine=False)),
+    ('max_side=640', dict(max_side=640, refine=False)),
+    ('max_side=640 + refine', dict(max_side=640, refine=True)),
+    ('max_side=1024', dict(max_side=1024, refine=False)),
+    ('max_side=1024 + refine', dict(max_side=1024, refine=True)),
+]
+
+def load_photos():
+    return [np.array(Image.open(ROOT / name).convert('RGB')) for name in ('test_face1.jpg', 'test_face2.jpg')]
+
+# Pasted photo side as a fraction of the canvas short side; the face fills
+# ~70% of the bundled photos, so 0.02 is a ~40px face on a 4000x3000 canvas
+FACE_FRACTIONS = (0.02, 0.03, 0.05, 0.1, 0.25, 0.5)
+SMALL_FACE_FRACTION = 0.1
+
+def synthetic_set(photos, seed=0):
+    """Paste each photo into larger noisy canvases at several scales; (label, image, fraction) each"""
+    rng = np.random.default_rng(seed)
+    images = [('bundled', photo, 1.0) for photo in photos]
+    for canvas_side in (2000, 3000, 4000):
+        for fraction in FACE_FRACTIONS:
+            for photo in photos:
+                height, width = int(canvas_side * 0.75), canvas_side
+                canvas = rng.integers(60, 200, size=(height, width, 3), dtype=np.uint8)
+                side = int(min(height, width) * fraction)
+                pasted = np.array(Image.fromarray(photo).resize((side, side), Image.Resampling.LANCZOS))
+                y = int(rng.integers(0, height - side))
+                x = int(rng.integers(0, width - side))
+                canvas[y:y + side, x:x + side] = pasted
+                images.append((f'{width}x{height} face {fraction:.0%}', canvas, fraction))
+    return images
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+def recall(reference, found, threshold=0.5):
+    if len(reference) == 0:
+        return None
+    matched = sum(1 for ref in reference if any(iou(ref, box) >= threshold for box in found))
+    return matched / len(reference)
+
+def summarize(name, params, latencies, reference, found, small):
+    """Latency and recall row for one configuration; found holds one box list per image
+    and small flags the small-face images"""
+    recalls, small_recalls, ious = [], [], []
+    for ref, faces, is_small in zip(reference, found, small):
+        image_recall = recall(ref, faces)
+        if image_recall is not None:
+            recalls.append(image_recall)
+            if is_small:
+                small_recalls.append(image_recall)
+            ious.extend(max((iou(r, f) for f in faces), default=0.0) for r in ref)
+    row = {
+        'config': name,
+        'params': params,
+        'mean_ms': float(np.mean(latencies)),
+        'p50_ms': float(np.median(latencies)),
+        'max_ms': float(np.max(latencies)),
+        'recall': float(np.mean(recalls)) if recalls else None,
+        'small_face_recall': float(np.mean(small_recalls)) if small_recalls else None,
+        'mean_iou': float(np.mean(ious)) if ious else None,
+    }
+    print(f"{name:<26}{row['mean_ms']:>10.1f}{row['p50_ms']:>10.1f}{row['max_ms']:>10.1f}"
+          f"{row['recall'] if row['recall'] is not None else float('nan'):>9.2f}"
+          f"{row['small_face_recall'] if row['small_face_recall'] is not None else float('nan'):>8.2f}"
+          f"{row['mean_iou'] if row['mean_iou'] is not None else float('nan'):>7.2f}")
+    return row
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--detector', choices=sorted(FACE_DETECTORS), help='Also run this cv2.dnn backend')
+    parser.add_argument('--batch-sizes', default='1,4,16', help='Comma-separated batch sizes for --detector')
+    parser.add_argument('--json', type=Path, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    cv2.setNumThreads(DETECTOR_THREADS)
+    if args.detector:
+        # Fail here on a missing model: detect_faces_batch would report no faces
+        get_face_detector(args.detector)
+    # The cascade configurations and the reference always use the Haar cascade
+    face_processing.FACE_DETECTOR = 'haar'
+    images = synthetic_set(load_photos())
+    reference = [detect_faces(image, max_side=0, refine=False)[1] for _, image, _ in images]
+    small = [fraction < SMALL_FACE_FRACTION for _, _, fraction in images]
+
+    report = []
+    print(f"{'config':<26}{'mean ms':>10}{'p50 ms':>10}{'max ms':>10}{'recall':>9}{'small':>8}{'IoU':>7}")
+    for name, params in CONFIGS:
+        latencies, found = [], []
+        for _, image, _ in images:
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                _, faces = detect_faces(image, **params)
+                latencies.append((time.perf_counter() - start) * 1000)
+            found.append(faces)
+        report.append(summarize(name, params, latencies, reference, found, small))
+
+    if args.detector:
+        face_processing.FACE_DETECTOR = args.detector
+        for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+            # Latency is per image: the time of each batch split over its images
+            latencies, found = [], []
+            for start_index in range(0, len(images), batch_size):
+                batch = [image for _, image, _ in images[start_index:start_index + batch_size]]
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    detections = detect_faces_batch(batch)
+                    latencies.extend([(time.perf_counter() - start) * 1000 / len(batch)] * len(batch))
+                found.extend(faces for _, faces in detections)
+            params = {'detector': args.detector, 'batch_size': batch_size, 'max_side': DETECTION_MAX_SIDE,
+                      'threads': DETECTOR_THREADS}
+            report.append(summarize(f'{args.detector} batch={batch_size}', params, latencies, reference, found, small))
+
+    print(f"\n{len(images)} images, {sum(len(r) for r in reference)} reference faces, "
+          f"{args.repeat} runs each")
+    if args.json:
+        args.json.write_text(json.dumps({'images': len(images), 'results': report}, indent=2))
+
+if __name__ == '__main__':
+    main()
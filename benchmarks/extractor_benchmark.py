@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Feature extractors: latency per face and verification accuracy.
+
+For every available extractor (set FACE_EMBEDDING_MODEL to include 'onnx')
+this reports the vector dimension, the time to extract one face and eight
+faces of the same image, and accuracy on a labelled set of faces:
+
+- AUC: probability that a same-person pair scores above a different-person pair
+- TAR@FAR=1%: same-person pairs accepted at the threshold that accepts 1% of
+  different-person pairs
+- rank-1: share of faces whose most similar other face is the same person
+
+Pass --dataset with one sub-directory of photos per person (the LFW layout);
+each photo's largest detected face is used. Without it, the faces of the
+bundled test photos are augmented (box jitter, exposure, blur, mirroring)
+into a small synthetic set, which measures robustness to those changes
+rather than discrimination between many people.
+
+Usage: python benchmarks/extractor_benchmark.py [--dataset DIR] [--json out.json]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from face_processing import DECODE_MAX_SIDE, decode_image, detect_faces, largest_face_index  # noqa: E402
+from feature_extractors import available_extractors, get_feature_extractor  # noqa: E402
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+
+def largest_face(path):
+    """(RGB image, box of its largest face) or None if no face is detected"""
+    image, _ = decode_image(path.read_bytes(), max_side=DECODE_MAX_SIDE)
+    has_face, faces = detect_faces(image)
+    if not has_face:
+        return None
+    return image, tuple(int(v) for v in faces[largest_face_index(faces)])
+
+def dataset_faces(root):
+    """(image, box, person) for every photo with a face under root/<person>/"""
+    samples = []
+    for person_dir in sorted(path for path in root.iterdir() if path.is_dir()):
+        for path in sorted(person_dir.iterdir()):
+            if path.suffix.lower() in IMAGE_SUFFIXES:
+                face = largest_face(path)
+                if face is not None:
+                    samples.append((*face, person_dir.name))
+    return samples
+
+def augmented_faces(per_person=40, seed=0):
+    """Augmented copies of the faces in the bundled test photos"""
+    rng = np.random.default_rng(seed)
+    samples = []
+    for person, name in enumerate(('test_face1.jpg', 'test_face2.jpg')):
+        image, (x, y, w, h) = largest_face(ROOT / name)
+        for _ in range(per_person):
+            dx, dy = rng.integers(-w // 10, w // 10 + 1, size=2)
+            side = int(w * rng.uniform(0.9, 1.1))
+            x0 = int(np.clip(x + dx, 0, image.shape[1] - side))
+            y0 = int(np.clip(y + dy, 0, image.shape[0] - side))
+            crop = image[y0:y0 + side, x0:x0 + side]
+            table = np.clip(
+                255 * (np.arange(256) / 255) ** rng.uniform(0.7, 1.4) * rng.uniform(0.8, 1.1), 0, 255
+            ).astype(np.uint8)
+            crop = cv2.GaussianBlur(table[crop], (0, 0), rng.uniform(0.1, 2.0))
+            if rng.random() < 0.5:
+                crop = crop[:, ::-1]
+            samples.append((np.ascontiguousarray(crop), (0, 0, side, side), str(person)))
+    return samples
+
+def verification_metrics(features, people):
+    """AUC, TAR at FAR=1% and rank-1 accuracy over all pairs"""
+    scores = features @ features.T
+    same = people[:, None] == people[None, :]
+    upper = np.triu(np.ones_like(same), k=1)
+    genuine, impostor = scores[upper & same], scores[upper & ~same]
+
+    # Mann-Whitney U over the ranks of all pair scores
+    ranks = np.argsort(np.argsort(np.concatenate([genuine, impostor]))) + 1
+    auc = (ranks[:len(genuine)].sum() - len(genuine) * (len(genuine) + 1) / 2) / (len(genuine) * len(impostor))
+    threshold = np.quantile(impostor, 0.99)
+    tar = float(np.mean(genuine > threshold))
+
+    np.fill_diagonal(scores, -np.inf)
+    rank1 = float(np.mean(people[np.argmax(scores, axis=1)] == people))
+    return float(auc), tar, rank1
+
+def extractor_input(extractor, image):
+    """RGB for color extractors, grayscale otherwise (as analyze_image does)"""
+    if extractor.color or image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+def per_face_ms(extractor, image, box, faces_per_call, repeat):
+    source = extractor_input(extractor, image)
+    boxes = [box] * faces_per_call
+    extractor.extract(source, boxes)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        extractor.extract(source, boxes)
+    return (time.perf_counter() - start) / (repeat * faces_per_call) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dataset', type=Path, help='One sub-directory of photos per person')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--json', type=Path, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    samples = dataset_faces(args.dataset) if args.dataset else augmented_faces()
+    people = np.array([person for _, _, person in samples])
+    if len(set(people)) < 2:
+        sys.exit("Need faces of at least two people")
+    timing_image, timing_box = largest_face(ROOT / 'test_face1.jpg')
+
+    report = []
+    print(f"{len(samples)} faces of {len(set(people))} people"
+          f"{'' if args.dataset else ' (augmented test photos)'}\n")
+    print(f"{'extractor':<11}{'dim':>6}{'ms/face':>9}{'ms/face x8':>12}{'AUC':>8}{'TAR@1%':>8}{'rank-1':>8}")
+    for name in available_extractors():
+        extractor = get_feature_extractor(name)
+        features = np.vstack([
+            extractor.extract(extractor_input(extractor, image), [box]) for image, box, _ in samples
+        ])
+        auc, tar, rank1 = verification_metrics(features, people)
+        row = {
+            'extractor': name,
+            'dim': extractor.dim,
+            'ms_per_face': per_face_ms(extractor, timing_image, timing_box, 1, args.repeat),
+            'ms_per_face_batch8': per_face_ms(extractor, timing_image, timing_box, 8, args.repeat // 8 or 1),
+            'auc': auc,
+            'tar_at_far_1pct': tar,
+            'rank1': rank1,
+        }
+        report.append(row)
+        print(f"{name:<11}{extractor.dim:>6}{row['ms_per_face']:>9.3f}{row['ms_per_face_batch8']:>12.3f}"
+              f"{auc:>8.3f}{tar:>8.3f}{rank1:>8.3f}")
+
+    if args.json:
+        args.json.write_text(json.dumps({'faces': len(samples), 'results': report}, indent=2))
+
+if __name__ == '__main__':
+    main()
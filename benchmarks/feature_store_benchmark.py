@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Gallery loading: per-document decoding vs the memory-mapped feature store.
+
+The document path rebuilds the matrix the way load_gallery_index does from
+MongoDB (one float32 Binary per face, np.frombuffer + np.vstack), without the
+database round trips, so it is a lower bound for that path. Each store dtype
+is written once, then timed for loading into a VectorIndex, appending a
+batch and searching; top-10 agreement is measured against float32.
+
+Usage: python benchmarks/feature_store_benchmark.py [--sizes 100000 500000] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from feature_store import STORE_DTYPES, FeatureStore  # noqa: E402
+from vector_index import VectorIndex  # noqa: E402
+
+DIM = 256
+QUERIES = 50
+
+def gallery(n, seed=0):
+    """Non-negative L2-normalized vectors, like the histogram features"""
+    rng = np.random.default_rng(seed)
+    vectors = rng.random((n, DIM), dtype=np.float32) ** 4
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [f'{i:08d}-0000-4000-8000-000000000000' for i in range(n)], vectors
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def load_documents(documents):
+    ids = [document['id'] for document in documents]
+    matrix = np.vstack([np.frombuffer(document['features'], dtype=np.float32) for document in documents])
+    index = VectorIndex(min_train_size=sys.maxsize)
+    index.load(ids, matrix)
+    return index
+
+def load_store(store):
+    ids, matrix = store.load()
+    index = VectorIndex(min_train_size=sys.maxsize)
+    index.load(ids, matrix)
+    return index
+
+def top_ids(index, queries):
+    return [{item_id for item_id, _ in index.search(query, 10)} for query in queries]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 500000])
+    parser.add_argument('--json', type=Path, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    report = []
+    print(f"{'faces':>8} {'source':<10}{'load ms':>10}{'MB':>9}{'append ms':>11}{'search ms':>11}{'top-10':>8}")
+    for n in args.sizes:
+        ids, vectors = gallery(n)
+        queries = vectors[np.random.default_rng(1).choice(n, QUERIES, replace=False)]
+        documents = [{'id': item_id, 'features': row.tobytes()} for item_id, row in zip(ids, vectors)]
+        index, load_seconds = timed(load_documents, documents)
+        reference = top_ids(index, queries)
+        report.append({'faces': n, 'source': 'documents', 'load_ms': load_seconds * 1000,
+                       'megabytes': vectors.nbytes / 1024 / 1024})
+        print(f"{n:>8} {'documents':<10}{load_seconds * 1000:>10.1f}{vectors.nbytes / 1024 / 1024:>9.1f}")
+        del documents, index
+
+        for dtype in STORE_DTYPES:
+            with tempfile.TemporaryDirectory() as directory:
+                store = FeatureStore(directory, dtype)
+                store.rewrite(ids, vectors)
+                megabytes = sum(
+                    os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+                ) / 1024 / 1024
+                index, load_seconds = timed(load_store, store)
+
+                _, append_seconds = timed(store.append, [f'new-{i}' for i in range(100)], vectors[:100])
+                start = time.perf_counter()
+                results = top_ids(index, queries)
+                search_seconds = (time.perf_counter() - start) / QUERIES
+                agreement = np.mean([len(a & b) / 10 for a, b in zip(reference, results)])
+                del index
+
+            row = {
+                'faces': n,
+                'source': dtype,
+                'load_ms': load_seconds * 1000,
+                'megabytes': megabytes,
+                'append_100_ms': append_seconds * 1000,
+                'search_ms': search_seconds * 1000,
+                'top10_agreement': float(agreement),
+            }
+            report.append(row)
+            print(f"{n:>8} {dtype:<10}{row['load_ms']:>10.1f}{megabytes:>9.1f}{row['append_100_ms']:>11.2f}"
+                  f"{row['search_ms']:>11.2f}{agreement:>8.3f}")
+
+    print(f"\n{DIM}-dim vectors; documents = np.frombuffer per face + vstack (no MongoDB I/O)")
+    if args.json:
+        args.json.write_text(json.dumps({'results': report}, indent=2))
+
+if __name__ == '__main__':
+    main()
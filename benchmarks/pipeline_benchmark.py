@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""Offline benchmark of the compare-faces pipeline, stage by stage and end to end.
+
+Inputs are synthetic JPEGs: smooth backgrounds with either a bundled test
+photo or a drawn face-like pattern (as in backend_test.py) pasted at a
+random spot, so every image in a batch is distinct and nothing is served
+from the analysis cache.
+
+The stage section calls the pipeline functions directly in this process
+(decode, detect, features, thumbnail for each image size; scoring and
+response serialization for each batch size). The request section posts
+batches to /api/compare-faces through FastAPI's TestClient, with the real
+process pool, and reports latency, throughput, the per-request stage
+breakdown (include_timings) and the peak RSS of the server process plus its
+workers. MongoDB is not needed: the persistent
+analysis cache and the response cache are disabled and the startup hooks
+are not run.
+
+Results are written as JSON (--json) and can be compared against an earlier
+run with --baseline to spot regressions between commits.
+
+Usage: python benchmarks/pipeline_benchmark.py [--batch-sizes 1,10,50,250]
+           [--sides 200,500,1000,2000,4000] [--repeat 1] [--json out.json]
+           [--baseline previous.json]
+"""
+import argparse
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+# Keep the benchmark self-contained: no persistent cache, throwaway thumbnails,
+# and no response cache (repeated requests are measured, not served from it)
+os.environ['FACE_CACHE_PERSIST'] = 'false'
+os.environ['RESULT_CACHE_PERSIST'] = 'false'
+os.environ['RESULT_CACHE_TTL_SECONDS'] = '0'
+os.environ.setdefault('THUMBNAIL_DIR', tempfile.mkdtemp(prefix='face-bench-thumbs-'))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'face_benchmark')
+
+import cv2  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+from face_cache import FaceCache  # noqa: E402
+from face_processing import (  # noqa: E402
+    DECODE_MAX_SIDE,
+    FACE_WORKERS,
+    detect_faces,
+    extract_all_face_features,
+    make_thumbnail,
+    open_image,
+    score_features,
+    shutdown_process_pool,
+    stack_features,
+)
+
+BATCH_SIZES = (1, 10, 50, 250)
+SIDES = (200, 500, 1000, 2000, 4000)
+
+def face_like_image(side):
+    """Drawn face pattern (oval, eyes, nose, mouth) like backend_test.py's"""
+    image = Image.new('RGB', (side, side), (240, 220, 200))
+    draw = ImageDraw.Draw(image)
+    margin = side // 10
+    draw.ellipse([margin, margin, side - margin, side - margin], fill=(220, 200, 180), outline=(180, 160, 140))
+    eye_y, eye_r, pupil_r = side // 3, side // 13, side // 33
+    for eye_x in (side // 3, 2 * side // 3):
+        draw.ellipse([eye_x - eye_r, eye_y - eye_r // 2, eye_x + eye_r, eye_y + eye_r // 2], fill=(255, 255, 255), outline=(0, 0, 0))
+        draw.ellipse([eye_x - pupil_r, eye_y - pupil_r, eye_x + pupil_r, eye_y + pupil_r], fill=(0, 0, 0))
+        draw.arc([eye_x - eye_r, eye_y - side // 8, eye_x + eye_r, eye_y - side // 16], 0, 180, fill=(100, 80, 60), width=max(1, side // 60))
+    draw.polygon([(side // 2, side // 2 - side // 20), (side // 2 - side // 20, side // 2 + side // 10),
+                  (side // 2 + side // 20, side // 2 + side // 10)], fill=(200, 180, 160))
+    draw.arc([side // 3, 2 * side // 3 - side // 12, 2 * side // 3, 2 * side // 3 + side // 12], 0, 180,
+             fill=(150, 100, 100), width=max(1, side // 50))
+    return image
+
+class InputFactory:
+    """Builds distinct JPEG uploads of a given width (4:3 landscape)"""
+
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.photos = [Image.open(ROOT / name).convert('RGB') for name in ('test_face1.jpg', 'test_face2.jpg')]
+
+    def make(self, side, index):
+        width, height = side, max(1, side * 3 // 4)
+        top = self.rng.integers(40, 220, size=3)
+        bottom = self.rng.integers(40, 220, size=3)
+        ramp = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None, None]
+        background = (top * (1 - ramp) + bottom * ramp).astype(np.uint8)
+        canvas = Image.fromarray(np.broadcast_to(background, (height, width, 3)).copy())
+
+        face_side = max(32, int(min(width, height) * 0.6))
+        if index % 3 == 2:
+            face = face_like_image(face_side)
+        else:
+            face = self.photos[index % 3].resize((face_side, face_side), Image.Resampling.LANCZOS)
+        x = int(self.rng.integers(0, max(1, width - face_side)))
+        y = int(self.rng.integers(0, max(1, height - face_side)))
+        canvas.paste(face, (x, y))
+
+        buffer = io.BytesIO()
+        canvas.save(buffer, format='JPEG', quality=90)
+        return buffer.getvalue()
+
+    def batch(self, side, count):
+        return [self.make(side, i) for i in range(count)]
+
+def rss_bytes(pid):
+    """Resident set size of a process, from /proc (Linux only)"""
+    try:
+        with open(f'/proc/{pid}/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+class RssSampler:
+    """Samples the summed RSS of this process and its workers in a thread"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        pids = [os.getpid()] + [child.pid for child in multiprocessing.active_children()]
+        self.peak = max(self.peak, sum(rss_bytes(pid) for pid in pids))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    return value, (time.perf_counter() - start) * 1000
+
+def decode(data):
+    """Decode an upload the way analyze_image does (PIL image plus grayscale array)"""
+    image, _ = open_image(data, max_side=DECODE_MAX_SIDE)
+    image.load()
+    return image, cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY)
+
+def summarize(latencies):
+    return {
+        'mean_ms': float(np.mean(latencies)),
+        'p50_ms': float(np.median(latencies)),
+        'max_ms': float(np.max(latencies)),
+    }
+
+def bench_image_stages(factory, sides, repeat, images_per_side=6):
+    """Decode, detect, features and thumbnail timings per image size"""
+    rows = []
+    print(f"\n{'side':>6}{'decode':>10}{'detect':>10}{'features':>10}{'thumbnail':>11}{'faces':>7}   (mean ms)")
+    for side in sides:
+        stages = {'decode': [], 'detect': [], 'features': [], 'thumbnail': []}
+        found = 0
+        for data in factory.batch(side, images_per_side):
+            for _ in range(repeat):
+                (image, gray), ms = timed(decode, data)
+                stages['decode'].append(ms)
+                _, ms = timed(make_thumbnail, image)
+                stages['thumbnail'].append(ms)
+                (has_face, faces), ms = timed(detect_faces, gray)
+                stages['detect'].append(ms)
+                _, ms = timed(extract_all_face_features, gray, faces)
+                stages['features'].append(ms)
+            found += int(has_face)
+        row = {'side': side, 'faces_found': found, 'images': images_per_side}
+        row.update({stage: summarize(values) for stage, values in stages.items()})
+        rows.append(row)
+        print(f"{side:>6}{row['decode']['mean_ms']:>10.2f}{row['detect']['mean_ms']:>10.2f}"
+              f"{row['features']['mean_ms']:>10.2f}{row['thumbnail']['mean_ms']:>11.2f}"
+              f"{found:>4}/{images_per_side}")
+    return rows
+
+def bench_batch_stages(batch_sizes, repeat, dim=256, seed=0):
+    """Scoring and response serialization timings per batch size"""
+    rng = np.random.default_rng(seed)
+    thumbnail = make_thumbnail(np.full((150, 150, 3), 128, dtype=np.uint8))
+    rows = []
+    print(f"\n{'batch':>6}{'scoring':>10}{'serialize':>11}   (mean ms)")
+    for batch_size in batch_sizes:
+        vectors = rng.random((batch_size + 1, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        analyses = [{
+            'has_face': True, 'faces': [[0, 0, 10, 10]], 'features': vector,
+            'thumbnail': thumbnail, 'thumbnail_key': '0' * 64, 'error': None, 'error_detail': None,
+        } for vector in vectors[1:]]
+
+        scoring, serialize = [], []
+        for _ in range(repeat):
+            _, ms = timed(lambda: score_features(vectors[0], stack_features([a['features'] for a in analyses])))
+            scoring.append(ms)
+            similarities, _ = server.match_analyses(vectors[0], analyses)
+
+            def serialize_response():
+                response = server.ComparisonResponse(
+                    base_image_has_face=True,
+                    base_image_url=server.thumbnail_url(analyses[0]),
+                    results=[server.build_comparison_result(i, a, similarities[i]) for i, a in enumerate(analyses)],
+                    total_images=batch_size,
+                    processing_time=0.0,
+                )
+                return json.dumps(jsonable_encoder(response))
+            _, ms = timed(serialize_response)
+            serialize.append(ms)
+
+        row = {'batch_size': batch_size, 'scoring': summarize(scoring), 'serialization': summarize(serialize)}
+        rows.append(row)
+        print(f"{batch_size:>6}{row['scoring']['mean_ms']:>10.3f}{row['serialization']['mean_ms']:>11.3f}")
+    return rows
+
+def bench_requests(factory, client, batch_sizes, sides, repeat):
+    """End-to-end /api/compare-faces latency, throughput and peak RSS"""
+    rows = []
+    print(f"\n{'batch':>6}{'side':>6}{'mean ms':>11}{'images/s':>10}{'peak RSS MB':>13}")
+    for side in sides:
+        for batch_size in batch_sizes:
+            base = factory.make(side, 0)
+            comparisons = factory.batch(side, batch_size)
+            latencies = []
+            with RssSampler() as sampler:
+                for _ in range(repeat):
+                    # Start cold every run, so repeated bytes are analysed again
+                    server.face_cache = FaceCache(max_bytes=server.face_cache.max_bytes)
+                    files = [('base_image', ('base.jpg', base, 'image/jpeg'))] + [
+                        ('comparison_images', (f'{i}.jpg', data, 'image/jpeg'))
+                        for i, data in enumerate(comparisons)
+                    ]
+                    response, ms = timed(
+                        client.post, '/api/compare-faces', files=files, data={'include_timings': 'true'}
+                    )
+                    latencies.append(ms)
+            row = {
+                'batch_size': batch_size,
+                'side': side,
+                'status_code': response.status_code,
+                **summarize(latencies),
+                'images_per_second': (batch_size + 1) / (np.mean(latencies) / 1000),
+                'peak_rss_bytes': sampler.peak,
+                # Worker stage seconds summed over the batch (last run)
+                'stage_timings': response.json().get('stage_timings') if response.status_code == 200 else None,
+            }
+            rows.append(row)
+            note = '' if response.status_code == 200 else f"  (HTTP {response.status_code})"
+            print(f"{batch_size:>6}{side:>6}{row['mean_ms']:>11.1f}{row['images_per_second']:>10.1f}"
+                  f"{sampler.peak / 2**20:>13.1f}{note}")
+    return rows
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'face_workers': FACE_WORKERS,
+        'decode_max_side': DECODE_MAX_SIDE,
+        'max_inflight_images': server.MAX_INFLIGHT_IMAGES,
+    }
+
+def compare_to_baseline(report, baseline):
+    """Print the relative change of every end-to-end mean latency"""
+    previous = {(row['batch_size'], row['side']): row for row in baseline.get('requests', [])}
+    print(f"\nvs baseline {baseline.get('environment', {}).get('commit')}:")
+    for row in report['requests']:
+        old = previous.get((row['batch_size'], row['side']))
+        if old is None:
+            continue
+        change = (row['mean_ms'] - old['mean_ms']) / old['mean_ms'] * 100
+        rss_change = (row['peak_rss_bytes'] - old['peak_rss_bytes']) / 2**20
+        print(f"  batch {row['batch_size']:>3} side {row['side']:>4}: {change:+6.1f}% latency, {rss_change:+7.1f} MB peak RSS")
+
+def parse_ints(text):
+    return [int(value) for value in text.split(',') if value]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-sizes', type=parse_ints, default=list(BATCH_SIZES))
+    parser.add_argument('--sides', type=parse_ints, default=list(SIDES))
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--json', type=Path, help='Write the results to this JSON file')
+    parser.add_argument('--baseline', type=Path, help='Earlier --json output to compare against')
+    args = parser.parse_args()
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    factory = InputFactory()
+    report = {'environment': environment()}
+    print(f"Stages (in-process, DECODE_MAX_SIDE={DECODE_MAX_SIDE})")
+    report['image_stages'] = bench_image_stages(factory, args.sides, args.repeat)
+    report['batch_stages'] = bench_batch_stages(args.batch_sizes, args.repeat)
+
+    # No context manager: startup hooks would load the gallery from MongoDB
+    client = TestClient(server.app)
+    try:
+        # Warm up the process pool so its start-up cost is not measured
+        warmup = factory.make(200, 0)
+        client.post('/api/compare-faces', files=[
+            ('base_image', ('base.jpg', warmup, 'image/jpeg')),
+            ('comparison_images', ('0.jpg', warmup, 'image/jpeg')),
+        ])
+        print(f"\nRequests ({FACE_WORKERS} workers, {args.repeat} runs each)")
+        report['requests'] = bench_requests(factory, client, args.batch_sizes, args.sides, args.repeat)
+    finally:
+        shutdown_process_pool()
+
+    report['max_rss_self_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    if args.baseline:
+        compare_to_baseline(report, json.loads(args.baseline.read_text()))
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Cost of no-face images with and without the coarse pre-screen.
+
+Runs analyze_image in-process on JPEG uploads of two kinds: the bundled
+test photos pasted at several scales into canvases of 600 to 4000px, down
+to faces of ~20px (faces), and synthetic scenes of smooth shading, shapes
+and noise (no face). Each PRESCREEN_MAX_SIDE setting reports the time per
+image of both sets, how many uploads were rejected at the pre-screen and
+at full detection, and the share of face images still found compared to
+running without it, over all of them and over the small faces (photo
+under 10% of the short side). Images too large for the pre-screen to see
+the smallest faces full detection finds skip it.
+
+Usage: python benchmarks/prescreen_benchmark.py [--sides 0,320,480,640] [--json out.json]
+"""
+import argparse
+import io
+import json
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+import face_processing  # noqa: E402
+from face_processing import analyze_image  # noqa: E402
+
+def jpeg(image_array, quality=90):
+    buffer = io.BytesIO()
+    Image.fromarray(image_array).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+# Pasted photo side as a fraction of the canvas short side (the face fills ~70% of it)
+FACE_FRACTIONS = (0.03, 0.05, 0.1, 0.25, 0.5)
+SMALL_FACE_FRACTION = 0.1
+
+def face_uploads(seed=0):
+    """Test photos pasted into noisy canvases; (upload, fraction of the short side) each"""
+    rng = np.random.default_rng(seed)
+    photos = [np.array(Image.open(ROOT / name).convert('RGB')) for name in ('test_face1.jpg', 'test_face2.jpg')]
+    uploads = [(jpeg(photo), 1.0) for photo in photos]
+    for canvas_side in (600, 1600, 3000, 4000):
+        for fraction in FACE_FRACTIONS:
+            for photo in photos:
+                height, width = int(canvas_side * 0.75), canvas_side
+                canvas = rng.integers(60, 200, size=(height, width, 3), dtype=np.uint8)
+                side = int(min(height, width) * fraction)
+                pasted = np.array(Image.fromarray(photo).resize((side, side), Image.Resampling.LANCZOS))
+                y, x = int(rng.integers(0, height - side)), int(rng.integers(0, width - side))
+                canvas[y:y + side, x:x + side] = pasted
+                uploads.append((jpeg(canvas), fraction))
+    return uploads
+
+def scene_uploads(n=20, seed=1):
+    """Photo-sized scenes without faces: low-frequency shading, shapes and sensor noise"""
+    rng = np.random.default_rng(seed)
+    uploads = []
+    for i in range(n):
+        width = int(rng.choice([600, 1600, 3000, 4000]))
+        height = width * 3 // 4
+        shading = rng.integers(0, 256, size=(6, 8, 3), dtype=np.uint8)
+        image = cv2.resize(shading, (width, height), interpolation=cv2.INTER_CUBIC)
+        for _ in range(int(rng.integers(5, 25))):
+            color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+            x0, y0 = int(rng.integers(0, width)), int(rng.integers(0, height))
+            size = int(rng.integers(width // 40, width // 4))
+            if rng.random() < 0.5:
+                cv2.rectangle(image, (x0, y0), (x0 + size, y0 + size // 2), color, -1)
+            else:
+                cv2.circle(image, (x0, y0), size // 2, color, -1)
+        noise = rng.normal(0, 8, size=image.shape)
+        uploads.append(jpeg(np.clip(image + noise, 0, 255).astype(np.uint8)))
+    return uploads
+
+def run(uploads, repeat):
+    """Mean ms per upload, the analyses and the rejection stage counts"""
+    analyses = [analyze_image(upload) for upload in uploads]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for upload in uploads:
+            analyze_image(upload)
+    ms = (time.perf_counter() - start) * 1000 / (repeat * len(uploads))
+    return ms, analyses, Counter(analysis['rejected_at'] for analysis in analyses if analysis['rejected_at'])
+
+def recall(found, baseline, mask=None):
+    """Share of the images with a face at full detection (within mask) still found"""
+    mask = mask or [True] * len(baseline)
+    expected = [f for f, b, m in zip(found, baseline, mask) if b and m]
+    return sum(expected) / max(1, len(expected))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sides', default='0,320,480,640', help='PRESCREEN_MAX_SIDE values (0 = off)')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--json', type=Path, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)
+    faces, scenes = face_uploads(), scene_uploads()
+    small = [fraction < SMALL_FACE_FRACTION for _, fraction in faces]
+    faces = [upload for upload, _ in faces]
+    face_processing.PRESCREEN_MAX_SIDE = 0
+    baseline = [analyze_image(upload)['has_face'] for upload in faces]
+
+    report = []
+    print(f"{len(faces)} face uploads ({sum(baseline)} with a face at full detection), {len(scenes)} scenes\n")
+    print(f"{'prescreen':<11}{'face ms':>9}{'scene ms':>10}{'face recall':>13}{'small':>7}"
+          f"{'scenes rejected (prescreen/detect)':>37}")
+    for side in (int(value) for value in args.sides.split(',')):
+        face_processing.PRESCREEN_MAX_SIDE = side
+        face_ms, face_analyses, _ = run(faces, args.repeat)
+        scene_ms, _, scene_rejections = run(scenes, args.repeat)
+        found = [analysis['has_face'] for analysis in face_analyses]
+        row = {
+            'prescreen_max_side': side,
+            'face_ms': face_ms,
+            'scene_ms': scene_ms,
+            'face_recall': recall(found, baseline),
+            'small_face_recall': recall(found, baseline, small),
+            'scene_rejections': dict(scene_rejections),
+        }
+        report.append(row)
+        print(f"{side or 'off':<11}{face_ms:>9.1f}{scene_ms:>10.1f}{row['face_recall']:>13.2f}"
+              f"{row['small_face_recall']:>7.2f}"
+              f"{scene_rejections['prescreen']:>26}/{scene_rejections['detect']}")
+
+    if args.json:
+        args.json.write_text(json.dumps({'faces': len(faces), 'scenes': len(scenes), 'results': report}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Accuracy and speed of int8 quantized gallery scoring.
+
+Gallery and probe features are real histogram features: extract_face_features
+on randomly cropped, rescaled and re-exposed patches of the bundled test
+photos. Scores from a float32 VectorIndex (checked against
+calculate_similarity on a sample of pairs) are the reference; the quantized
+index is compared on score error, Spearman rank correlation over the whole
+gallery and top-k recall, alone and after re-ranking with the float vectors.
+
+Usage: python benchmarks/quantization_benchmark.py [--gallery 20000] [--queries 200] [--json out.json]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from face_processing import calculate_similarity, extract_face_features  # noqa: E402
+from quantization import rerank  # noqa: E402
+from vector_index import VectorIndex  # noqa: E402
+
+K = 10
+RERANK_FACTORS = (1, 2, 4, 8)
+
+def histogram_features(n, seed=0):
+    """Features of n random augmented patches of the test photos"""
+    rng = np.random.default_rng(seed)
+    photos = []
+    for name in ('test_face1.jpg', 'test_face2.jpg'):
+        photo = Image.open(ROOT / name).convert('L')
+        photo.thumbnail((256, 256))
+        photos.append(np.asarray(photo))
+    levels = np.arange(256) / 255
+    features = np.empty((n, 256), dtype=np.float32)
+    for i in range(n):
+        photo = photos[i % len(photos)]
+        height, width = photo.shape
+        side = int(rng.integers(min(height, width) // 4, min(height, width)))
+        y, x = rng.integers(0, height - side + 1), rng.integers(0, width - side + 1)
+        # Exposure changes as a lookup table: gamma and gain
+        table = np.clip(255 * levels ** rng.uniform(0.6, 1.6) * rng.uniform(0.7, 1.2), 0, 255).astype(np.uint8)
+        patch = table[photo[y:y + side, x:x + side]]
+        features[i] = extract_face_features(patch, [(0, 0, side, side)])
+    return features
+
+def spearman(a, b):
+    rank_a = np.argsort(np.argsort(a)).astype(np.float64)
+    rank_b = np.argsort(np.argsort(b)).astype(np.float64)
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+def per_query_seconds(search, queries):
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) / len(queries)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--gallery', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--json', type=Path, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    features = histogram_features(args.gallery + args.queries)
+    gallery, queries = features[:args.gallery], features[args.gallery:]
+    ids = [str(i) for i in range(args.gallery)]
+    vectors = dict(zip(ids, gallery))
+
+    exact = VectorIndex(min_train_size=sys.maxsize)
+    exact.load(ids, gallery)
+    quantized = VectorIndex(min_train_size=sys.maxsize, quantized=True)
+    quantized.load(ids, gallery)
+
+    # The float index must agree with calculate_similarity (percentages)
+    rng = np.random.default_rng(1)
+    pairs = rng.integers(0, args.gallery, size=(1000, 2))
+    reference_error = max(
+        abs(calculate_similarity(gallery[a], gallery[b]) - float(np.clip(gallery[a] @ gallery[b] * 100, 0, 100)))
+        for a, b in pairs
+    )
+
+    score_errors, correlations = [], []
+    recall = {'int8': []} | {f'rerank x{factor}': [] for factor in RERANK_FACTORS}
+    for query in queries:
+        float_scores = exact._scores(query)
+        int8_scores = quantized._scores(query)
+        score_errors.append(np.abs(float_scores - int8_scores).max() * 100)
+        correlations.append(spearman(float_scores, int8_scores))
+
+        truth = {item_id for item_id, _ in exact.search(query, K)}
+        recall['int8'].append(len(truth & {item_id for item_id, _ in quantized.search(query, K)}) / K)
+        for factor in RERANK_FACTORS:
+            hits = rerank(query, quantized.search(query, K * factor), vectors, K)
+            recall[f'rerank x{factor}'].append(len(truth & {item_id for item_id, _ in hits}) / K)
+
+    float_seconds = per_query_seconds(lambda query: exact.search(query, K), queries)
+    int8_seconds = per_query_seconds(
+        lambda query: rerank(query, quantized.search(query, K * 4), vectors, K), queries
+    )
+    report = {
+        'gallery': args.gallery,
+        'queries': args.queries,
+        'float_vs_calculate_similarity_max_error_pp': reference_error,
+        'score_max_error_pp': float(np.max(score_errors)),
+        'score_mean_max_error_pp': float(np.mean(score_errors)),
+        'spearman_mean': float(np.mean(correlations)),
+        'spearman_min': float(np.min(correlations)),
+        f'recall_at_{K}': {name: float(np.mean(values)) for name, values in recall.items()},
+        'bytes_per_face': {'float32': gallery.shape[1] * 4, 'int8': gallery.shape[1] + 4},
+        'search_ms': {'float32': float_seconds * 1000, 'int8 + rerank x4': int8_seconds * 1000},
+    }
+
+    print(f"gallery={args.gallery} queries={args.queries} (histogram features of augmented test photos)")
+    print(f"float32 index vs calculate_similarity: max error {reference_error:.2e} pp")
+    print(f"int8 score error: max {report['score_max_error_pp']:.3f} pp, "
+          f"mean per-query max {report['score_mean_max_error_pp']:.3f} pp")
+    print(f"Spearman rank correlation over the gallery: mean {report['spearman_mean']:.5f}, "
+          f"min {report['spearman_min']:.5f}")
+    for name, value in report[f'recall_at_{K}'].items():
+        print(f"recall@{K} {name:<12}{value:.4f}")
+    print(f"bytes per face: float32 {report['bytes_per_face']['float32']}, int8 {report['bytes_per_face']['int8']}")
+    print(f"search: float32 {float_seconds * 1000:.2f} ms, int8 + rerank x4 {int8_seconds * 1000:.2f} ms per query")
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
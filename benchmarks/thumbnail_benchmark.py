@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Thumbnail generation: legacy path vs reduce + LANCZOS, JPEG vs WebP.
+
+The legacy path is the pre-optimization image_to_base64 pipeline: a full
+resolution decode into a numpy array, Image.fromarray and Image.thumbnail.
+The current path makes the thumbnail from the image decoded at
+DECODE_MAX_SIDE, shrinking it with Image.reduce before the final LANCZOS
+pass. Inputs are JPEGs of the bundled test photos resized to several sizes.
+
+Usage: python benchmarks/thumbnail_benchmark.py [--repeat 10] [--json out.json]
+"""
+import argparse
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from face_processing import DECODE_MAX_SIDE, make_thumbnail, open_image  # noqa: E402
+
+SIDES = (200, 1024, 2000, 4000)
+
+def legacy_thumbnail(file_content, max_size=(150, 150), quality=80):
+    """The original pipeline: full decode, numpy round trip, Image.thumbnail"""
+    image_array = np.array(Image.open(io.BytesIO(file_content)).convert('RGB'))
+    image = Image.fromarray(image_array)
+    image.thumbnail(max_size, Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+def current_thumbnail(file_content, format):
+    image, _ = open_image(file_content, max_side=DECODE_MAX_SIDE)
+    return make_thumbnail(image, format=format)
+
+CONFIGS = [
+    ('legacy (jpeg)', legacy_thumbnail),
+    ('reduce + lanczos (jpeg)', lambda data: current_thumbnail(data, 'jpeg')),
+    ('reduce + lanczos (webp)', lambda data: current_thumbnail(data, 'webp')),
+]
+
+def test_inputs():
+    """Encode each bundled photo as a JPEG at every size in SIDES"""
+    inputs = []
+    for name in ('test_face1.jpg', 'test_face2.jpg'):
+        photo = Image.open(ROOT / name).convert('RGB')
+        for side in SIDES:
+            size = (side, int(side * photo.height / photo.width))
+            buffer = io.BytesIO()
+            photo.resize(size, Image.Resampling.LANCZOS).save(buffer, format='JPEG', quality=90)
+            inputs.append((side, buffer.getvalue()))
+    return inputs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', type=Path, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    inputs = test_inputs()
+
+    report = []
+    print(f"{'config':<26}{'side':>6}{'mean ms':>10}{'p50 ms':>10}{'bytes':>8}")
+    for name, thumbnail in CONFIGS:
+        for side in SIDES:
+            latencies, sizes = [], []
+            for input_side, data in inputs:
+                if input_side != side:
+                    continue
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    encoded = thumbnail(data)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                sizes.append(len(encoded))
+            row = {
+                'config': name,
+                'side': side,
+                'mean_ms': float(np.mean(latencies)),
+                'p50_ms': float(np.median(latencies)),
+                'mean_bytes': float(np.mean(sizes)),
+            }
+            report.append(row)
+            print(f"{name:<26}{side:>6}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}"
+                  f"{row['mean_bytes']:>8.0f}")
+
+    print(f"\nDECODE_MAX_SIDE={DECODE_MAX_SIDE}, {args.repeat} runs per image, "
+          f"times include decoding the upload")
+    if args.json:
+        args.json.write_text(json.dumps({'decode_max_side': DECODE_MAX_SIDE, 'results': report}, indent=2))
+
+if __name__ == '__main__':
+    main()
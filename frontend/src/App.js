@@ -1,6 +1,5 @@
 import React, { useState, useRef, useEffect } from 'react';
 import "./App.css";
-import axios from "axios";
 import { Button } from "./components/ui/button";
 import { Card, CardContent, CardHeader, CardTitle } from "./components/ui/card";
 import { Progress } from "./components/ui/progress";
@@ -11,6 +10,29 @@ import { Upload, Camera, RotateCcw, CheckCircle, AlertCircle, Loader2 } from "lu
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Thumbnails are served by the backend (image_url); image_data is only set
+// when inline thumbnails were requested
+const thumbnailSrc = (imageUrl, imageData) => (imageUrl ? `${BACKEND_URL}${imageUrl}` : imageData);
+
+// Up to MAX_REQUEST_IMAGES go in a single streamed request; larger sets are
+// sent to a comparison session in chunks and ranked once all have arrived
+const MAX_REQUEST_IMAGES = 250;
+const MAX_SESSION_IMAGES = 10000;
+const SESSION_CHUNK_SIZE = 100;
+const SESSION_TOP_K = 500;
+
+// Only the first few selected images get a preview thumbnail
+const MAX_PREVIEWS = 12;
+
+const postForm = async (url, formData) => {
+  const response = await fetch(url, { method: 'POST', body: formData });
+  const data = await response.json().catch(() => ({}));
+  if (!response.ok) {
+    throw new Error(data.detail || 'Erro ao processar as imagens. Tente novamente.');
+  }
+  return data;
+};
+
 function App() {
   const [baseImage, setBaseImage] = useState(null);
   const [baseImagePreview, setBaseImagePreview] = useState(null);
@@ -19,7 +41,6 @@ function App() {
   const [results, setResults] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
-  const [uploadProgress, setUploadProgress] = useState(0);
   const [isAuthenticated, setIsAuthenticated] = useState(false);
   const [loginPassword, setLoginPassword] = useState('');
   const [loginError, setLoginError] = useState('');
@@ -42,6 +63,11 @@ function App() {
     }
   };
 
+  // Previews are object URLs of the selected files; release them when replaced or on unmount
+  useEffect(() => () => {
+    comparisonPreviews.forEach((preview) => URL.revokeObjectURL(preview.url));
+  }, [comparisonPreviews]);
+
   // Check if user was previously authenticated
   useEffect(() => {
     const token = localStorage.getItem('auth_token');
@@ -171,14 +197,13 @@ function App() {
     const files = Array.from(event.target.files);
     
     // Validate file count
-    if (files.length > 250) {
-      setError('Máximo de 250 imagens permitido.');
+    if (files.length > MAX_SESSION_IMAGES) {
+      setError(`Máximo de ${MAX_SESSION_IMAGES} imagens permitido.`);
       return;
     }
     
     // Validate file types and sizes
     const validFiles = [];
-    const previews = [];
     
     for (const file of files) {
       if (!file.type.startsWith('image/')) {
@@ -192,27 +217,59 @@ function App() {
       }
       
       validFiles.push(file);
-      
-      // Create preview
-      const reader = new FileReader();
-      reader.onload = (e) => {
-        previews.push({
-          id: file.name,
-          url: e.target.result,
-          name: file.name
-        });
-        
-        if (previews.length === validFiles.length) {
-          setComparisonPreviews(previews);
-        }
-      };
-      reader.readAsDataURL(file);
     }
     
+    // The File objects are kept for the upload; only the displayed previews
+    // are read, through object URLs rather than base64 copies
+    setComparisonPreviews(validFiles.slice(0, MAX_PREVIEWS).map((file) => ({
+      id: file.name,
+      url: URL.createObjectURL(file),
+      name: file.name
+    })));
     setComparisonImages(validFiles);
     setError(null);
   };
 
+  const compareInSession = async () => {
+    const startTime = performance.now();
+    const baseForm = new FormData();
+    baseForm.append('base_image', baseImage);
+    const session = await postForm(`${API}/sessions`, baseForm);
+    setResults({
+      base_image_has_face: session.base_image_has_face,
+      base_image_data: session.base_image_data,
+      base_image_url: session.base_image_url,
+      total_images: comparisonImages.length,
+      processed: 0,
+      results: [],
+      processing_time: null,
+    });
+
+    for (let start = 0; start < comparisonImages.length; start += SESSION_CHUNK_SIZE) {
+      const chunkForm = new FormData();
+      comparisonImages.slice(start, start + SESSION_CHUNK_SIZE).forEach((file) => {
+        chunkForm.append('comparison_images', file);
+      });
+      // A fixed start_index makes a retried chunk replace its own slots
+      chunkForm.append('start_index', start);
+      const chunk = await postForm(`${API}/sessions/${session.session_id}/images`, chunkForm)
+        .catch(() => postForm(`${API}/sessions/${session.session_id}/images`, chunkForm));
+      setResults((prev) => ({ ...prev, processed: start + chunk.received }));
+    }
+
+    const response = await fetch(`${API}/sessions/${session.session_id}/results?top_k=${SESSION_TOP_K}`);
+    const ranking = await response.json().catch(() => ({}));
+    if (!response.ok) {
+      throw new Error(ranking.detail || 'Erro ao processar as imagens. Tente novamente.');
+    }
+    setResults((prev) => ({
+      ...prev,
+      results: ranking.results,
+      matched_images: ranking.matched_images,
+      processing_time: (performance.now() - startTime) / 1000,
+    }));
+  };
+
   const handleSubmit = async () => {
     if (!baseImage) {
       setError('Por favor, selecione uma imagem base.');
@@ -227,9 +284,13 @@ function App() {
     setLoading(true);
     setError(null);
     setResults(null);
-    setUploadProgress(0);
 
     try {
+      if (comparisonImages.length > MAX_REQUEST_IMAGES) {
+        await compareInSession();
+        return;
+      }
+
       const formData = new FormData();
       formData.append('base_image', baseImage);
       
@@ -237,26 +298,67 @@ function App() {
         formData.append('comparison_images', file);
       });
 
-      const response = await axios.post(`${API}/compare-faces`, formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
-        onUploadProgress: (progressEvent) => {
-          const percentCompleted = Math.round(
-            (progressEvent.loaded * 100) / progressEvent.total
-          );
-          setUploadProgress(percentCompleted);
-        },
+      // The stream endpoint answers with one JSON record per line (NDJSON),
+      // so result cards can be rendered as soon as each image is processed
+      const response = await fetch(`${API}/compare-faces/stream`, {
+        method: 'POST',
+        body: formData,
       });
 
-      setResults(response.data);
+      if (!response.ok) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.detail || 'Erro ao processar as imagens. Tente novamente.');
+      }
+
+      const handleRecord = (record) => {
+        if (record.type === 'base') {
+          setResults({
+            base_image_has_face: record.base_image_has_face,
+            base_image_data: record.base_image_data,
+            base_image_url: record.base_image_url,
+            total_images: record.total_images,
+            results: [],
+            processing_time: null,
+          });
+        } else if (record.type === 'result') {
+          setResults((prev) => ({ ...prev, results: [...prev.results, record] }));
+        } else if (record.type === 'summary') {
+          // Apply the final ordering (highest similarity first)
+          setResults((prev) => {
+            const byIndex = new Map(prev.results.map((r) => [r.image_index, r]));
+            return {
+              ...prev,
+              results: record.ordering.map((i) => byIndex.get(i)),
+              processing_time: record.processing_time,
+            };
+          });
+        } else if (record.type === 'error') {
+          throw new Error(record.detail);
+        }
+      };
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter((line) => line.trim()).forEach((line) => handleRecord(JSON.parse(line)));
+      }
+
+      if (buffer.trim()) {
+        handleRecord(JSON.parse(buffer));
+      }
       
     } catch (err) {
-      const errorMessage = err.response?.data?.detail || 'Erro ao processar as imagens. Tente novamente.';
-      setError(errorMessage);
+      setError(err.message || 'Erro ao processar as imagens. Tente novamente.');
     } finally {
       setLoading(false);
-      setUploadProgress(0);
     }
   };
 
@@ -267,7 +369,6 @@ function App() {
     setComparisonPreviews([]);
     setResults(null);
     setError(null);
-    setUploadProgress(0);
     
     if (baseImageRef.current) baseImageRef.current.value = '';
     if (comparisonImagesRef.current) comparisonImagesRef.current.value = '';
@@ -373,7 +474,7 @@ function App() {
                 Imagens para Comparação
               </CardTitle>
               <p className="text-sm text-gray-400">
-                Selecione até 250 imagens para comparar com a imagem base
+                Selecione até {MAX_SESSION_IMAGES} imagens para comparar com a imagem base
               </p>
             </CardHeader>
             <CardContent>
@@ -398,7 +499,7 @@ function App() {
                         <p className="text-sm text-gray-400">
                           {comparisonImages.length > 0 
                             ? `${comparisonImages.length} imagem(ns) selecionada(s)`
-                            : 'PNG, JPG até 10MB cada (máx. 250 imagens)'
+                            : `PNG, JPG até 10MB cada (máx. ${MAX_SESSION_IMAGES} imagens)`
                           }
                         </p>
                       </div>
@@ -408,7 +509,7 @@ function App() {
                 
                 {comparisonPreviews.length > 0 && (
                   <div className="grid grid-cols-4 gap-2 max-h-40 overflow-y-auto">
-                    {comparisonPreviews.slice(0, 12).map((preview, index) => (
+                    {comparisonPreviews.map((preview, index) => (
                       <div key={index} className="relative">
                         <img
                           src={preview.url}
@@ -417,10 +518,10 @@ function App() {
                         />
                       </div>
                     ))}
-                    {comparisonPreviews.length > 12 && (
+                    {comparisonImages.length > comparisonPreviews.length && (
                       <div className="w-full h-16 bg-gray-100 rounded-md flex items-center justify-center">
                         <span className="text-xs text-gray-500">
-                          +{comparisonPreviews.length - 12}
+                          +{comparisonImages.length - comparisonPreviews.length}
                         </span>
                       </div>
                     )}
@@ -461,16 +562,16 @@ function App() {
           </Button>
         </div>
 
-        {/* Upload Progress */}
-        {loading && uploadProgress > 0 && (
+        {/* Processing Progress */}
+        {loading && results && (
           <Card className="mb-8 border-gray-600 bg-gray-800/50">
             <CardContent className="pt-6">
               <div className="space-y-2">
                 <div className="flex justify-between text-sm text-blue-400">
-                  <span>Enviando imagens...</span>
-                  <span>{uploadProgress}%</span>
+                  <span>Processando imagens...</span>
+                  <span>{results.processed ?? results.results.length} / {results.total_images}</span>
                 </div>
-                <Progress value={uploadProgress} className="h-2" />
+                <Progress value={((results.processed ?? results.results.length) * 100) / Math.max(results.total_images, 1)} className="h-2" />
               </div>
             </CardContent>
           </Card>
@@ -490,7 +591,7 @@ function App() {
         {results && (
           <div className="space-y-8">
             {/* Base Image Display */}
-            {results.base_image_data && (
+            {(results.base_image_url || results.base_image_data) && (
               <Card className="border-gray-600 shadow-xl bg-gray-800/80 backdrop-blur-sm">
                 <CardHeader>
                   <CardTitle className="flex items-center gap-2 text-blue-400 text-xl">
@@ -501,7 +602,7 @@ function App() {
                 <CardContent>
                   <div className="flex justify-center">
                     <img
-                      src={results.base_image_data}
+                      src={thumbnailSrc(results.base_image_url, results.base_image_data)}
                       alt="Imagem base"
                       className="max-w-xs rounded-lg shadow-lg border-2 border-blue-500"
                     />
@@ -518,22 +619,27 @@ function App() {
                   Resultados da Comparação
                 </CardTitle>
                 <div className="flex flex-wrap gap-4 text-sm text-gray-400">
-                  <span>• {results.total_images} imagens processadas</span>
-                  <span>• Tempo de processamento: {results.processing_time.toFixed(2)}s</span>
+                  <span>• {results.processed ?? results.results.length} de {results.total_images} imagens processadas</span>
+                  {results.processed !== undefined && !loading && (
+                    <span>• Exibindo as {results.results.length} mais similares</span>
+                  )}
+                  {results.processing_time !== null && (
+                    <span>• Tempo de processamento: {results.processing_time.toFixed(2)}s</span>
+                  )}
                   <span>• {results.results.filter(r => r.has_face).length} rostos detectados</span>
                 </div>
               </CardHeader>
               <CardContent>
                 <div className="grid gap-6 md:grid-cols-2 lg:grid-cols-3">
-                  {results.results.map((result, index) => (
-                    <Card key={index} className={`border-2 ${result.has_face ? 'border-green-500/50' : 'border-red-500/50'} shadow-md hover:shadow-lg transition-all duration-200 hover:-translate-y-1 bg-white/95 backdrop-blur-sm`}>
+                  {results.results.map((result) => (
+                    <Card key={result.image_index} className={`border-2 ${result.has_face ? 'border-green-500/50' : 'border-red-500/50'} shadow-md hover:shadow-lg transition-all duration-200 hover:-translate-y-1 bg-white/95 backdrop-blur-sm`}>
                       <CardContent className="p-6">
                         <div className="space-y-4">
                           {/* Image Display */}
                           <div className="flex justify-center">
-                            {result.image_data ? (
+                            {result.image_url || result.image_data ? (
                               <img
-                                src={result.image_data}
+                                src={thumbnailSrc(result.image_url, result.image_data)}
                                 alt={`Comparação ${result.image_index + 1}`}
                                 className="w-32 h-32 object-cover rounded-lg shadow-md border-2 border-gray-200"
                               />
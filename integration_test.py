@@ -158,7 +158,7 @@ class FaceComparisonIntegrationTester:
                 ('comparison_images', ('comp2.jpg', comp_image2, 'image/jpeg'))
             ]
             
-            response = requests.post(f"{self.api_url}/compare-faces", files=files)
+            response = requests.post(f"{self.api_url}/compare-faces", files=files, data={"inline_thumbnails": "true"})
             
             if response.status_code == 200:
                 data = response.json()
@@ -287,7 +287,7 @@ class FaceComparisonIntegrationTester:
                 ('comparison_images', ('comp1.jpg', comp_image, 'image/jpeg'))
             ]
             
-            response = requests.post(f"{self.api_url}/compare-faces", files=files)
+            response = requests.post(f"{self.api_url}/compare-faces", files=files, data={"inline_thumbnails": "true"})
             
             if response.status_code == 200:
                 data = response.json()
@@ -359,7 +359,7 @@ class FaceComparisonIntegrationTester:
             for i, img in enumerate(comp_images):
                 files.append(('comparison_images', (f'comp{i}.jpg', img, 'image/jpeg')))
             
-            response = requests.post(f"{self.api_url}/compare-faces", files=files)
+            response = requests.post(f"{self.api_url}/compare-faces", files=files, data={"inline_thumbnails": "true"})
             
             if response.status_code == 200:
                 data = response.json()
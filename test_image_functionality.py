@@ -50,7 +50,7 @@ def test_image_base64_functionality():
         ]
         
         # Make the API request
-        response = requests.post(f"{api_url}/compare-faces", files=files)
+        response = requests.post(f"{api_url}/compare-faces", files=files, data={"inline_thumbnails": "true"})
         
         print(f"   Status Code: {response.status_code}")
         
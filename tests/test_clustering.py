@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from clustering import cluster_features, group_labels, tile_size  # noqa: E402
+
+def dense_components(features, threshold):
+    """Labels from the full similarity matrix: smallest index of each component"""
+    n = len(features)
+    adjacency = (features @ features.T) >= threshold
+    labels = np.full(n, -1)
+    for start in range(n):
+        if labels[start] >= 0:
+            continue
+        labels[start] = start
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for neighbor in np.flatnonzero(adjacency[node]):
+                if labels[neighbor] < 0:
+                    labels[neighbor] = start
+                    stack.append(neighbor)
+    return labels
+
+def clustered_features(seed, n=120, dim=8, centers=6, noise=0.3):
+    rng = np.random.default_rng(seed)
+    means = rng.standard_normal((centers, dim))
+    features = means[rng.integers(0, centers, n)] + noise * rng.standard_normal((n, dim))
+    features = features / np.linalg.norm(features, axis=1, keepdims=True)
+    return features.astype(np.float32)
+
+@pytest.mark.parametrize('threshold', [0.5, 0.8, 0.95])
+@pytest.mark.parametrize('memory_bytes', [21 * 7 ** 2, 21 * 32 ** 2, 1 << 20])
+def test_tiled_clustering_matches_dense_components(threshold, memory_bytes):
+    features = clustered_features(seed=int(threshold * 100))
+    # Small budgets give tiles that do not divide n, so edge tiles are partial
+    assert tile_size(memory_bytes) < len(features) or memory_bytes == 1 << 20
+    labels = cluster_features(features, threshold, memory_bytes=memory_bytes)
+    np.testing.assert_array_equal(labels, dense_components(features, threshold))
+
+def test_chain_across_tiles():
+    # Consecutive vectors are similar, distant ones are not: one component
+    # that only union-find across many tiles can recover
+    angles = np.linspace(0, np.pi, 50)
+    features = np.stack([np.cos(angles), np.sin(angles)], axis=1).astype(np.float32)
+    threshold = float(np.cos(angles[1] - angles[0])) - 1e-4
+    labels = cluster_features(features, threshold, memory_bytes=21 * 3 ** 2)
+    assert labels.tolist() == [0] * 50
+
+def test_group_labels_largest_first():
+    assert group_labels([0, 1, 0, 3, 1, 0]) == [[0, 2, 5], [1, 4], [3]]
+    assert group_labels([]) == []
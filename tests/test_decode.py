@@ -0,0 +1,51 @@
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from face_processing import EXIF_ORIENTATION_TAG, open_image  # noqa: E402
+
+MAX_SIDE = 256
+
+def png(image, exif=None):
+    buffer = io.BytesIO()
+    if exif is None:
+        image.save(buffer, format='PNG')
+    else:
+        image.save(buffer, format='PNG', exif=exif)
+    return buffer.getvalue()
+
+def gradient(width=1024, height=512):
+    return np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+
+@pytest.mark.parametrize('source_mode', ['P', '1', 'I;16'])
+@pytest.mark.parametrize('mode', ['RGB', 'L'])
+def test_reduced_decode_of_non_reducible_modes(source_mode, mode):
+    if source_mode == 'I;16':
+        image = Image.fromarray(gradient().astype(np.uint16) * 257)
+    else:
+        image = Image.fromarray(gradient()).convert(source_mode)
+
+    decoded, original_size = open_image(png(image), max_side=MAX_SIDE, mode=mode)
+
+    assert decoded.mode == mode
+    assert original_size == (1024, 512)
+    assert max(decoded.size) <= 2 * MAX_SIDE
+
+def test_reduced_png_keeps_exif_orientation():
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION_TAG] = 6
+    content = png(Image.fromarray(gradient()).convert('RGB'), exif=exif)
+
+    decoded, original_size = open_image(content, max_side=MAX_SIDE)
+    full, _ = open_image(content)
+
+    # Orientation 6 turns the 1024x512 landscape into a portrait
+    assert original_size == (512, 1024)
+    assert decoded.height > decoded.width
+    assert full.size == (512, 1024)
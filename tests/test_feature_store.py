@@ -0,0 +1,109 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from feature_store import ID_BYTES, FeatureStore  # noqa: E402
+
+DIM = 8
+
+def vectors(seed, n):
+    # Non-negative so the uint8 format can store them
+    return np.random.default_rng(seed).random((n, DIM)).astype(np.float32)
+
+def tolerance(dtype):
+    return {'float32': 0, 'float16': 1e-3, 'uint8': 1 / 255}[dtype]
+
+@pytest.mark.parametrize('dtype', ['float32', 'float16', 'uint8'])
+def test_append_delete_round_trip(tmp_path, dtype):
+    store = FeatureStore(tmp_path, dtype=dtype)
+    assert store.load() is None
+
+    store.rewrite([], [])
+    ids, matrix = store.load()
+    assert ids == [] and len(matrix) == 0
+
+    first = vectors(0, 5)
+    store.append([f"a{i}" for i in range(5)], first)
+    second = vectors(1, 3)
+    store.append(['b0', 'b1', 'b2'], second)
+    store.delete(['a1', 'b2'])
+    assert store.tombstones == 2
+
+    ids, matrix = store.load()
+    expected = {f"a{i}": first[i] for i in range(5)} | {'b0': second[0], 'b1': second[1]}
+    del expected['a1']
+    assert ids == list(expected)
+    np.testing.assert_allclose(matrix, np.stack(list(expected.values())), atol=tolerance(dtype))
+
+    # A rewrite drops the tombstones and keeps the live rows
+    store.rewrite(ids, matrix)
+    assert store.tombstones == 0
+    rewritten_ids, rewritten = store.load()
+    assert rewritten_ids == ids
+    np.testing.assert_allclose(rewritten, matrix, atol=tolerance(dtype))
+
+@pytest.mark.parametrize('dtype', ['float32', 'uint8'])
+def test_torn_append_is_cut_back(tmp_path, dtype):
+    store = FeatureStore(tmp_path, dtype=dtype)
+    store.rewrite(['a', 'b'], vectors(2, 2))
+
+    # An append that died after writing part of a row and no id
+    with open(tmp_path / 'vectors.bin', 'ab') as file:
+        file.write(b'\x01' * 5)
+    ids, _ = store.load()
+    assert ids == ['a', 'b']
+
+    # A complete row whose id never made it does not count either
+    row_bytes = DIM * (4 if dtype == 'float32' else 1)
+    with open(tmp_path / 'vectors.bin', 'ab') as file:
+        file.write(b'\x01' * row_bytes)
+    assert store.load()[0] == ['a', 'b']
+
+    store.append(['c'], vectors(3, 1))
+    ids, matrix = store.load()
+    assert ids == ['a', 'b', 'c']
+    np.testing.assert_allclose(matrix[2], vectors(3, 1)[0], atol=tolerance(dtype))
+    assert os.path.getsize(tmp_path / 'ids.bin') == 3 * ID_BYTES
+    assert os.path.getsize(tmp_path / 'vectors.bin') == 3 * row_bytes
+
+def test_rejects_other_dimension_and_format(tmp_path):
+    store = FeatureStore(tmp_path)
+    store.rewrite(['a'], vectors(4, 1))
+    with pytest.raises(ValueError):
+        store.append(['b'], np.ones((1, DIM + 1), dtype=np.float32))
+    # A store written in another dtype is not usable, so callers rebuild it
+    assert FeatureStore(tmp_path, dtype='float16').load() is None
+
+@pytest.mark.parametrize('dtype', ['float32', 'float16', 'uint8'])
+def test_changes_from_another_process(tmp_path, dtype):
+    # Two instances on one directory stand for two worker processes
+    reader, writer = FeatureStore(tmp_path, dtype=dtype), FeatureStore(tmp_path, dtype=dtype)
+    writer.rewrite(['a', 'b'], vectors(5, 2))
+    # Nothing to report before the reader has loaded the store
+    assert reader.changes()[0] == []
+    assert reader.load()[0] == ['a', 'b']
+
+    ids, matrix, deleted = reader.changes()
+    assert ids == [] and deleted == []
+
+    appended = vectors(6, 2)
+    writer.append(['c', 'd'], appended)
+    writer.delete(['a'])
+    ids, matrix, deleted = reader.changes()
+    assert ids == ['c', 'd'] and deleted == ['a']
+    np.testing.assert_allclose(matrix, appended, atol=tolerance(dtype))
+
+    # Already reported: nothing new
+    ids, matrix, deleted = reader.changes()
+    assert ids == [] and len(matrix) == 0 and deleted == []
+
+    # After a rewrite the reader has to load again
+    writer.rewrite(['b', 'c'], vectors(7, 2))
+    assert reader.changes() is None
+    assert reader.load()[0] == ['b', 'c']
+    assert reader.changes()[0] == []
@@ -0,0 +1,65 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from result_cache import ResultCache, request_fingerprint  # noqa: E402
+
+def test_fingerprint_depends_on_order_and_options():
+    base = request_fingerprint(['a', 'b'], top_k=3, match_faces='largest')
+    assert base == request_fingerprint(['a', 'b'], match_faces='largest', top_k=3)
+    assert base != request_fingerprint(['b', 'a'], top_k=3, match_faces='largest')
+    assert base != request_fingerprint(['a', 'b'], top_k=4, match_faces='largest')
+
+def test_concurrent_duplicates_share_one_computation():
+    cache = ResultCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"value": len(calls)}
+
+    async def run():
+        first = await asyncio.gather(*[cache.get_or_compute('f', compute) for _ in range(5)])
+        return first, await cache.get_or_compute('f', compute)
+
+    concurrent, stored = asyncio.run(run())
+    assert calls == [1]
+    assert concurrent == [{"value": 1}] * 5 and stored == {"value": 1}
+    assert cache.stats()["merged"] == 4 and cache.stats()["memory_hits"] == 1
+
+def test_failures_are_not_stored():
+    cache = ResultCache()
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def succeed():
+        return {"ok": True}
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute('f', fail)
+        return await cache.get_or_compute('f', succeed)
+
+    assert asyncio.run(run()) == {"ok": True}
+
+def test_expiry_and_size_bound():
+    async def run():
+        expired = ResultCache(ttl_seconds=-1)
+        await expired.put('f', {"a": 1})
+        assert await expired.get('f') is None
+
+        # Each entry serializes to 9 bytes; room for two
+        bounded = ResultCache(max_bytes=20)
+        for name in ['x', 'y', 'z']:
+            await bounded.put(name, {"a": 1})
+        assert await bounded.get('x') is None
+        assert await bounded.get('z') == {"a": 1}
+        assert bounded.stats()["size_bytes"] <= 20
+
+    asyncio.run(run())
@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from server import select_results  # noqa: E402
+
+def full_sort(similarities, top_k, min_similarity):
+    """Reference: stable sort of every image by similarity, then filter and cut"""
+    order = sorted(range(len(similarities)), key=lambda i: -similarities[i])
+    kept = [i for i in order if similarities[i] >= min_similarity]
+    return (kept if top_k is None else kept[:top_k]), len(kept)
+
+# top_k >= 1 is enforced by check_selection
+@pytest.mark.parametrize('top_k', [None, 1, 3, 10, 50])
+@pytest.mark.parametrize('min_similarity', [0.0, 40.0, 90.0])
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_full_stable_sort(seed, top_k, min_similarity):
+    rng = np.random.default_rng(seed)
+    # Few distinct scores so ties (including at the top_k cut-off) are common
+    similarities = rng.integers(0, 10, 30).astype(float) * 10
+    assert select_results(similarities.tolist(), top_k, min_similarity) == full_sort(
+        similarities.tolist(), top_k, min_similarity
+    )
+
+def test_empty():
+    assert select_results([], 5, 0.0) == ([], 0)
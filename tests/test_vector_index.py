@@ -0,0 +1,94 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from vector_index import VectorIndex  # noqa: E402
+
+DIM = 16
+
+def normalized(rng, n):
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def brute_force(stored, query, k):
+    ids = list(stored)
+    scores = np.array([stored[item_id] @ query for item_id in ids])
+    order = np.argsort(-scores, kind='stable')[:k]
+    return [(ids[i], float(scores[i])) for i in order]
+
+def check_exact(index, stored, rng, k=5):
+    assert len(index) == len(stored)
+    for query in normalized(rng, 10):
+        found = index.search(query, k=k)
+        expected = brute_force(stored, query, k)
+        assert [item_id for item_id, _ in found] == [item_id for item_id, _ in expected]
+        np.testing.assert_allclose([s for _, s in found], [s for _, s in expected], rtol=1e-5)
+
+def test_exact_search_after_add_remove_and_retrain():
+    rng = np.random.default_rng(0)
+    index = VectorIndex(min_train_size=64)
+    stored = {}
+
+    vectors = normalized(rng, 50)
+    ids = [f"a{i}" for i in range(50)]
+    index.add(ids, vectors)
+    stored.update(zip(ids, vectors))
+    assert not index.is_trained
+    check_exact(index, stored, rng)
+
+    # Crossing min_train_size trains the IVF layer
+    vectors = normalized(rng, 100)
+    ids = [f"b{i}" for i in range(100)]
+    index.add(ids, vectors)
+    stored.update(zip(ids, vectors))
+    assert index.is_trained
+    check_exact(index, stored, rng)
+
+    # Removes swap the last row into the freed slot
+    for item_id in ['a0', 'b99', 'a25', 'b0', 'b50']:
+        assert index.remove(item_id)
+        del stored[item_id]
+    assert not index.remove('a0')
+    check_exact(index, stored, rng)
+
+    # Re-adding an id replaces its vector
+    replacement = normalized(rng, 1)
+    index.add(['a1'], replacement)
+    stored['a1'] = replacement[0]
+    check_exact(index, stored, rng)
+
+    index.train(seed=1)
+    check_exact(index, stored, rng)
+
+    # Approximate search probing every list is exact as well
+    query = normalized(rng, 1)[0]
+    approximate = index.search(query, k=5, approximate=True, nprobe=len(index._centroids))
+    assert [item_id for item_id, _ in approximate] == [item_id for item_id, _ in brute_force(stored, query, 5)]
+
+def test_load_then_add():
+    rng = np.random.default_rng(1)
+    vectors = normalized(rng, 20)
+    ids = [f"id{i}" for i in range(20)]
+    index = VectorIndex()
+    index.load(ids, vectors)
+    stored = dict(zip(ids, vectors))
+
+    extra = normalized(rng, 5)
+    index.add([f"new{i}" for i in range(5)], extra)
+    stored.update(zip([f"new{i}" for i in range(5)], extra))
+    index.remove('id3')
+    del stored['id3']
+    check_exact(index, stored, rng)
+
+@pytest.mark.parametrize('k', [1, 3, 100])
+def test_k_larger_or_smaller_than_index(k):
+    rng = np.random.default_rng(2)
+    vectors = normalized(rng, 10)
+    index = VectorIndex()
+    index.add([str(i) for i in range(10)], vectors)
+    query = normalized(rng, 1)[0]
+    assert len(index.search(query, k=k)) == min(k, 10)